@@ -0,0 +1,81 @@
+"""Times the layout of a large resource section.
+
+Builds a resource tree with COUNT named entries whose payloads add up to
+TOTAL bytes and times `pe_resources_prepack` and `pack` on it. The
+payloads are views into a single shared buffer, so the tree itself
+takes little memory. Directory tables hold at most 65535 entries of
+each kind, so the names are split across several resource types.
+
+    python bench/bench_prepack.py [--count COUNT] [--total TOTAL] [--baseline DIR]
+
+With `--baseline`, the benchmark is also run against the pe_tools package
+in DIR, e.g. a `git worktree` of an older revision, and the timings are
+reported side by side. Each run happens in a separate process.
+"""
+
+import argparse, json, os, subprocess, sys, time
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_NAMES_PER_TYPE = 50000
+_SHARED_BUFFER_SIZE = 16 * 2**20
+
+def _build_tree(count, total):
+    payload_size = total // count
+    buf = memoryview(bytes(_SHARED_BUFFER_SIZE + payload_size))
+
+    tree = {}
+    for idx in range(count):
+        names = tree.setdefault('BENCH{}'.format(idx // _NAMES_PER_TYPE), {})
+        offs = idx * 4099 % _SHARED_BUFFER_SIZE
+        names['ENTRY_{:06d}'.format(idx)] = {0x409: buf[offs:offs + payload_size]}
+    return tree
+
+def _measure(count, total):
+    from pe_tools.rsrc import pe_resources_prepack
+
+    tree = _build_tree(count, total)
+
+    start = time.perf_counter()
+    prepacked = pe_resources_prepack(tree)
+    prepacked_time = time.perf_counter()
+    packed = prepacked.pack(0x1000)
+    packed_time = time.perf_counter()
+
+    return {
+        'prepack': prepacked_time - start,
+        'pack': packed_time - prepacked_time,
+        'size': len(packed),
+        }
+
+def _run(root, count, total):
+    env = dict(os.environ, PYTHONPATH=root)
+    r = subprocess.run([sys.executable, __file__, '--measure', '--count', str(count), '--total', str(total)],
+        env=env, stdout=subprocess.PIPE, check=True)
+    return json.loads(r.stdout)
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--count', type=int, default=100000, help='the number of named entries')
+    ap.add_argument('--total', type=int, default=2**30, help='the total size of the payloads in bytes')
+    ap.add_argument('--baseline', metavar='DIR', help='a directory with the pe_tools package to compare with')
+    ap.add_argument('--measure', action='store_true', help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.measure:
+        json.dump(_measure(args.count, args.total), sys.stdout)
+        return 0
+
+    runs = []
+    if args.baseline:
+        runs.append(('before', os.path.abspath(args.baseline)))
+    runs.append(('after', _ROOT))
+
+    print('{} entries, {} bytes of payloads'.format(args.count, args.total))
+    for label, root in runs:
+        r = _run(root, args.count, args.total)
+        print('{:>6}: prepack {:8.3f} s, pack {:8.3f} s, section size {}'.format(label, r['prepack'], r['pack'], r['size']))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
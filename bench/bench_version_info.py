@@ -0,0 +1,100 @@
+"""Times parsing and packing of version info resources.
+
+Two resources are measured: a typical one with a single translation
+and a dozen strings, parsed and packed REPEAT times, and a large one
+with STRINGS strings in each of four translations. Version info nodes
+have 16-bit lengths, so a resource cannot be larger than 64 KiB.
+
+    python bench/bench_version_info.py [--repeat REPEAT] [--strings STRINGS] [--baseline DIR]
+
+With `--baseline`, the benchmark is also run against the pe_tools package
+in DIR, e.g. a `git worktree` of an older revision, and the timings are
+reported side by side. Each run happens in a separate process.
+"""
+
+import argparse, json, os, subprocess, sys, time
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_TYPICAL_STRINGS = {
+    'Comments': 'Built by the nightly pipeline',
+    'CompanyName': 'Example Corporation',
+    'FileDescription': 'Example Application',
+    'FileVersion': '1.2.3.4',
+    'InternalName': 'example',
+    'LegalCopyright': 'Copyright (C) Example Corporation',
+    'LegalTrademarks': 'Example is a trademark of Example Corporation',
+    'OriginalFilename': 'example.exe',
+    'PrivateBuild': '',
+    'ProductName': 'Example',
+    'ProductVersion': '1.2.3.4',
+    'SpecialBuild': '',
+    }
+
+def _build(translations):
+    from pe_tools.version_info import VersionInfo
+
+    vi = VersionInfo()
+    vi.set_string_file_info(translations)
+    return vi.pack()
+
+def _time(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+def _measure(repeat, strings):
+    from pe_tools.version_info import parse_version_info
+
+    large = {
+        (0x409 + lang, 1200): {'String{:05d}'.format(idx): 'value {}'.format(idx) for idx in range(strings)}
+        for lang in range(4)
+        }
+
+    r = {}
+    for name, translations, count in (('typical', {(0x409, 1200): _TYPICAL_STRINGS}, repeat), ('large', large, max(1, repeat // 100))):
+        blob = bytes(_build(translations))
+        vi = parse_version_info(blob)
+        if bytes(vi.pack()) != blob:
+            raise RuntimeError('the version info does not round-trip')
+
+        r[name] = {
+            'size': len(blob),
+            'parse': _time(lambda: parse_version_info(blob).string_file_info(), count),
+            'pack': _time(lambda: bytes(vi.pack()), count),
+            }
+    return r
+
+def _run(root, repeat, strings):
+    env = dict(os.environ, PYTHONPATH=root)
+    r = subprocess.run([sys.executable, __file__, '--measure', '--repeat', str(repeat), '--strings', str(strings)],
+        env=env, stdout=subprocess.PIPE, check=True)
+    return json.loads(r.stdout)
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--repeat', type=int, default=20000, help='the number of times the typical resource is processed')
+    ap.add_argument('--strings', type=int, default=200, help='the number of strings per translation of the large resource')
+    ap.add_argument('--baseline', metavar='DIR', help='a directory with the pe_tools package to compare with')
+    ap.add_argument('--measure', action='store_true', help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.measure:
+        json.dump(_measure(args.repeat, args.strings), sys.stdout)
+        return 0
+
+    runs = []
+    if args.baseline:
+        runs.append(('before', os.path.abspath(args.baseline)))
+    runs.append(('after', _ROOT))
+
+    results = [(label, _run(root, args.repeat, args.strings)) for label, root in runs]
+    for name in ('typical', 'large'):
+        print('{} ({} bytes):'.format(name, results[0][1][name]['size']))
+        for label, r in results:
+            print('  {:>6}: parse {:10.1f} us, pack {:10.1f} us'.format(label, r[name]['parse'] * 1e6, r[name]['pack'] * 1e6))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
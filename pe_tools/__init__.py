@@ -1,4 +1,51 @@
-from .pdb import parse_pdb
-from .pe_parser import *
-from .rsrc import *
-from .version_info import parse_version_info
+import importlib
+
+# Submodules are imported on first use (PEP 562), so that importing
+# a single submodule, e.g. by the command line tools, stays cheap.
+
+_lazy_attrs = {
+    'parse_pdb': 'pdb',
+    'open_pdb': 'pdb',
+    'parse_version_info': 'version_info',
+    'PeIdent': 'links',
+    'CodeviewLink': 'links',
+    'extract_resources': 'extract',
+    'export_symbol_cache': 'symcache',
+    'open_symbol_cache': 'symcache',
+    'find_symbol_cache': 'symcache',
+    }
+
+# Modules whose public names are all exported, later ones take precedence.
+_star_modules = ('pe_parser', 'rsrc')
+
+def _public_names(module):
+    return [name for name in vars(module) if not name.startswith('_')]
+
+def __getattr__(name):
+    modname = _lazy_attrs.get(name)
+    if modname is not None:
+        r = getattr(importlib.import_module('.' + modname, __name__), name)
+    elif name == '__all__':
+        r = sorted(set(_lazy_attrs).union(*(
+            _public_names(importlib.import_module('.' + modname, __name__)) for modname in _star_modules)))
+    elif name.startswith('__'):
+        raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+    else:
+        for modname in reversed(_star_modules):
+            module = importlib.import_module('.' + modname, __name__)
+            if name in _public_names(module):
+                r = getattr(module, name)
+                break
+        else:
+            try:
+                r = importlib.import_module('.' + name, __name__)
+            except ModuleNotFoundError as e:
+                if e.name != __name__ + '.' + name:
+                    raise
+                raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name)) from None
+
+    globals()[name] = r
+    return r
+
+def __dir__():
+    return sorted(set(globals()) | set(__getattr__('__all__')))
@@ -1,6 +1,14 @@
-from .struct3 import Struct3, u16, u32
+import struct
+from .struct3 import Struct3, u8, u16, u32, i32
 
+S_END = 0x0006
 S_PUB32 = 0x110e
+S_LPROC32 = 0x110f
+S_GPROC32 = 0x1110
+S_LPROC32_ID = 0x1146
+S_GPROC32_ID = 0x1147
+
+PROC32_TYPES = (S_LPROC32, S_GPROC32, S_LPROC32_ID, S_GPROC32_ID)
 
 class CvRecHdr(Struct3):
     reclen: u16
@@ -11,3 +19,199 @@ class PUBSYM32(Struct3):
     off: u32
     seg: u16
     # name: length_prefixed_str
+
+class PROCSYM32(Struct3):
+    pParent: u32
+    pEnd: u32
+    pNext: u32
+    len: u32
+    DbgStart: u32
+    DbgEnd: u32
+    typind: u32
+    off: u32
+    seg: u16
+    flags: u8
+    # name: zero-terminated string
+
+CV_SIGNATURE_C13 = 4
+
+DEBUG_S_LINES = 0xf2
+DEBUG_S_FILECHKSMS = 0xf4
+
+CV_LINES_HAVE_COLUMNS = 0x0001
+CV_LINE_NUMBER_MASK = 0x00ffffff
+
+class CV_DebugSSubsectionHeader(Struct3):
+    type: u32
+    cbLen: u32
+
+class CV_DebugSLinesHeader(Struct3):
+    offCon: u32
+    segCon: u16
+    flags: u16
+    cbCon: u32
+
+class CV_DebugSLinesFileBlockHeader(Struct3):
+    offFile: u32
+    nLines: u32
+    cbBlock: u32
+    # lines: CV_Line_t[nLines]
+    # columns: CV_Column_t[nLines], if CV_LINES_HAVE_COLUMNS
+
+LF_MODIFIER = 0x1001
+LF_POINTER = 0x1002
+LF_PROCEDURE = 0x1008
+LF_MFUNCTION = 0x1009
+LF_ARGLIST = 0x1201
+LF_FIELDLIST = 0x1203
+LF_ARRAY = 0x1503
+LF_CLASS = 0x1504
+LF_STRUCTURE = 0x1505
+LF_UNION = 0x1506
+LF_ENUM = 0x1507
+LF_FUNC_ID = 0x1601
+LF_MFUNC_ID = 0x1602
+LF_BUILDINFO = 0x1603
+LF_SUBSTR_LIST = 0x1604
+LF_STRING_ID = 0x1605
+
+class TPI_HEADER(Struct3):
+    Version: u32
+    HeaderSize: u32
+    TypeIndexBegin: u32
+    TypeIndexEnd: u32
+    TypeRecordBytes: u32
+    HashStreamIndex: u16
+    HashAuxStreamIndex: u16
+    HashKeySize: u32
+    NumHashBuckets: u32
+    HashValueBufferOffset: i32
+    HashValueBufferLength: u32
+    IndexOffsetBufferOffset: i32
+    IndexOffsetBufferLength: u32
+    HashAdjBufferOffset: i32
+    HashAdjBufferLength: u32
+
+class LF_MODIFIER_DATA(Struct3):
+    type: u32
+    attr: u16
+
+class LF_POINTER_DATA(Struct3):
+    utype: u32
+    attr: u32
+
+class LF_PROCEDURE_DATA(Struct3):
+    rvtype: u32
+    calltype: u8
+    funcattr: u8
+    parmcount: u16
+    arglist: u32
+
+class LF_MFUNCTION_DATA(Struct3):
+    rvtype: u32
+    classtype: u32
+    thistype: u32
+    calltype: u8
+    funcattr: u8
+    parmcount: u16
+    arglist: u32
+    thisadjust: i32
+
+class LF_ARGLIST_DATA(Struct3):
+    count: u32
+    # arg: u32[count]
+
+class LF_FUNC_ID_DATA(Struct3):
+    scopeId: u32
+    type: u32
+    # name: zero-terminated string
+
+class LF_MFUNC_ID_DATA(Struct3):
+    parentType: u32
+    type: u32
+    # name: zero-terminated string
+
+class LF_STRING_ID_DATA(Struct3):
+    id: u32
+    # name: zero-terminated string
+
+class LF_ARRAY_DATA(Struct3):
+    elemtype: u32
+    idxtype: u32
+    # size: numeric leaf
+    # name: zero-terminated string
+
+class LF_CLASS_DATA(Struct3):
+    count: u16
+    property: u16
+    field: u32
+    derived: u32
+    vshape: u32
+    # size: numeric leaf
+    # name: zero-terminated string
+
+class LF_UNION_DATA(Struct3):
+    count: u16
+    property: u16
+    field: u32
+    # size: numeric leaf
+    # name: zero-terminated string
+
+class LF_ENUM_DATA(Struct3):
+    count: u16
+    property: u16
+    utype: u32
+    field: u32
+    # name: zero-terminated string
+
+LEAF_STRUCTS = {
+    LF_MODIFIER: LF_MODIFIER_DATA,
+    LF_POINTER: LF_POINTER_DATA,
+    LF_PROCEDURE: LF_PROCEDURE_DATA,
+    LF_MFUNCTION: LF_MFUNCTION_DATA,
+    LF_ARGLIST: LF_ARGLIST_DATA,
+    LF_ARRAY: LF_ARRAY_DATA,
+    LF_CLASS: LF_CLASS_DATA,
+    LF_STRUCTURE: LF_CLASS_DATA,
+    LF_UNION: LF_UNION_DATA,
+    LF_ENUM: LF_ENUM_DATA,
+    LF_FUNC_ID: LF_FUNC_ID_DATA,
+    LF_MFUNC_ID: LF_MFUNC_ID_DATA,
+    LF_STRING_ID: LF_STRING_ID_DATA,
+    }
+
+# Leaves whose fixed part is followed by a zero-terminated name.
+NAMED_LEAVES = (LF_ENUM, LF_FUNC_ID, LF_MFUNC_ID, LF_STRING_ID)
+
+# Leaves whose fixed part is followed by a numeric leaf with the size
+# of the type and then by a zero-terminated name.
+SIZED_LEAVES = (LF_ARRAY, LF_CLASS, LF_STRUCTURE, LF_UNION)
+
+LF_NUMERIC = 0x8000
+
+_NUMERIC_FORMATS = {
+    0x8000: '<b', # LF_CHAR
+    0x8001: '<h', # LF_SHORT
+    0x8002: '<H', # LF_USHORT
+    0x8003: '<i', # LF_LONG
+    0x8004: '<I', # LF_ULONG
+    0x8009: '<q', # LF_QUADWORD
+    0x800a: '<Q', # LF_UQUADWORD
+    }
+
+def read_numeric(buf, offs):
+    """Decode the numeric leaf at `offs`, return its value and the offset past it."""
+
+    if offs + 2 > len(buf):
+        raise RuntimeError('numeric leaf is outside the record')
+    value, = struct.unpack_from('<H', buf, offs)
+    if value < LF_NUMERIC:
+        return value, offs + 2
+
+    fmt = _NUMERIC_FORMATS.get(value)
+    if fmt is None:
+        raise RuntimeError('unsupported numeric leaf {:#x}'.format(value))
+    if offs + 2 + struct.calcsize(fmt) > len(buf):
+        raise RuntimeError('numeric leaf is outside the record')
+    value, = struct.unpack_from(fmt, buf, offs + 2)
+    return value, offs + 2 + struct.calcsize(fmt)
@@ -0,0 +1,121 @@
+import errno, os
+from concurrent.futures import ThreadPoolExecutor
+from .rsrc import KnownResourceTypes
+
+_CHUNK_SIZE = 2**20
+
+def _copy_range(src, offs, size, dst):
+    copy_file_range = getattr(os, 'copy_file_range', None)
+    while size:
+        copied = 0
+        if copy_file_range is not None:
+            try:
+                copied = copy_file_range(src.fileno(), dst.fileno(), min(size, _CHUNK_SIZE), offs)
+            except OSError as e:
+                if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.EPERM):
+                    raise
+
+            if not copied:
+                # Not supported between these files, copy through a buffer.
+                copy_file_range = None
+                continue
+        else:
+            src.seek(offs)
+            chunk = src.read(min(size, _CHUNK_SIZE))
+            if not chunk:
+                raise IOError('reached eof prematurely')
+            copied = dst.write(chunk)
+
+        offs += copied
+        size -= copied
+
+def _extract_one(src_name, offs, size, zero_fill, dst_name):
+    with open(src_name, 'rb') as src, open(dst_name, 'wb', buffering=0) as dst:
+        _copy_range(src, offs, size, dst)
+        if zero_fill:
+            os.ftruncate(dst.fileno(), size + zero_fill)
+
+def _path_component(name):
+    if isinstance(name, int):
+        return '#{}'.format(name)
+
+    # Numeric names are prefixed with '#', escape string names that
+    # start with one by doubling it.
+    if name.startswith('#'):
+        name = '#' + name
+
+    for sep in ('/', '\\', '\0', os.sep, os.altsep):
+        if sep:
+            name = name.replace(sep, '_')
+    if name in ('', '.', '..'):
+        name = '_' + name
+    return name
+
+def _type_component(type):
+    if isinstance(type, int):
+        name = KnownResourceTypes.get_type_name(type)
+        return name if name.startswith('RT_') else _path_component(type)
+    return _path_component(type)
+
+def extract_resources(pe, fname, outdir, max_workers=None, layout=None):
+    """Write every resource entry and the trailer of a PE file to `outdir`.
+
+    `pe` must be the result of parsing the file `fname`. Each entry is
+    written to `outdir/TYPE/NAME/LANG`. TYPE is the name of a known
+    resource type, numeric types and names are prefixed with `#` (the `#`
+    of string types and names starting with one is doubled). The
+    trailer, if present, is written to `outdir/_trailer`. `layout` can be
+    passed to reuse the result of `pe.parse_resources_layout()`.
+
+    Raises RuntimeError before writing any file if two resources would
+    be written to the same path, e.g. because of a string type named
+    like a known one or names that only differ in path separators.
+
+    The contents are copied directly between the files with
+    `os.copy_file_range` where available, with a fixed-size buffer
+    otherwise. Returns the list of written files.
+    """
+
+    jobs = []
+    dirs = []
+    owners = {}
+
+    def claim(path, owner):
+        prev = owners.setdefault(os.path.normcase(path), owner)
+        if prev != owner:
+            raise RuntimeError('{!r} and {!r} would both be extracted to {}'.format(prev, owner, path))
+
+    if layout is None:
+        _, layout = pe.parse_resources_layout()
+    if layout is not None:
+        for (type, name, lang), entry in layout.iter_data_entries():
+            rng = pe.get_vm_file_range(entry.DataRva, entry.DataRva + entry.Size)
+            if rng is None:
+                raise RuntimeError('resource is outside the resource section')
+
+            type_dir = os.path.join(outdir, _type_component(type))
+            claim(type_dir, (type,))
+            dirname = os.path.join(type_dir, _path_component(name))
+            claim(dirname, (type, name))
+            dst_name = os.path.join(dirname, str(lang))
+            claim(dst_name, (type, name, lang))
+
+            dirs.append(dirname)
+            jobs.append(rng + (dst_name,))
+
+    if pe.has_trailer():
+        dst_name = os.path.join(outdir, '_trailer')
+        claim(dst_name, 'trailer')
+        dirs.append(outdir)
+        offs, size = pe.get_trailer_file_range()
+        jobs.append((offs, size, 0, dst_name))
+
+    for dirname in dict.fromkeys(dirs):
+        os.makedirs(dirname, exist_ok=True)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(_extract_one, fname, *job) for job in jobs]
+        for future in futures:
+            future.result()
+
+    return [job[-1] for job in jobs]
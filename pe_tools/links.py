@@ -0,0 +1,45 @@
+import uuid
+from dataclasses import dataclass
+
+@dataclass
+class PeIdent:
+    image_name: str
+    timestamp: int
+    size_of_image: int
+
+    @classmethod
+    def from_pelink(cls, pelink: str):
+        fname, tssize = pelink.split('/')
+        ts = int(tssize[:8], 16)
+        size = int(tssize[8:], 16)
+        return cls(image_name=fname, timestamp=ts, size_of_image=size)
+
+    @property
+    def pelink(self):
+        return f'{self.image_name}/{self.timestamp:08x}{self.size_of_image:x}'
+
+    def __str__(self):
+        return self.pelink
+
+@dataclass
+class CodeviewLink:
+    guid: uuid.UUID
+    age: int
+    filename: str
+
+    @classmethod
+    def from_bxlink(cls, bxlink: str):
+        fname, bxlink = bxlink.split('{', 1)
+        guid, age = bxlink.split('}', 1)
+        return cls(guid=uuid.UUID(guid), age=int(age, 10), filename=fname)
+
+    @property
+    def bxlink(self):
+        return f'{self.filename}{{{self.guid}}}{self.age}'
+
+    @property
+    def short_filename(self):
+        return self.filename.rsplit('\\', 1)[-1]
+
+    def __str__(self):
+        return self.bxlink
@@ -0,0 +1,217 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+import xml.parsers.expat
+from grope import rope
+
+_EMPTY_MANIFEST = (b'\xef\xbb\xbf<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\r\n'
+    b'<assembly xmlns="urn:schemas-microsoft-com:asm.v1" manifestVersion="1.0"></assembly>\r\n')
+
+@dataclass
+class ManifestInfo:
+    identity: Optional[Dict[str, str]] = None
+    requested_execution_level: Optional[str] = None
+    ui_access: Optional[bool] = None
+    dependencies: List[Dict[str, str]] = field(default_factory=list)
+    dpi_aware: Optional[str] = None
+    dpi_awareness: Optional[str] = None
+
+def _local_name(name):
+    return name.rsplit(':', 1)[-1]
+
+def _iter_chunks(blob):
+    if isinstance(blob, rope):
+        return blob.chunks
+    return (blob,)
+
+class _Element:
+    def __init__(self, name, start):
+        self.name = name
+        self.start = start
+        self.end = None
+
+def _parse(blob, handler, encoding=None):
+    # Namespace processing is off, so that elements keep their prefixes
+    # and can be closed by name when the manifest is rewritten.
+    parser = xml.parsers.expat.ParserCreate(encoding)
+    stack = []
+
+    def start_element(name, attrs):
+        elem = _Element(name, parser.CurrentByteIndex)
+        stack.append(elem)
+        handler.start(stack, elem, attrs)
+
+    def end_element(name):
+        elem = stack[-1]
+        elem.end = parser.CurrentByteIndex
+        handler.end(stack, elem)
+        stack.pop()
+
+    def char_data(data):
+        handler.data(stack, data)
+
+    parser.StartElementHandler = start_element
+    parser.EndElementHandler = end_element
+    parser.CharacterDataHandler = char_data
+
+    try:
+        for chunk in _iter_chunks(blob):
+            parser.Parse(bytes(chunk), False)
+        parser.Parse(b'', True)
+    except xml.parsers.expat.ExpatError as e:
+        raise RuntimeError('malformed manifest: {}'.format(e))
+
+class _InfoHandler:
+    def __init__(self):
+        self.info = ManifestInfo()
+        self._text = None
+
+    def start(self, stack, elem, attrs):
+        name = _local_name(elem.name)
+        parent = _local_name(stack[-2].name) if len(stack) > 1 else None
+
+        if name == 'assemblyIdentity':
+            if parent == 'dependentAssembly':
+                self.info.dependencies.append(attrs)
+            elif parent == 'assembly' and self.info.identity is None:
+                self.info.identity = attrs
+        elif name == 'requestedExecutionLevel':
+            self.info.requested_execution_level = attrs.get('level')
+            ui_access = attrs.get('uiAccess')
+            if ui_access is not None:
+                self.info.ui_access = ui_access.strip().lower() == 'true'
+        elif name in ('dpiAware', 'dpiAwareness'):
+            self._text = []
+
+    def end(self, stack, elem):
+        name = _local_name(elem.name)
+        if name == 'dpiAware':
+            self.info.dpi_aware = ''.join(self._text).strip()
+        elif name == 'dpiAwareness':
+            self.info.dpi_awareness = ''.join(self._text).strip()
+        else:
+            return
+        self._text = None
+
+    def data(self, stack, data):
+        if self._text is not None:
+            self._text.append(data)
+
+def parse_manifest_info(blob):
+    """Extract the commonly queried settings from a manifest.
+
+    The manifest is parsed incrementally without building a document.
+    `blob` can be a bytes-like object or a rope.
+    """
+
+    handler = _InfoHandler()
+    _parse(blob, handler)
+    return handler.info
+
+class _InsertionHandler:
+    def __init__(self):
+        self.root = None
+        self.dependency = None
+        self.dependent_assembly = None
+
+    def start(self, stack, elem, attrs):
+        name = _local_name(elem.name)
+        if len(stack) == 1:
+            self.root = elem
+        elif name == 'dependency' and self.dependency is None:
+            self.dependency = elem
+        elif name == 'dependentAssembly' and self.dependent_assembly is None:
+            self.dependent_assembly = elem
+
+    def end(self, stack, elem):
+        pass
+
+    def data(self, stack, data):
+        pass
+
+def _find_tag_end(blob, offs):
+    quote = None
+    window = 256
+    while True:
+        chunk = bytes(blob[offs:offs + window])
+        if not chunk:
+            raise RuntimeError('malformed manifest: unterminated tag')
+        for i, ch in enumerate(chunk):
+            if quote is not None:
+                if ch == quote:
+                    quote = None
+            elif ch in b'"\'':
+                quote = ch
+            elif ch == ord('>'):
+                return offs + i
+        offs += len(chunk)
+
+def _insert_into(blob, elem, content):
+    tag_end = _find_tag_end(blob, elem.start)
+    if bytes(blob[tag_end - 1:tag_end]) == b'/':
+        # <elem/> becomes <elem>content</elem>
+        closing = '</{}>'.format(elem.name).encode('utf-8')
+        return rope(blob[:tag_end - 1], b'>', content, closing, blob[tag_end + 1:])
+    return rope(blob[:elem.end], content, blob[elem.end:])
+
+def _prefix(name):
+    prefix, sep, _ = name.rpartition(':')
+    return prefix + sep
+
+def _format_identity(prefix, attrs):
+    # xml.sax.saxutils is slow to import, it is only needed for editing.
+    from xml.sax.saxutils import quoteattr
+
+    return '<{}assemblyIdentity {}/>'.format(prefix,
+        ' '.join('{}={}'.format(k, quoteattr(v)) for k, v in attrs.items()))
+
+def _utf16_codec(head):
+    # Returns the codec of a UTF-16 manifest, with or without a BOM,
+    # or None for other encodings.
+    if head[:2] == b'\xff\xfe' or head == b'<\0':
+        return 'utf-16-le'
+    if head[:2] == b'\xfe\xff' or head == b'\0<':
+        return 'utf-16-be'
+    return None
+
+def add_manifest_dependencies(blob, deps):
+    """Add assembly dependencies to a manifest.
+
+    Each dependency is a dict of `assemblyIdentity` attributes. The
+    identities are added to the first `dependentAssembly` element,
+    which is created (along with `dependency`) if missing. New elements
+    use the prefix of the element they are added to. If `blob` is None,
+    a new manifest is created.
+
+    The manifest is rewritten by splicing the new elements into the
+    original bytes, the rest of the document is kept intact. UTF-16
+    manifests are transcoded to UTF-8 for the splice and back, so they
+    stay in UTF-16.
+    """
+
+    if blob is None:
+        blob = _EMPTY_MANIFEST
+
+    codec = _utf16_codec(bytes(blob[:2]))
+    encoding = None
+    if codec is not None:
+        blob = bytes(blob).decode(codec).encode('utf-8')
+        encoding = 'UTF-8'
+
+    handler = _InsertionHandler()
+    _parse(blob, handler, encoding)
+
+    if handler.dependent_assembly is not None:
+        target = handler.dependent_assembly
+        content = ''.join(_format_identity(_prefix(target.name), dep) for dep in deps)
+    else:
+        target = handler.dependency if handler.dependency is not None else handler.root
+        prefix = _prefix(target.name)
+        content = '<{0}dependentAssembly>{1}</{0}dependentAssembly>'.format(prefix,
+            ''.join(_format_identity(prefix, dep) for dep in deps))
+        if handler.dependency is None:
+            content = '<{0}dependency>{1}</{0}dependency>'.format(prefix, content)
+
+    r = _insert_into(blob, target, content.encode('utf-8'))
+    if codec is not None:
+        r = bytes(r).decode('utf-8').encode(codec)
+    return r
@@ -3,7 +3,16 @@ from .pe_parser import _IMAGE_SECTION_HEADER
 from . import cvinfo as cv
 from grope import rope, BlobIO
 from .struct3 import Struct3, char, u32, i32, u16
-import struct
+from .strings import read_utf8z, find_bytes
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+import struct, mmap, threading, uuid, weakref
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 pdb_signature = b'Microsoft C/C++ MSF 7.00\r\n\x1aDS\0\0\0'
 
@@ -15,6 +24,12 @@ class PdbFileHeader(Struct3):
     directory_size: u32
     _reserved: u32
 
+class PdbInfoStreamHeader(Struct3):
+    Version: u32
+    Signature: u32
+    Age: u32
+    Guid: char[16]
+
 class DbiStreamHeader(Struct3):
     VersionSignature: u32
     VersionHeader: u32
@@ -37,6 +52,17 @@ class DbiStreamHeader(Struct3):
     Machine: u16
     Padding: u32
 
+class SectionContribEntry(Struct3):
+    Section: u16
+    Padding1: char[2]
+    Offset: i32
+    Size: i32
+    Characteristics: u32
+    ModuleIndex: u16
+    Padding2: char[2]
+    DataCrc: u32
+    RelocCrc: u32
+
 class SectionContribEntry2(Struct3):
     Section: u16
     Padding1: char[2]
@@ -49,6 +75,25 @@ class SectionContribEntry2(Struct3):
     RelocCrc: u32
     ISectCoff: u32
 
+SECTION_CONTRIB_V60 = 0xeffe0000 + 19970605
+SECTION_CONTRIB_V2 = 0xeffe0000 + 20140516
+
+class ModInfoHeader(Struct3):
+    Unused1: u32
+    SectionContr: char[SectionContribEntry.size]
+    Flags: u16
+    ModuleSymStream: u16
+    SymByteSize: u32
+    C11ByteSize: u32
+    C13ByteSize: u32
+    SourceFileCount: u16
+    Padding: char[2]
+    Unused2: u32
+    SourceFileNameIndex: u32
+    PdbFilePathNameIndex: u32
+    # ModuleName: char[]
+    # ObjFileName: char[]
+
 class SectionMapHeader(Struct3):
     Count: u16
     LogCount: u16
@@ -63,36 +108,785 @@ class SectionMapEntry(Struct3):
   Offset: u32
   SectionLength: u32
 
+class PdbModule:
+    """A module (compiland) of a PDB.
+
+    The names are decoded from the module info when first accessed.
+    """
+
+    def __init__(self, dbi, index, offs):
+        self._dbi = dbi
+        self._offs = offs
+        self._names = None
+        self.index = index
+        self.info = ModInfoHeader.unpack_from(dbi, offs)
+
+    def _decode_names(self):
+        if self._names is None:
+            name, offs = read_utf8z(self._dbi, self._offs + ModInfoHeader.size)
+            obj_name, _ = read_utf8z(self._dbi, offs)
+            self._names = name, obj_name
+        return self._names
+
+    @property
+    def name(self):
+        return self._decode_names()[0]
+
+    @property
+    def object_name(self):
+        return self._decode_names()[1]
+
+    @property
+    def stream(self):
+        """The index of the module symbol stream, or None."""
+
+        idx = self.info.ModuleSymStream
+        return None if idx == 0xffff else idx
+
+    def __repr__(self):
+        return 'PdbModule({}, {!r})'.format(self.index, self.name)
+
+class SectionContributions:
+    """The section contributions of a PDB, sorted by RVA.
+
+    `starts`, `sizes` and `modules` are parallel `array` columns, an RVA
+    is attributed by bisecting `starts`.
+    """
+
+    def __init__(self, starts, sizes, modules):
+        self.starts = starts
+        self.sizes = sizes
+        self.modules = modules
+
+    def __len__(self):
+        return len(self.starts)
+
+    def find(self, rva):
+        """Return the index of the contribution containing `rva`, or -1."""
+
+        i = bisect_right(self.starts, rva) - 1
+        if i < 0 or rva >= self.starts[i] + self.sizes[i]:
+            return -1
+        return i
+
+PDB_STRING_TABLE_SIGNATURE = 0xeffeeffe
+
+class PdbNames:
+    """The `/names` string table, strings are looked up by offset."""
+
+    def __init__(self, stream):
+        sig, _version, size = stream.unpack_from('<III')
+        if sig != PDB_STRING_TABLE_SIGNATURE:
+            raise RuntimeError('/names is not a string table')
+        self._stream = stream
+        self._size = size
+        self._strings = {}
+
+    def get(self, offs):
+        r = self._strings.get(offs)
+        if r is None:
+            r, _ = read_utf8z(self._stream, 12 + offs, 12 + self._size)
+            self._strings[offs] = r
+        return r
+
+class SourceLine(NamedTuple):
+    file: str
+    line: int
+
+class LineTable:
+    """The line numbers of a module, sorted by RVA.
+
+    Each line covers the code up to the next line. The ends of line
+    fragments are marked by entries with no file, so that RVAs in the
+    gaps between fragments are not attributed to a line.
+    """
+
+    _NO_FILE = 0xffff_ffff
+
+    def __init__(self, rvas, lines, files, file_name):
+        self.rvas = rvas
+        self.lines = lines
+        self.files = files
+        self._file_name = file_name
+        self._file_names = {}
+
+    def __len__(self):
+        return len(self.rvas)
+
+    def find(self, rva):
+        """Return the SourceLine for `rva`, or None."""
+
+        i = bisect_right(self.rvas, rva) - 1
+        if i < 0 or self.files[i] == self._NO_FILE:
+            return None
+
+        file = self.files[i]
+        name = self._file_names.get(file)
+        if name is None:
+            name = self._file_name(file)
+            self._file_names[file] = name
+        return SourceLine(name, self.lines[i])
+
+class Procedure(NamedTuple):
+    name: str
+    rva: int
+    size: int
+
+class ProcedureTable:
+    """The procedures of a module, sorted by RVA.
+
+    `rvas` and `sizes` are `array` columns; `records` holds the offsets
+    of the procedure records in the module symbol stream, from which
+    names are decoded on access. The stream is fetched from the PdbFile
+    on each access, so that it stays subject to the stream cache.
+    """
+
+    def __init__(self, pdb, stream, rvas, sizes, records):
+        self._pdb = pdb
+        self._stream = stream
+        self.rvas = rvas
+        self.sizes = sizes
+        self.records = records
+
+    def __len__(self):
+        return len(self.rvas)
+
+    def get_name(self, idx):
+        stream = self._pdb.get_stream(self._stream)
+        offs = self.records[idx]
+        reclen, = stream.unpack_from('<H', offs)
+        name, _ = read_utf8z(stream, offs + 4 + cv.PROCSYM32.size, offs + reclen + 2)
+        return name
+
+    def __getitem__(self, idx):
+        return Procedure(self.get_name(idx), self.rvas[idx], self.sizes[idx])
+
+    def find(self, rva):
+        """Return the index of the procedure containing `rva`, or -1."""
+
+        i = bisect_right(self.rvas, rva) - 1
+        if i < 0 or rva >= self.rvas[i] + self.sizes[i]:
+            return -1
+        return i
+
+TPI_VERSION_V80 = 20040203
+_TYPE_WINDOW = 0x10000
+
+class TypeRecord:
+    """A record of a type stream.
+
+    `data` is the fixed part of the leaf for the kinds described in
+    `cvinfo.LEAF_STRUCTS` and None for the others, `raw` holds the
+    bytes following the leaf kind. `size` is the size of the type for
+    the leaves in `cvinfo.SIZED_LEAVES`.
+    """
+
+    def __init__(self, index, kind, raw):
+        self.index = index
+        self.kind = kind
+        self.raw = raw
+        self.data = None
+        self.name = None
+        self.size = None
+
+        leaf = cv.LEAF_STRUCTS.get(kind)
+        if leaf is not None and len(raw) >= leaf.size:
+            self.data = leaf.unpack_from(raw)
+            if kind in cv.SIZED_LEAVES:
+                self.size, offs = cv.read_numeric(raw, leaf.size)
+                self.name, _ = read_utf8z(raw, offs)
+            elif kind in cv.NAMED_LEAVES:
+                self.name, _ = read_utf8z(raw, leaf.size)
+
+    def __repr__(self):
+        return 'TypeRecord({:#x}, kind={:#x}, data={!r})'.format(self.index, self.kind, self.data)
+
+class TypeStream:
+    """A type stream (TPI or IPI) with records decoded on demand.
+
+    The offsets of records are recorded in an array indexed by type
+    index. With a hash stream, its index offset buffer splits the
+    records into blocks and only the blocks of looked up types are
+    walked; without one, the first lookup walks all records. Decoded
+    records are kept in an LRU of `max_records` entries.
+
+    `stream` and `hash_stream` are stream indices of `pdb`; the streams
+    are fetched through its stream cache on each access.
+    """
+
+    def __init__(self, pdb, stream, hash_stream=None, max_records=4096):
+        hdr = cv.TPI_HEADER.unpack_from(pdb.get_stream(stream))
+        if hdr.Version != TPI_VERSION_V80:
+            raise RuntimeError('unsupported type stream version')
+
+        self.header = hdr
+        self._pdb = pdb
+        self._stream = stream
+        self._offsets = array('I', [0]) * (hdr.TypeIndexEnd - hdr.TypeIndexBegin)
+
+        anchor_tis = array('I')
+        anchor_offs = array('I')
+        if hash_stream is not None and hdr.IndexOffsetBufferLength:
+            pairs = pdb.get_stream(hash_stream).unpack_from(f'<{hdr.IndexOffsetBufferLength // 4}I', hdr.IndexOffsetBufferOffset)
+            anchor_tis.extend(pairs[0::2])
+            anchor_offs.extend(pairs[1::2])
+        if not anchor_tis or anchor_tis[0] != hdr.TypeIndexBegin:
+            anchor_tis.insert(0, hdr.TypeIndexBegin)
+            anchor_offs.insert(0, 0)
+        self._anchor_tis = anchor_tis
+        self._anchor_offs = anchor_offs
+        self._loaded = bytearray(len(anchor_tis))
+
+        self._records = OrderedDict()
+        self._max_records = max_records
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def _load_block(self, block):
+        hdr = self.header
+        ti = self._anchor_tis[block]
+        offs = self._anchor_offs[block]
+        if block + 1 < len(self._anchor_tis):
+            end_ti = self._anchor_tis[block + 1]
+            end = self._anchor_offs[block + 1]
+        else:
+            end_ti = hdr.TypeIndexEnd
+            end = hdr.TypeRecordBytes
+
+        # Without a hash stream the block spans all records; only the
+        # record lengths are needed, so read it a window at a time.
+        stream = self._pdb.get_stream(self._stream)
+        base = hdr.HeaderSize
+        data = b''
+        data_offs = offs
+        while ti < end_ti:
+            if offs + 4 > end:
+                raise RuntimeError('type record is outside the stream')
+            if offs + 2 > data_offs + len(data):
+                data_offs = offs
+                data = bytes(stream[base + offs:base + min(end, offs + _TYPE_WINDOW)])
+                if len(data) < 4:
+                    raise RuntimeError('type record is outside the stream')
+            self._offsets[ti - hdr.TypeIndexBegin] = offs
+            reclen, = struct.unpack_from('<H', data, offs - data_offs)
+            offs += reclen + 2
+            ti += 1
+        self._loaded[block] = 1
+
+    def get(self, ti):
+        """Return the TypeRecord with the type index `ti`.
+
+        Returns None for simple (built-in) types, which have no record.
+        """
+
+        hdr = self.header
+        if ti < hdr.TypeIndexBegin:
+            return None
+        if ti >= hdr.TypeIndexEnd:
+            raise RuntimeError('type index out of range')
+
+        r = self._records.get(ti)
+        if r is not None:
+            self._records.move_to_end(ti)
+            self.hits += 1
+            return r
+        self.misses += 1
+
+        block = bisect_right(self._anchor_tis, ti) - 1
+        if not self._loaded[block]:
+            self._load_block(block)
+
+        stream = self._pdb.get_stream(self._stream)
+        offs = hdr.HeaderSize + self._offsets[ti - hdr.TypeIndexBegin]
+        reclen, kind = stream.unpack_from('<HH', offs)
+        r = TypeRecord(ti, kind, bytes(stream[offs + 4:offs + 2 + reclen]))
+
+        self._records[ti] = r
+        if len(self._records) > self._max_records:
+            self._records.popitem(last=False)
+        return r
+
+class SymbolizedRvas(NamedTuple):
+    indices: object
+    displacements: object
+    names: dict
+
+class GsiHashHeader(Struct3):
+    VerSignature: u32
+    VerHdr: u32
+    HrSize: u32
+    NumBuckets: u32
+
+class PublicsStreamHeader(Struct3):
+    SymHash: u32
+    AddrMap: u32
+    NumThunks: u32
+    SizeOfThunk: u32
+    ISectThunkTable: u16
+    Padding: u16
+    OffThunkTable: u32
+    NumSections: u32
+
+GSI_HASH_SIGNATURE = 0xffff_ffff
+GSI_HASH_VERSION = 0xeffe0000 + 19990810
+
+_IPHR_HASH = 4096
+_GSI_BUCKET_BITMAP_WORDS = (_IPHR_HASH + 32) // 32
+
+# Bucket offsets are stored as if hash records were 12 bytes long,
+# which they are in memory on 32-bit hosts.
+_GSI_HASH_RECORD_MEMSIZE = 12
+
 class PublicSymbol(NamedTuple):
     name: str
     segment: int
     offset: int
     rva: int
 
+class PdbStream:
+    """A read-only view of a stream stored in the blocks of a PDB file.
+
+    Runs of consecutive blocks are merged into segments. Reads that fall
+    into a single segment are served as slices of the underlying blob
+    (memoryviews if the blob supports the buffer protocol), only reads
+    that cross segments are copied.
+    """
+
+    def __init__(self, blob, finder, starts, segments, size):
+        self._blob = blob
+        self._finder = finder
+        self._size = size
+        self._starts = starts
+        self._segments = segments
+
+    @classmethod
+    def from_blocks(cls, blob, finder, block_size, blocks, size):
+        starts = []
+        segments = []
+        offs = 0
+        for block in blocks:
+            length = min(block_size, size - offs)
+            if length <= 0:
+                break
+
+            file_offs = block * block_size
+            if segments and segments[-1][0] + segments[-1][1] == file_offs:
+                segments[-1][1] += length
+            else:
+                starts.append(offs)
+                segments.append([file_offs, length])
+            offs += length
+
+        if offs != size:
+            raise RuntimeError('stream is shorter than its declared size')
+
+        return cls(blob, finder, starts, segments, size)
+
+    @classmethod
+    def from_bytes(cls, data):
+        return cls(memoryview(data), data, [0], [[0, len(data)]], len(data))
+
+    def __len__(self):
+        return self._size
+
+    def is_contiguous(self):
+        return len(self._segments) <= 1
+
+    def _read(self, start, stop):
+        if start >= stop:
+            return b''
+
+        i = bisect_right(self._starts, start) - 1
+        parts = []
+        while start < stop:
+            seg_start = self._starts[i]
+            file_offs, length = self._segments[i]
+            seg_stop = min(stop, seg_start + length)
+
+            part = self._blob[file_offs + start - seg_start:file_offs + seg_stop - seg_start]
+            if seg_stop == stop and not parts:
+                return part if isinstance(part, memoryview) else bytes(part)
+
+            parts.append(bytes(part))
+            start = seg_stop
+            i += 1
+        return b''.join(parts)
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            if key < 0:
+                key += self._size
+            if not 0 <= key < self._size:
+                raise IndexError('index out of bounds')
+            return self._read(key, key + 1)[0]
+
+        start, stop, step = key.indices(self._size)
+        if step != 1:
+            raise IndexError('strides are not supported')
+        return self._read(start, stop)
+
+    def __bytes__(self):
+        return bytes(self._read(0, self._size))
+
+    def unpack_from(self, fmt, offset=0):
+        size = struct.calcsize(fmt)
+        if offset < 0 or offset + size > self._size:
+            raise struct.error('unpack_from requires a buffer of at least {} bytes'.format(offset + size))
+        return struct.unpack_from(fmt, self._read(offset, offset + size))
+
+    def find(self, sub, start=0, end=None):
+        if end is None or end > self._size:
+            end = self._size
+
+        if start >= end:
+            return -1
+
+        i = bisect_right(self._starts, start) - 1
+        while i < len(self._segments):
+            seg_start = self._starts[i]
+            if seg_start >= end:
+                break
+
+            file_offs, length = self._segments[i]
+            seg_stop = min(end, seg_start + length)
+
+            if self._finder is not None:
+                pos = self._finder.find(sub, file_offs + start - seg_start, file_offs + seg_stop - seg_start)
+                if pos >= 0:
+                    return pos - file_offs + seg_start
+            else:
+                part = self._blob[file_offs + start - seg_start:file_offs + seg_stop - seg_start]
+                pos = find_bytes(part, sub, 0, len(part))
+                if pos >= 0:
+                    return start + pos
+
+            # look for a match crossing into the next segment
+            if len(sub) > 1 and seg_stop < end:
+                window_start = max(start, seg_stop - len(sub) + 1)
+                pos = bytes(self._read(window_start, min(end, seg_stop + len(sub) - 1))).find(sub)
+                if pos >= 0:
+                    return window_start + pos
+
+            start = seg_stop
+            i += 1
+        return -1
+
+def hash_string_v1(name):
+    """The case-insensitive hash used by GSI hash tables and /names."""
+
+    n = len(name)
+    r = 0
+    for v in struct.unpack_from(f'<{n // 4}I', name):
+        r ^= v
+
+    offs = n & ~3
+    if n - offs >= 2:
+        r ^= name[offs] | (name[offs + 1] << 8)
+        offs += 2
+    if offs < n:
+        r ^= name[offs]
+
+    r |= 0x20202020
+    r ^= r >> 11
+    return (r ^ (r >> 16)) & 0xffff_ffff
+
+class GsiHashTable:
+    """The name hash table of a globals or publics stream.
+
+    Records are chained in 4096 buckets, only the buckets of looked up
+    names are read.
+    """
+
+    def __init__(self, stream, offs=0):
+        hdr = GsiHashHeader.unpack_from(stream, offs)
+        if hdr.VerSignature != GSI_HASH_SIGNATURE or hdr.VerHdr != GSI_HASH_VERSION:
+            raise RuntimeError('unsupported symbol hash table format')
+
+        self._stream = stream
+        self._records_offs = offs + hdr.size
+        self._record_count = hdr.HrSize // 8
+
+        bitmap_offs = self._records_offs + hdr.HrSize
+        bitmap = stream.unpack_from(f'<{_GSI_BUCKET_BITMAP_WORDS}I', bitmap_offs)
+
+        # For each bucket, the index of its chain start among the stored
+        # (non-empty) buckets, or -1.
+        slots = array('i', [-1]) * (_IPHR_HASH + 1)
+        count = 0
+        for bucket in range(_IPHR_HASH + 1):
+            if bitmap[bucket // 32] & (1 << (bucket % 32)):
+                slots[bucket] = count
+                count += 1
+        self._slots = slots
+        self._bucket_count = count
+        self._buckets_offs = bitmap_offs + _GSI_BUCKET_BITMAP_WORDS * 4
+
+    def lookup(self, name):
+        """Yield the symbol record stream offsets of records that may be
+        named `name`."""
+
+        if isinstance(name, str):
+            name = name.encode('utf-8')
+
+        slot = self._slots[hash_string_v1(name) % _IPHR_HASH]
+        if slot < 0:
+            return
+
+        if slot + 1 < self._bucket_count:
+            start, stop = self._stream.unpack_from('<II', self._buckets_offs + slot * 4)
+        else:
+            start, = self._stream.unpack_from('<I', self._buckets_offs + slot * 4)
+            stop = self._record_count * _GSI_HASH_RECORD_MEMSIZE
+
+        for i in range(start // _GSI_HASH_RECORD_MEMSIZE, stop // _GSI_HASH_RECORD_MEMSIZE):
+            offs, _cref = self._stream.unpack_from('<II', self._records_offs + i * 8)
+            yield offs - 1
+
+class _AddressMapRvas:
+    # A lazy sequence of the RVAs of the symbols in the publics address
+    # map, so that it can be bisected without decoding every record.
+
+    def __init__(self, pdb, psi):
+        self._pdb = pdb
+        self._psi = psi
+
+    def __len__(self):
+        return self._psi.addr_count
+
+    def __getitem__(self, idx):
+        _, off, seg = self._pdb._symrecs().unpack_from('<4xIIH', self._psi.get_addr(idx))
+        rva = self._pdb.get_rva(seg, off)
+        return -1 if rva is None else rva
+
+class PublicsStream:
+    """The publics stream (PSI): the publics name hash table and the
+    address map, which lists the public symbols sorted by address."""
+
+    def __init__(self, stream):
+        hdr = PublicsStreamHeader.unpack_from(stream)
+        self._stream = stream
+        self.hash = GsiHashTable(stream, hdr.size)
+        self._addr_offs = hdr.size + hdr.SymHash
+        self.addr_count = hdr.AddrMap // 4
+
+    def get_addr(self, idx):
+        """Return the symbol record stream offset of the `idx`-th symbol
+        in address order."""
+
+        offs, = self._stream.unpack_from('<I', self._addr_offs + idx * 4)
+        return offs
+
+class PublicSymbols:
+    """The public symbols of a PDB, stored in columns.
+
+    `segments`, `offsets` and `rvas` are `array` objects (NumPy can wrap
+    them without copying); `records` holds the offsets of the symbol
+    records in the symbol record stream, from which names are decoded
+    on access. The stream is fetched from the PdbFile on each access,
+    so that it stays subject to the stream cache. Iterating yields
+    PublicSymbol tuples.
+    """
+
+    def __init__(self, pdb, stream, segments, offsets, rvas, records):
+        self._pdb = pdb
+        self._stream = stream
+        self.segments = segments
+        self.offsets = offsets
+        self.rvas = rvas
+        self.records = records
+
+    def __len__(self):
+        return len(self.records)
+
+    def get_name_bytes(self, idx):
+        """Return the undecoded name of the `idx`-th symbol."""
+
+        syms = self._pdb.get_stream(self._stream)
+        offs = self.records[idx]
+        reclen, = syms.unpack_from('<H', offs)
+        start = offs + 4 + cv.PUBSYM32.size
+        zpos = find_bytes(syms, b'\0', start, offs + reclen + 2)
+        if zpos < 0:
+            raise RuntimeError('missing null termination')
+        return bytes(syms[start:zpos])
+
+    def get_name(self, idx):
+        return self.get_name_bytes(idx).decode('utf-8')
+
+    def __getitem__(self, idx):
+        return PublicSymbol(self.get_name(idx), self.segments[idx], self.offsets[idx], self.rvas[idx])
+
+    def __iter__(self):
+        for idx in range(len(self.records)):
+            yield self[idx]
+
+class PublicColumns:
+    """The public symbols that map to a section, sorted by RVA.
+
+    `rvas` holds their RVAs and `order` their indices in PublicSymbols,
+    both as `array('I')`.
+    """
+
+    def __init__(self, rvas, order):
+        self.rvas = rvas
+        self.order = order
+
+class PublicSymbolIndex:
+    """Lookup of public symbols by RVA and by name.
+
+    RVAs are bisected in the sorted PublicColumns, the symbol containing
+    an RVA is taken to be the nearest preceding one. Names are only
+    decoded for the symbols returned; the first lookup by name reads the
+    undecoded names of all symbols into a dict.
+    """
+
+    def __init__(self, symbols, columns):
+        self._symbols = symbols
+        self._columns = columns
+        self._names = None
+
+    def __len__(self):
+        return len(self._symbols)
+
+    def find_by_name(self, name):
+        if self._names is None:
+            names = {}
+            for idx in range(len(self._symbols)):
+                names.setdefault(self._symbols.get_name_bytes(idx), idx)
+            self._names = names
+
+        idx = self._names.get(name.encode('utf-8'))
+        return None if idx is None else self._symbols[idx]
+
+    def find_by_rva(self, rva):
+        """Return `(symbol, displacement)` for the nearest symbol at or
+        before `rva`, or None if there is none."""
+
+        rvas = self._columns.rvas
+        i = bisect_right(rvas, rva) - 1
+        if i < 0:
+            return None
+        return self._symbols[self._columns.order[i]], rva - rvas[i]
+
+class StreamCache:
+    """A byte-capped LRU cache of PDB stream contents.
+
+    The cache is shared by PdbFile objects whose blob cannot be mapped
+    (e.g. a rope over a file), the streams of mapped blobs are read
+    in place and never cached, and so are streams larger than `max_bytes`.
+    Streams smaller than `pin_max_bytes` can be pinned, pinned streams are not evicted until their PdbFile is
+    garbage-collected, but count towards the cache size.
+    """
+
+    def __init__(self, max_bytes=256 * 2**20, pin_max_bytes=2**20):
+        self.max_bytes = max_bytes
+        self.pin_max_bytes = pin_max_bytes
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._pinned = {}
+        self.size = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, load, pin=False):
+        with self._lock:
+            r = self._pinned.get(key)
+            if r is None:
+                r = self._entries.get(key)
+                if r is not None:
+                    self._entries.move_to_end(key)
+            if r is not None:
+                self.hits += 1
+                return r
+            self.misses += 1
+
+        r = load()
+
+        with self._lock:
+            if key in self._pinned or key in self._entries:
+                return r
+
+            if pin and len(r) <= self.pin_max_bytes:
+                self._pinned[key] = r
+            else:
+                self._entries[key] = r
+            self.size += len(r)
+            self._evict()
+        return r
+
+    def _evict(self):
+        while self.size > self.max_bytes and self._entries:
+            _, r = self._entries.popitem(last=False)
+            self.size -= len(r)
+            self.evictions += 1
+
+    def resize(self, max_bytes):
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def discard(self, owner):
+        with self._lock:
+            for entries in (self._entries, self._pinned):
+                for key in [key for key in entries if key[0] is owner]:
+                    self.size -= len(entries.pop(key))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._pinned.clear()
+            self.size = 0
+
+default_stream_cache = StreamCache()
+
 class PdbFile:
-    def __init__(self, blob, block_size, streams):
+    def __init__(self, blob, block_size, streams, finder=None, cache=None):
         self._blob = blob
+        self._finder = finder
         self._block_size = block_size
         self._streams = streams
-        self._stream_bytes = [None]*len(streams)
+        self._stream_views = [None]*len(streams)
+
+        # The contents of streams of unmapped blobs are kept in the cache
+        # under keys owned by this token, they are dropped with the file.
+        self._cache = cache if cache is not None else default_stream_cache
+        self._cache_token = object()
+        weakref.finalize(self, self._cache.discard, self._cache_token)
 
         self._dbihdr = None
         self._sections = None
         self._addr_map = None
+        self._modules = None
+        self._section_contribs = None
+        self._public_symbols = None
+        self._named_streams = None
+        self._names = None
+        self._line_tables = {}
+        self._procedure_tables = {}
+        self._type_streams = {}
+        self._public_index = None
+        self._publics = None
+        self._public_columns = None
 
     def _parse_dbi(self):
         if self._dbihdr is not None:
             return
 
-        dbi = self.get_stream(3)
+        dbi = self.get_stream(3, pin=True)
         hdr = DbiStreamHeader.unpack_from(dbi)
 
         offs = hdr.size + hdr.ModInfoSize + hdr.SectionContributionSize + hdr.SectionMapSize + hdr.SourceInfoSize + hdr.TypeServerMapSize + hdr.ECSubstreamSize
 
         cnt = hdr.OptionalDbgHeaderSize // 2
-        debug_streams = struct.unpack_from(f'<{cnt}h', dbi, offs)
+        debug_streams = dbi.unpack_from(f'<{cnt}h', offs)
 
-        secstream = self.get_stream(debug_streams[5])
+        secstream = self.get_stream(debug_streams[5], pin=True)
         offs = 0
 
         sections = []
@@ -122,53 +916,511 @@ class PdbFile:
         self._parse_dbi()
         return self._dbihdr.Machine
 
-    def get_public_symbols(self):
-        self._parse_dbi()
-        hdr = self._dbihdr
+    def get_modules(self):
+        """Return the list of PdbModule objects described by the DBI stream."""
 
-        syms = self.get_stream(hdr.SymRecordStream)
+        if self._modules is None:
+            self._parse_dbi()
+            dbi = self.get_stream(3, pin=True)
 
-        offs = 0
-        while offs < len(syms):
-            reclen, rectp = struct.unpack_from('<HH', syms, offs)
-            eoffs = offs + reclen + 2
-
-            if rectp == cv.S_PUB32:
-                symhdr = cv.PUBSYM32.unpack_from(syms, offs + 4)
-                syms: bytes
-                npos = offs + 4 + cv.PUBSYM32.size
-                zpos = syms.find(0, npos, eoffs)
-                if zpos < 0:
+            modules = []
+            offs = self._dbihdr.size
+            end = offs + self._dbihdr.ModInfoSize
+            while offs < end:
+                modules.append(PdbModule(dbi, len(modules), offs))
+
+                # Skip the module and object names without decoding them.
+                name_end = dbi.find(b'\0', offs + ModInfoHeader.size, end)
+                name_end = dbi.find(b'\0', name_end + 1, end) if name_end >= 0 else -1
+                if name_end < 0:
                     raise RuntimeError('missing null termination')
-                name = syms[npos:zpos].decode('utf-8')
-                if symhdr.seg != 0:
-                    rva = self._addr_map[symhdr.seg - 1] + symhdr.off
+                offs = (name_end + 1 + 3) & ~3
+
+            self._modules = modules
+        return self._modules
+
+    def get_section_contributions(self):
+        """Return the SectionContributions of the PDB.
+
+        Contributions to unmapped sections are left out.
+        """
+
+        if self._section_contribs is None:
+            self._parse_dbi()
+            hdr = self._dbihdr
+            dbi = self.get_stream(3, pin=True)
+
+            offs = hdr.size + hdr.ModInfoSize
+            size = hdr.SectionContributionSize
+            if size:
+                version, = dbi.unpack_from('<I', offs)
+                if version == SECTION_CONTRIB_V60:
+                    entry_fmt = '<HxxiiIHxxII'
+                elif version == SECTION_CONTRIB_V2:
+                    entry_fmt = '<HxxiiIHxxIII'
                 else:
-                    rva = 0
+                    raise RuntimeError('unsupported section contribution version')
 
-                yield PublicSymbol(name, symhdr.seg, symhdr.off, rva)
+                entry_size = struct.calcsize(entry_fmt)
+                data = bytes(dbi[offs + 4:offs + 4 + (size - 4) // entry_size * entry_size])
+                entries = []
+                for sec, off, sz, _, mod, *_ in struct.iter_unpack(entry_fmt, data):
+                    rva = self.get_rva(sec, off)
+                    if rva is not None and sz > 0:
+                        entries.append((rva, sz, mod))
+                entries.sort()
+            else:
+                entries = []
 
-            offs = eoffs
+            self._section_contribs = SectionContributions(
+                array('I', (e[0] for e in entries)),
+                array('I', (e[1] for e in entries)),
+                array('H', (e[2] for e in entries)))
+        return self._section_contribs
 
-    def get_rva(self, seg, offs):
-        pass
+    def rva_to_module(self, rva):
+        """Return the PdbModule that contributed the code or data at `rva`,
+        or None."""
+
+        contribs = self.get_section_contributions()
+        i = contribs.find(rva)
+        if i < 0:
+            return None
+        return self.get_modules()[contribs.modules[i]]
+
+    def get_module_sizes(self):
+        """Return the number of bytes contributed by each module.
+
+        The result is indexed by module index. It is a NumPy array if
+        NumPy is available, an `array` otherwise.
+        """
+
+        contribs = self.get_section_contributions()
+        count = len(self.get_modules())
+
+        if numpy is not None:
+            return numpy.bincount(
+                numpy.frombuffer(contribs.modules, dtype=numpy.uint16),
+                weights=numpy.frombuffer(contribs.sizes, dtype=numpy.uint32),
+                minlength=count).astype(numpy.uint64)
+
+        sizes = array('Q', [0]) * count
+        for mod, size in zip(contribs.modules, contribs.sizes):
+            sizes[mod] += size
+        return sizes
+
+    def get_line_table(self, module):
+        """Return the LineTable of a PdbModule.
+
+        The C13 line information in the module symbol stream is parsed on
+        the first call for each module, file names are decoded only for
+        the lines that are looked up.
+        """
+
+        r = self._line_tables.get(module.index)
+        if r is not None:
+            return r
+
+        entries = []
+        checksums = None
+        if module.stream is not None:
+            stream = self.get_stream(module.stream)
+            offs = module.info.SymByteSize + module.info.C11ByteSize
+            end = offs + module.info.C13ByteSize
+            while offs + cv.CV_DebugSSubsectionHeader.size <= end:
+                sub = cv.CV_DebugSSubsectionHeader.unpack_from(stream, offs)
+                data = offs + sub.size
+                if sub.type == cv.DEBUG_S_FILECHKSMS:
+                    checksums = data
+                elif sub.type == cv.DEBUG_S_LINES:
+                    self._read_lines(stream, data, data + sub.cbLen, entries)
+                offs = data + ((sub.cbLen + 3) & ~3)
+
+        # Fragment ends sort before lines starting at the same RVA.
+        entries.sort(key=lambda e: (e[0], e[2] != LineTable._NO_FILE))
+
+        # The module stream is fetched again rather than kept alive by
+        # the table, so that it stays subject to the stream cache.
+        def file_name(file):
+            if checksums is None:
+                raise RuntimeError('module has no file checksums')
+            names_offs, = self.get_stream(module.stream).unpack_from('<I', checksums + file)
+            names = self.get_names()
+            if names is None:
+                raise RuntimeError('PDB has no /names stream')
+            return names.get(names_offs)
+
+        r = LineTable(
+            array('I', (e[0] for e in entries)),
+            array('I', (e[1] for e in entries)),
+            array('I', (e[2] for e in entries)),
+            file_name)
+        self._line_tables[module.index] = r
+        return r
+
+    def _read_lines(self, stream, offs, end, entries):
+        hdr = cv.CV_DebugSLinesHeader.unpack_from(stream, offs)
+        base = self.get_rva(hdr.segCon, hdr.offCon)
+        if base is None:
+            return
+
+        offs += hdr.size
+        while offs < end:
+            block = cv.CV_DebugSLinesFileBlockHeader.unpack_from(stream, offs)
+            lines = stream.unpack_from(f'<{2 * block.nLines}I', offs + block.size)
+            for i in range(0, len(lines), 2):
+                entries.append((base + lines[i], lines[i + 1] & cv.CV_LINE_NUMBER_MASK, block.offFile))
+            if block.cbBlock < block.size:
+                raise RuntimeError('corrupted line block')
+            offs += block.cbBlock
+
+        entries.append((base + hdr.cbCon, 0, LineTable._NO_FILE))
+
+    def get_procedure_table(self, module):
+        """Return the ProcedureTable of a PdbModule.
+
+        The module symbol stream is scanned on the first call for each
+        module. Procedure bodies are skipped, nested records are not read.
+        """
+
+        r = self._procedure_tables.get(module.index)
+        if r is not None:
+            return r
+
+        entries = []
+        if module.stream is not None:
+            stream = self.get_stream(module.stream)
+
+            # The records follow the CV_SIGNATURE_C13 signature.
+            offs = 4
+            end = module.info.SymByteSize
+            while offs < end:
+                reclen, rectp = stream.unpack_from('<HH', offs)
+                next_offs = offs + reclen + 2
+                if rectp in cv.PROC32_TYPES:
+                    proc = cv.PROCSYM32.unpack_from(stream, offs + 4)
+                    rva = self.get_rva(proc.seg, proc.off)
+                    if rva is not None:
+                        entries.append((rva, proc.len, offs))
+                    if proc.pEnd > offs:
+                        next_offs = proc.pEnd
+                offs = next_offs
+
+        entries.sort()
+        r = ProcedureTable(self, module.stream,
+            array('I', (e[0] for e in entries)),
+            array('I', (e[1] for e in entries)),
+            array('I', (e[2] for e in entries)))
+        self._procedure_tables[module.index] = r
+        return r
+
+    def find_procedure(self, rva):
+        """Return the Procedure containing `rva`, or None.
+
+        Unlike public symbols, procedures have sizes, so addresses in
+        padding between functions are not attributed to any.
+        """
+
+        module = self.rva_to_module(rva)
+        if module is None:
+            return None
+
+        table = self.get_procedure_table(module)
+        i = table.find(rva)
+        if i < 0:
+            return None
+        return table[i]
 
-    def get_stream(self, idx):
-        r = self._stream_bytes[idx]
+    def find_line(self, rva):
+        """Return the SourceLine for `rva`, or None.
+
+        Only the line information of the module containing `rva` is read.
+        """
+
+        module = self.rva_to_module(rva)
+        if module is None:
+            return None
+        return self.get_line_table(module).find(rva)
+
+    def get_named_streams(self):
+        """Return a dict mapping stream names (e.g. `/names`) to indexes."""
+
+        if self._named_streams is None:
+            info = self.get_stream(1)
+            named_streams = {}
+
+            offs = PdbInfoStreamHeader.size
+            if offs + 4 <= len(info):
+                buf_size, = info.unpack_from('<I', offs)
+                buf_offs = offs + 4
+                offs = buf_offs + buf_size
+
+                _count, capacity, present_words = info.unpack_from('<III', offs)
+                present = info.unpack_from(f'<{present_words}I', offs + 12)
+                offs += 12 + 4 * present_words
+                deleted_words, = info.unpack_from('<I', offs)
+                offs += 4 + 4 * deleted_words
+
+                for bucket in range(min(capacity, 32 * present_words)):
+                    if present[bucket // 32] & (1 << (bucket % 32)):
+                        key, value = info.unpack_from('<II', offs)
+                        offs += 8
+                        name, _ = read_utf8z(info, buf_offs + key, buf_offs + buf_size)
+                        named_streams[name] = value
+
+            self._named_streams = named_streams
+        return self._named_streams
+
+    def get_names(self):
+        """Return the `/names` PdbNames, or None if the PDB has none."""
+
+        if self._names is None:
+            idx = self.get_named_streams().get('/names')
+            if idx is None or self._streams[idx] is None:
+                self._names = False
+            else:
+                self._names = PdbNames(self.get_stream(idx, pin=True))
+        return self._names or None
+
+    def _get_type_stream(self, idx):
+        r = self._type_streams.get(idx)
         if r is None:
-            blocks, size = self._streams[idx]
-            r = bytearray(size)
+            if idx >= len(self._streams) or self._streams[idx] is None or self._streams[idx][1] < cv.TPI_HEADER.size:
+                r = False
+            else:
+                hash_idx = cv.TPI_HEADER.unpack_from(self.get_stream(idx)).HashStreamIndex
+                if hash_idx == 0xffff or hash_idx >= len(self._streams) or self._streams[hash_idx] is None:
+                    hash_idx = None
+                r = TypeStream(self, idx, hash_idx)
+            self._type_streams[idx] = r
+        return r or None
+
+    def get_type_stream(self):
+        """Return the TypeStream of the TPI stream, or None if it is empty."""
+
+        return self._get_type_stream(2)
+
+    def get_id_stream(self):
+        """Return the TypeStream of the IPI stream, or None if the PDB has none."""
+
+        return self._get_type_stream(4)
+
+    def get_guid(self):
+        hdr = PdbInfoStreamHeader.unpack_from(self.get_stream(1))
+        return uuid.UUID(bytes_le=hdr.Guid)
+
+    def get_age(self):
+        """Return the age that executables refer to, the one in the DBI stream."""
+
+        hdr = self._dbihdr
+        if hdr is None:
+            hdr = DbiStreamHeader.unpack_from(self.get_stream(3))
+        return hdr.Age
+
+    def _symrecs(self):
+        self._parse_dbi()
+        return self.get_stream(self._dbihdr.SymRecordStream)
+
+    def _read_public(self, syms, offs):
+        reclen, rectp = syms.unpack_from('<HH', offs)
+        if rectp != cv.S_PUB32:
+            return None, offs + reclen + 2
+
+        eoffs = offs + reclen + 2
+        symhdr = cv.PUBSYM32.unpack_from(syms, offs + 4)
+        name, _ = read_utf8z(syms, offs + 4 + cv.PUBSYM32.size, eoffs)
+        rva = self.get_rva(symhdr.seg, symhdr.off) or 0
+        return PublicSymbol(name, symhdr.seg, symhdr.off, rva), eoffs
+
+    def get_public_symbols(self):
+        """Return the PublicSymbols of the PDB.
+
+        The symbol record stream is scanned once, names are not decoded
+        until they are accessed.
+        """
+
+        if self._public_symbols is None:
+            syms = self._symrecs()
+            segments = array('H')
+            offsets = array('I')
+            rvas = array('I')
+            records = array('I')
+
             offs = 0
-            for block in blocks[:-1]:
-                r[offs:offs+self._block_size] = bytes(self._blob[block*self._block_size:][:self._block_size])
-                offs += self._block_size
-            size = len(r) - offs
-            r[offs:] = self._blob[blocks[-1]*self._block_size:][:size]
-            r = bytes(r)
-            self._stream_bytes[idx] = r
-        return r
+            while offs < len(syms):
+                reclen, rectp = syms.unpack_from('<HH', offs)
+                if rectp == cv.S_PUB32:
+                    _, off, seg = syms.unpack_from('<4xIIH', offs)
+                    segments.append(seg)
+                    offsets.append(off)
+                    rvas.append(self.get_rva(seg, off) or 0)
+                    records.append(offs)
+                offs += reclen + 2
+
+            self._public_symbols = PublicSymbols(self, self._dbihdr.SymRecordStream, segments, offsets, rvas, records)
+        return self._public_symbols
+
+    def get_public_symbol_index(self):
+        if self._public_index is None:
+            self._public_index = PublicSymbolIndex(self.get_public_symbols(), self.get_public_columns())
+        return self._public_index
+
+    def get_public_columns(self):
+        """Return the PublicColumns of the PDB.
+
+        Symbols in segments that are not in the section map, such as
+        absolute symbols, are left out.
+        """
+
+        if self._public_columns is None:
+            publics = self.get_public_symbols()
+            rvas = publics.rvas
+            order = sorted((idx for idx, seg in enumerate(publics.segments) if 0 < seg <= len(self._addr_map)),
+                key=rvas.__getitem__)
+            self._public_columns = PublicColumns(
+                array('I', (rvas[idx] for idx in order)),
+                array('I', order))
+        return self._public_columns
+
+    def symbolize(self, rvas):
+        """Find the nearest public symbol at or before each of `rvas`.
+
+        `rvas` can be a NumPy array or any sequence of integers, such as
+        `array('I')`. Returns a SymbolizedRvas tuple: `indices` holds for
+        each RVA the index of its symbol (-1 if there is none),
+        `displacements` the offsets from the symbols, and `names` maps
+        each of the found indices to the symbol name.
+
+        With NumPy available, the lookup is done by a single vectorized
+        search and the two arrays are NumPy arrays; otherwise they are
+        `array` objects. Only the names of the found symbols are decoded.
+        """
+
+        cols = self.get_public_columns()
+
+        if numpy is not None:
+            rvas = numpy.asarray(rvas, dtype=numpy.int64)
+            col = numpy.frombuffer(cols.rvas, dtype=numpy.uint32)
+            indices = numpy.searchsorted(col, rvas, side='right').astype(numpy.int64) - 1
+            found = indices >= 0
+            if len(col):
+                displacements = numpy.where(found, rvas - col[numpy.maximum(indices, 0)], 0)
+            else:
+                displacements = numpy.zeros(len(rvas), dtype=numpy.int64)
+            hits = numpy.unique(indices[found]).tolist()
+        else:
+            col = cols.rvas
+            indices = array('q')
+            displacements = array('q')
+            for rva in rvas:
+                i = bisect_right(col, rva) - 1
+                indices.append(i)
+                displacements.append(rva - col[i] if i >= 0 else 0)
+            hits = sorted(set(i for i in indices if i >= 0))
+
+        publics = self.get_public_symbols()
+        names = {i: publics.get_name(cols.order[i]) for i in hits}
+        return SymbolizedRvas(indices, displacements, names)
+
+    def get_publics_stream(self):
+        """Return the PublicsStream, or None if the PDB has none."""
+
+        if self._publics is None:
+            self._parse_dbi()
+            idx = self._dbihdr.PublicStreamIndex
+            if idx == 0xffff or self._streams[idx] is None:
+                self._publics = False
+            else:
+                self._publics = PublicsStream(self.get_stream(idx, pin=True))
+        return self._publics or None
+
+    def find_public(self, name):
+        """Return the public symbol named `name`, or None.
+
+        The publics hash table is used if present, so that only the
+        records in the name's bucket are read.
+        """
+
+        psi = self.get_publics_stream()
+        if psi is None:
+            return self.get_public_symbol_index().find_by_name(name)
+
+        syms = self._symrecs()
+        for offs in psi.hash.lookup(name):
+            sym, _ = self._read_public(syms, offs)
+            if sym is not None and sym.name == name:
+                return sym
+        return None
+
+    def find_public_by_rva(self, rva):
+        """Return `(symbol, displacement)` for the nearest public symbol
+        at or before `rva`, or None.
+
+        The publics address map is bisected if present.
+        """
+
+        psi = self.get_publics_stream()
+        if psi is None:
+            return self.get_public_symbol_index().find_by_rva(rva)
+
+        rvas = _AddressMapRvas(self, psi)
+        i = bisect_right(rvas, rva) - 1
+        if i < 0:
+            return None
+
+        sym, _ = self._read_public(self._symrecs(), psi.get_addr(i))
+        if sym is None or sym.segment == 0:
+            return None
+        return sym, rva - sym.rva
+
+    def get_rva(self, seg, offs):
+        """Translate a `segment:offset` address to an RVA.
+
+        Returns None if the segment is not mapped.
+        """
+
+        self._parse_dbi()
+        if not 0 < seg <= len(self._addr_map):
+            return None
+        return self._addr_map[seg - 1] + offs
+
+    def get_stream(self, idx, pin=False):
+        r = self._stream_views[idx]
+        if r is not None:
+            return r
+
+        if self._streams[idx] is None:
+            raise RuntimeError('stream {} is not present'.format(idx))
+
+        blocks, size = self._streams[idx]
+        r = PdbStream.from_blocks(self._blob, self._finder, self._block_size, blocks, size)
+        if isinstance(self._blob, memoryview):
+            self._stream_views[idx] = r
+            return r
+
+        # Streams that cannot fit in the cache are read from the blob
+        # on each access instead of being copied.
+        if size > self._cache.max_bytes and not (pin and size <= self._cache.pin_max_bytes):
+            return r
+
+        data = self._cache.get((self._cache_token, idx), lambda: bytes(r), pin=pin)
+        return PdbStream.from_bytes(data)
+
+def parse_pdb(blob, cache=None):
+    """Parse a PDB file and return a PdbFile object.
+
+    Expects a bytes-like object, an mmap or a grope.rope. Streams of
+    bytes-like and mmap blobs are read through memoryviews without
+    copying, see `open_pdb`. Streams of other blobs are read into
+    `cache`, or into `default_stream_cache` if not given.
+    """
+
+    finder = blob if hasattr(blob, 'find') else None
+    try:
+        blob = memoryview(blob)
+    except TypeError:
+        pass
 
-def parse_pdb(blob):
     hdr = PdbFileHeader.unpack_from(blob)
     if hdr.magic != pdb_signature:
         raise RuntimeError('not a PDB file (wrong signature)')
@@ -205,4 +1457,13 @@ def parse_pdb(blob):
         idx = next_idx
         streams.append((stream_blocks, stream_size))
 
-    return PdbFile(blob, hdr.block_size, streams)
+    return PdbFile(blob, hdr.block_size, streams, finder, cache)
+
+def open_pdb(fname):
+    """Map a PDB file into memory and parse it.
+
+    The file is not read up front, streams are served from the mapping.
+    """
+
+    with open(fname, 'rb') as fin:
+        return parse_pdb(mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ))
@@ -1,11 +1,9 @@
 import struct, io
-from dataclasses import dataclass
 from grope import BlobIO, rope
 from .struct3 import Struct3, u8, u16, u32, u64, char
-from .rsrc import parse_pe_resources
+from .rsrc import parse_pe_resources, parse_pe_resources_layout, parse_pe_resource_type, find_pe_resource
 from .rsrc import KnownResourceTypes
-import uuid
-from .version_info import parse_version_info
+from .version_info import parse_version_info, parse_fixed_file_info
 
 class _IMAGE_FILE_HEADER(Struct3):
     Machine: u16
@@ -111,47 +109,13 @@ class _IMAGE_DEBUG_CODEVIEW(Struct3):
     guid: char[16]
     age: u32
 
-@dataclass
-class PeIdent:
-    image_name: str
-    timestamp: int
-    size_of_image: int
-
-    @classmethod
-    def from_pelink(cls, pelink: str):
-        fname, tssize = pelink.split('/')
-        ts = int(tssize[:8], 16)
-        size = int(tssize[8:], 16)
-        return cls(image_name=fname, timestamp=ts, size_of_image=size)
-
-    @property
-    def pelink(self):
-        return f'{self.image_name}/{self.timestamp:08x}{self.size_of_image:x}'
-
-    def __str__(self):
-        return self.pelink
-@dataclass
-class CodeviewLink:
-    guid: uuid.UUID
-    age: int
-    filename: str
-
-    @classmethod
-    def from_bxlink(cls, bxlink: str):
-        fname, bxlink = bxlink.split('{', 1)
-        guid, age = bxlink.split('}', 1)
-        return cls(guid=uuid.UUID(guid), age=int(age, 10), filename=fname)
-
-    @property
-    def bxlink(self):
-        return f'{self.filename}{{{self.guid}}}{self.age}'
-
-    @property
-    def short_filename(self):
-        return self.filename.rsplit('\\', 1)[-1]
-
-    def __str__(self):
-        return self.bxlink
+# PeIdent and CodeviewLink live in .links and are imported on first use,
+# so that parsing PE files does not import dataclasses and inspect.
+def __getattr__(name):
+    if name in ('PeIdent', 'CodeviewLink'):
+        from . import links
+        return getattr(links, name)
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
 
 IMAGE_DEBUG_TYPE_CODEVIEW = 2
 
@@ -204,6 +168,10 @@ IMAGE_SCN_MEM_WRITE                  = 0x80000000
 def _align(offs, alignment):
     return (offs + alignment - 1) // alignment * alignment
 
+# Marks cached values that have not been computed yet, where None is
+# a valid result.
+_NOT_COMPUTED = object()
+
 IMAGE_DIRECTORY_ENTRY_EXPORT = 0
 IMAGE_DIRECTORY_ENTRY_IMPORT = 1
 IMAGE_DIRECTORY_ENTRY_RESOURCE = 2
@@ -253,6 +221,9 @@ def _read(blob, fmt):
     return struct.unpack(fmt, bytes(blob[:size]))
 
 def parse_rsds_blob(blob):
+    import uuid
+    from .links import CodeviewLink
+
     if len(blob) < _IMAGE_DEBUG_CODEVIEW.size:
         return None
 
@@ -340,6 +311,11 @@ class _PeFile:
         self._sections = sections
 
         self._trailer = blob[end_of_image:]
+        self._trailer_offset = end_of_image
+
+        self._string_table = None
+        self._message_table = None
+        self._fixed_file_info = _NOT_COMPUTED
 
         self._check_vm_overlaps()
 
@@ -378,6 +354,26 @@ class _PeFile:
                     raise RuntimeError('PE file corrupt: missing section content')
                 return rope(sec.data[sec_offs:sec_offs + init_size], b'\0'*uninit_size)
 
+    def get_vm_file_range(self, start, stop):
+        """Locate a range of RVAs in the original file.
+
+        Returns a tuple `(offset, size, zero_fill)`: the range starts
+        at `offset` in the file and its first `size` bytes are stored
+        there, the remaining `zero_fill` bytes are not backed by the file
+        and read as zeros. Returns None if the range is not mapped
+        by a single section.
+        """
+
+        for sec in self._sections:
+            if sec.hdr.VirtualAddress <= start and sec.hdr.VirtualAddress + sec.hdr.VirtualSize >= stop:
+                sec_offs = start - sec.hdr.VirtualAddress
+                init_size = max(0, min(sec.hdr.SizeOfRawData - sec_offs, stop - start))
+                return sec.hdr.PointerToRawData + sec_offs, init_size, stop - start - init_size
+        return None
+
+    def get_trailer_file_range(self):
+        return self._trailer_offset, len(self._trailer)
+
     def has_trailer(self):
         return bool(self._trailer)
 
@@ -447,41 +443,98 @@ class _PeFile:
 
         return self.get_vm(dd.start, dd.stop)
 
-    def parse_resources(self):
+    def _get_resource_blob(self):
         vm_slice = self.find_directory(IMAGE_DIRECTORY_ENTRY_RESOURCE)
         if vm_slice is None:
+            return None, None
+
+        return self.get_vm(vm_slice.start, vm_slice.stop), vm_slice.start
+
+    def parse_resources(self):
+        data, base = self._get_resource_blob()
+        if data is None:
             return None
+        return parse_pe_resources(data, base)
 
-        data = self.get_vm(vm_slice.start, vm_slice.stop)
-        return parse_pe_resources(data, vm_slice.start)
+    def parse_resources_layout(self):
+        data, base = self._get_resource_blob()
+        if data is None:
+            return None, None
+        return parse_pe_resources_layout(data, base)
 
-    def _get_version_info_dict(self):
-        res = self.parse_resources()
-        if not res:
-            return
-        return res.get(KnownResourceTypes.RT_VERSION, {}).get(1, {})
+    def find_resource(self, type, name=None, langs=()):
+        data, base = self._get_resource_blob()
+        if data is None:
+            return None
+        return find_pe_resource(data, base, type, name, langs)
 
     def get_version_info(self, langs=(0x0409, 0)):
-        vis = self._get_version_info_dict()
-        if not vis:
-            return None
+        """Parse the first version info resource.
 
-        for lngid in langs:
-            vi = vis.get(lngid)
-            if vi is not None:
-                break
-        else:
-            lngid, vi = vis.popitem()
+        The languages in `langs` are tried in order within the resource,
+        the last language is used if none of them is present.
+        """
 
+        vi = self.find_resource(KnownResourceTypes.RT_VERSION, None, langs)
+        if vi is None:
+            return None
         return parse_version_info(vi)
 
+    def get_fixed_file_info(self):
+        """Return the VS_FIXEDFILEINFO of the first version info resource.
+
+        Only the header of the resource is read and the result is
+        cached. Returns None if there is no version info or it has no
+        fixed file info.
+        """
+
+        if self._fixed_file_info is _NOT_COMPUTED:
+            vi = self.find_resource(KnownResourceTypes.RT_VERSION, None, (0x0409, 0))
+            self._fixed_file_info = parse_fixed_file_info(vi) if vi is not None else None
+        return self._fixed_file_info
+
+    def _get_resource_type(self, type):
+        data, base = self._get_resource_blob()
+        if data is None:
+            return {}
+        return parse_pe_resource_type(data, base, type) or {}
+
+    def get_string_table(self):
+        if self._string_table is None:
+            from .string_table import StringTable
+
+            self._string_table = StringTable(self._get_resource_type(KnownResourceTypes.RT_STRING))
+        return self._string_table
+
+    def get_message_table(self):
+        if self._message_table is None:
+            from .string_table import MessageTable
+
+            self._message_table = MessageTable(self._get_resource_type(KnownResourceTypes.RT_MESSAGETABLE))
+        return self._message_table
+
+    def get_string(self, id, langs=(0x0409, 0)):
+        return self.get_string_table().get(id, langs)
+
+    def get_message(self, id, langs=(0x0409, 0)):
+        return self.get_message_table().get(id, langs)
+
+    def get_manifest_info(self):
+        from .manifest import parse_manifest_info
+
+        manifests = self._get_resource_type(KnownResourceTypes.RT_MANIFEST)
+        for langs in manifests.values():
+            for blob in langs.values():
+                return parse_manifest_info(blob)
+        return None
+
     def get_file_version(self):
-        vi = self.get_version_info()
-        return vi.get_fixed_info().file_version_tuple if vi else None
+        fi = self.get_fixed_file_info()
+        return fi.file_version_tuple if fi else None
 
     def get_product_version(self):
-        vi = self.get_version_info()
-        return vi.get_fixed_info().product_version_tuple if vi else None
+        fi = self.get_fixed_file_info()
+        return fi.product_version_tuple if fi else None
 
     def _get_directory_section(self, dd_idx):
         if dd_idx >= len(self._data_directories):
@@ -559,6 +612,11 @@ class _PeFile:
         sec = self._sections[sec_idx]
         sec.data = blob
 
+        if idx == IMAGE_DIRECTORY_ENTRY_RESOURCE:
+            self._string_table = None
+            self._message_table = None
+            self._fixed_file_info = _NOT_COMPUTED
+
     def to_blob(self, update_checksum=False):
         self._opt_header.CheckSum = 0
         self._opt_header.SizeOfImage = max(self._mem_align(sec.hdr.VirtualAddress + sec.hdr.VirtualSize) for sec in self._sections)
@@ -1,14 +1,9 @@
-import argparse, sys, re, tempfile, os
-import xml.dom, xml.dom.minidom
-import grope
-from .pe_parser import parse_pe, IMAGE_DIRECTORY_ENTRY_RESOURCE
-from .rsrc import (
-    parse_pe_resources,
-    pe_resources_prepack,
-    parse_prelink_resources,
-    KnownResourceTypes,
-)
-from .version_info import parse_version_info, VersionInfo
+import sys, os, mmap, time, io, threading
+
+# Modules only needed by some of the commands are imported where they are
+# used, most invocations of the tool do not need them. This includes the
+# PE and resource parsers and argparse, which `--connect` leaves to the
+# server.
 
 
 class Version:
@@ -53,11 +48,62 @@ class _ReReplace:
         return self._compiled_re.sub(self._sub, s)
 
 
-RT_VERSION = KnownResourceTypes.RT_VERSION
-RT_MANIFEST = KnownResourceTypes.RT_MANIFEST
+def _map_file(fname):
+    with open(fname, "rb") as fin:
+        if os.fstat(fin.fileno()).st_size == 0:
+            return b""
+        # the mapping stays valid after the file is closed
+        return mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ)
 
 
-def main():
+# Parsed `.res` files, shared by all jobs of a batch or requests
+# to a server. Entries are keyed by path and replaced when the file
+# changes, so a rebuilt file does not keep its old mapping alive.
+_res_cache = {}
+
+
+def _load_res(fname):
+    st = os.stat(fname)
+    key = os.path.abspath(fname)
+    stamp = st.st_mtime_ns, st.st_size
+
+    entry = _res_cache.get(key)
+    if entry is None or entry[0] != stamp:
+        from .rsrc import parse_prelink_resources
+
+        entry = stamp, parse_prelink_resources(_map_file(fname))
+        _res_cache[key] = entry
+    return entry[1]
+
+
+def _preload_res(fnames):
+    # Files that fail to load are reported by the jobs that apply them.
+    for fname in fnames:
+        try:
+            _load_res(fname)
+        except Exception:
+            pass
+
+
+# Layouts of resource sections packed by this process, so that stamping
+# many files with the same set of resources only has to place the payloads.
+_prepack_cache = None
+_prepack_cache_lock = threading.Lock()
+
+
+def _get_prepack_cache():
+    global _prepack_cache
+    with _prepack_cache_lock:
+        if _prepack_cache is None:
+            from .rsrc import PrepackCache
+
+            _prepack_cache = PrepackCache()
+        return _prepack_cache
+
+
+def _make_parser():
+    import argparse
+
     ap = argparse.ArgumentParser(
         fromfile_prefix_chars="@",
         description="Parses and edits resources in Windows executable (PE) files.",
@@ -146,17 +192,377 @@ def main():
         "-o",
         help="write the edited contents to OUTPUT instead of editing the input file in-place",
     )
-    ap.add_argument("file", help="the PE file to parse and edit")
+    ap.add_argument(
+        "--extract",
+        metavar="DIR",
+        help="write each resource entry of the input file to DIR/TYPE/NAME/LANG and the trailing data to DIR/_trailer",
+    )
+    ap.add_argument(
+        "--batch",
+        metavar="JOBS",
+        help="run the jobs in the JSON lines file JOBS instead of editing FILE",
+    )
+    ap.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        help="the number of processes to run batch jobs in",
+    )
+    ap.add_argument(
+        "--serve",
+        metavar="SOCKET",
+        help="listen for edit requests on the Unix domain socket SOCKET",
+    )
+    ap.add_argument(
+        "--connect",
+        metavar="SOCKET",
+        help="send the remaining arguments to a server listening on SOCKET",
+    )
+    ap.add_argument("file", nargs="?", help="the PE file to parse and edit")
+    return ap
+
+
+def _is_job_value(action, value):
+    # Checks that a job sets an option to what parsing it would produce.
+    import argparse
+
+    def is_arg(v):
+        if action.nargs is None:
+            return isinstance(v, str)
+        return (
+            isinstance(v, list)
+            and len(v) == action.nargs
+            and all(isinstance(x, str) for x in v)
+        )
+
+    if value is None and action.default is None:
+        return True
+    if action.nargs == 0:
+        return isinstance(value, bool)
+    if isinstance(action, argparse._AppendAction):
+        return isinstance(value, list) and all(is_arg(v) for v in value)
+    return is_arg(value)
+
+
+def _job_args(ap, job):
+    if not isinstance(job, dict):
+        raise ValueError("a job must be an object")
+
+    job = dict(job)
+    args = ap.parse_args([])
+    args.file = job.pop("input", None)
+    if not isinstance(args.file, str):
+        raise ValueError("the job input must be a string")
+
+    actions = {action.dest: action for action in ap._actions}
+    for k, v in job.items():
+        dest = k.replace("-", "_")
+        action = actions.get(dest)
+        if action is None or dest in (
+            "help",
+            "file",
+            "batch",
+            "jobs",
+            "serve",
+            "connect",
+        ):
+            raise ValueError("unknown job option: {}".format(k))
+        if not _is_job_value(action, v):
+            raise ValueError("invalid value for job option {}: {!r}".format(k, v))
+        setattr(args, dest, v)
+    return args
+
+
+def _run_job(job):
+    start = time.perf_counter()
+    try:
+        rc = _run(_job_args(_make_parser(), job))
+        error = None
+    except SystemExit as e:
+        rc = e.code if isinstance(e.code, int) and e.code else 1
+        error = "exited with {}".format(e.code)
+    except Exception as e:
+        rc = 1
+        error = "{}: {}".format(type(e).__name__, e)
+    return rc, time.perf_counter() - start, error
+
+
+def _job_name(idx, job):
+    name = job.get("input") if isinstance(job, dict) else None
+    return name if isinstance(name, str) else "job {}".format(idx + 1)
+
+
+def _run_batch(args):
+    import json
+    from concurrent.futures import ProcessPoolExecutor
+
+    jobs = []
+    with open(args.batch, "r", encoding="utf-8") as fin:
+        for lineno, line in enumerate(fin, 1):
+            if not line.strip():
+                continue
+            try:
+                jobs.append(json.loads(line))
+            except ValueError as e:
+                print(
+                    "error: {}:{}: {}".format(args.batch, lineno, e), file=sys.stderr
+                )
+                return 1
+
+    # Shared .res files are parsed once, before the workers are started,
+    # so that forked workers inherit them. Other workers parse them
+    # once on startup. Invalid jobs are reported when they run.
+    ap = _make_parser()
+    res_files = set()
+    for job in jobs:
+        try:
+            res_files.update(_job_args(ap, job).apply)
+        except ValueError:
+            pass
+    res_files = sorted(res_files)
+    _preload_res(res_files)
+
+    start = time.perf_counter()
+    failed = 0
+    with ProcessPoolExecutor(
+        max_workers=args.jobs, initializer=_preload_res, initargs=(res_files,)
+    ) as executor:
+        for idx, (rc, elapsed, error) in enumerate(executor.map(_run_job, jobs)):
+            status = "ok" if rc == 0 else "failed ({})".format(error or rc)
+            if rc != 0:
+                failed += 1
+            print(
+                "{}: {} in {:.3f} s".format(_job_name(idx, jobs[idx]), status, elapsed)
+            )
+
+    elapsed = time.perf_counter() - start
+    print(
+        "{} jobs, {} failed, {:.2f} s ({:.1f} jobs/s)".format(
+            len(jobs), failed, elapsed, len(jobs) / elapsed if elapsed else 0
+        )
+    )
+    return 1 if failed else 0
+
+
+class _ThreadOutput(io.TextIOBase):
+    # Stands in for sys.stdout/sys.stderr in a server, so that each
+    # request thread can capture its own output.
+
+    def __init__(self, target):
+        self._target = target
+        self._local = threading.local()
+
+    def capture(self):
+        buf = io.StringIO()
+        self._local.buf = buf
+        return buf
+
+    def release(self):
+        self._local.buf = None
+
+    def writable(self):
+        return True
+
+    def write(self, s):
+        buf = getattr(self._local, "buf", None)
+        return (buf or self._target).write(s)
+
+    def flush(self):
+        buf = getattr(self._local, "buf", None)
+        (buf or self._target).flush()
+
+
+def _absolutize_paths(args, cwd):
+    def abspath(path):
+        return os.path.join(cwd, path)
+
+    args.file = abspath(args.file)
+    if args.output:
+        args.output = abspath(args.output)
+    if args.extract:
+        args.extract = abspath(args.extract)
+    args.apply = [abspath(fname) for fname in args.apply]
+    args.set_resource = [
+        (rtype, rname, lang, abspath(fname))
+        for rtype, rname, lang, fname in args.set_resource
+    ]
+
+
+def _expand_response_files(argv, cwd):
+    # Expands `@file` arguments the way argparse's fromfile_prefix_chars
+    # does, except that the files are resolved against `cwd`.
+    r = []
+    for arg in argv:
+        if not arg.startswith("@"):
+            r.append(arg)
+            continue
+
+        with open(os.path.join(cwd, arg[1:]), "r") as fin:
+            r.extend(_expand_response_files(fin.read().splitlines(), cwd))
+    return r
+
+
+def _serve_request(req):
+    out = sys.stdout.capture()
+    err = sys.stderr.capture()
+    try:
+        argv = _expand_response_files(req["argv"], req["cwd"])
+        args = _make_parser().parse_args(argv)
+        if args.batch or args.serve or args.connect or args.file is None:
+            print("error: a served request must edit a single file", file=sys.stderr)
+            rc = 2
+        else:
+            _absolutize_paths(args, req["cwd"])
+            rc = _run(args)
+    except SystemExit as e:
+        rc = e.code if isinstance(e.code, int) else 2
+    except Exception as e:
+        print("error: {}: {}".format(type(e).__name__, e), file=sys.stderr)
+        rc = 1
+    finally:
+        sys.stdout.release()
+        sys.stderr.release()
+
+    return {"rc": rc, "stdout": out.getvalue(), "stderr": err.getvalue()}
+
+
+def _remove_stale_socket(path):
+    import socket, stat
+
+    try:
+        st = os.lstat(path)
+    except FileNotFoundError:
+        return True
+    if not stat.S_ISSOCK(st.st_mode):
+        return False
+
+    # A socket nobody listens on is left over from a server that died.
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(path)
+        except ConnectionRefusedError:
+            os.remove(path)
+            return True
+    return False
+
+
+def _serve(path):
+    import json, signal, socketserver
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for line in self.rfile:
+                resp = _serve_request(json.loads(line))
+                self.wfile.write(json.dumps(resp).encode("utf-8") + b"\n")
+                self.wfile.flush()
+
+    if not _remove_stale_socket(path):
+        print("error: {} exists and is not a stale socket".format(path), file=sys.stderr)
+        return 1
+
+    # Requests rewrite files with the server's privileges, only the owner
+    # may connect. The umask covers the window between bind and chmod.
+    old_umask = os.umask(0o177)
+    try:
+        server = socketserver.ThreadingUnixStreamServer(path, Handler)
+    finally:
+        os.umask(old_umask)
+    os.chmod(path, 0o600)
+    server.daemon_threads = True
+
+    sys.stdout = _ThreadOutput(sys.stdout)
+    sys.stderr = _ThreadOutput(sys.stderr)
+
+    # shutdown() waits for serve_forever() to return, so it cannot be
+    # called from the thread running it.
+    signal.signal(
+        signal.SIGTERM,
+        lambda signum, frame: threading.Thread(target=server.shutdown).start(),
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.remove(path)
+    return 0
+
+
+def _connect(path, argv):
+    import json, socket
+
+    # Response files are read here, the server may not see the same files.
+    cwd = os.getcwd()
+    try:
+        argv = _expand_response_files(argv, cwd)
+    except OSError as e:
+        print("error: {}".format(e), file=sys.stderr)
+        return 2
+
+    req = {"argv": argv, "cwd": cwd}
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(path)
+        sock.sendall(json.dumps(req).encode("utf-8") + b"\n")
+        with sock.makefile("rb") as fin:
+            resp = json.loads(fin.readline())
+
+    sys.stdout.write(resp["stdout"])
+    sys.stderr.write(resp["stderr"])
+    return resp["rc"]
+
+
+def _split_connect(argv):
+    for i, arg in enumerate(argv):
+        if arg == "--connect" and i + 1 < len(argv):
+            return argv[i + 1], argv[:i] + argv[i + 2 :]
+        if arg.startswith("--connect="):
+            return arg[len("--connect=") :], argv[:i] + argv[i + 1 :]
+    return None, argv
+
+
+def main():
+    # The client only forwards its arguments, the server parses them.
+    path, argv = _split_connect(sys.argv[1:])
+    if path is not None:
+        return _connect(path, argv)
+
+    ap = _make_parser()
 
     if not sys.argv[1:]:
         ap.print_help()
         return 0
 
     args = ap.parse_args()
+    if args.serve:
+        return _serve(args.serve)
+    if args.batch:
+        return _run_batch(args)
+    if args.file is None:
+        ap.error("the following arguments are required: file")
+    return _run(args)
+
 
+def _run(args):
     fin = open(args.file, "rb")
+    try:
+        return _edit(args, fin)
+    finally:
+        fin.close()
+
+
+def _edit(args, fin):
+    import re
+    import grope
+    from .pe_parser import parse_pe, IMAGE_DIRECTORY_ENTRY_RESOURCE
+    from .rsrc import KnownResourceTypes
+    from .version_info import parse_version_info, VersionInfo
+
+    RT_VERSION = KnownResourceTypes.RT_VERSION
+    RT_MANIFEST = KnownResourceTypes.RT_MANIFEST
+
     pe = parse_pe(grope.wrap_io(fin))
-    resources = pe.parse_resources()
+    resources, layout = pe.parse_resources_layout()
     if args.print_tree:
         if resources is None:
             print("no resources in the PE file")
@@ -189,6 +595,11 @@ def main():
                 for k in fixed.descriptor.names:
                     print("  {}: 0x{:x}".format(k, getattr(fixed, k)))
 
+    if args.extract:
+        from .extract import extract_resources
+
+        extract_resources(pe, args.file, args.extract, layout=layout)
+
     if (
         not args.clear
         and not args.apply
@@ -231,10 +642,7 @@ def main():
             del resources[RT_MANIFEST]
 
     for res_file in args.apply:
-        res_fin = open(res_file, "rb")
-        # must not close res_fin until the ropes are gone
-
-        r = parse_prelink_resources(grope.wrap_io(res_fin))
+        r = _load_res(res_file)
         for resource_type in r:
             for name in r[resource_type]:
                 for lang in r[resource_type][name]:
@@ -243,17 +651,19 @@ def main():
                     ] = r[resource_type][name][lang]
 
     for rtype, rname, lang, inname in args.set_resource:
-        res_fin = open(inname, "rb")
+        # Read rather than kept open, a server would leak the handles.
+        with open(inname, "rb") as res_fin:
+            res_data = res_fin.read()
         rtype = getattr(KnownResourceTypes, rtype, rtype)
         if rname.startswith("#"):
             rname = int(rname[1:], 10)
         else:
             rname = rname.upper()
-        resources.setdefault(rtype, {}).setdefault(rname, {})[int(lang)] = (
-            grope.wrap_io(res_fin)
-        )
+        resources.setdefault(rtype, {}).setdefault(rname, {})[int(lang)] = res_data
 
     if args.add_dependency:
+        from .manifest import add_manifest_dependencies
+
         man_data = None
         for name in resources.get(RT_MANIFEST, ()):
             for lang in resources[RT_MANIFEST][name]:
@@ -264,38 +674,24 @@ def main():
                 man_name = name
                 man_lang = lang
 
-        if man_data is None:
-            man_doc = xml.dom.minidom.getDOMImplementation().createDocument(
-                None, "dependency", None
-            )
-            man = man_doc.documentElement
-        else:
-            man_doc = xml.dom.minidom.parseString(bytes(man_data))
-            man = man_doc.documentElement
-
-        dependency_list = man_doc.getElementsByTagName("dependency")
-        if not dependency_list:
-            dependency = man_doc.createElement("dependency")
-            man.appendChild(dependency)
-        else:
-            dependency = dependency_list[0]
-
-        dependent_assembly_list = man_doc.getElementsByTagName("dependentAssembly")
-        if not dependent_assembly_list:
-            dependent_assembly = man_doc.createElement("dependentAssembly")
-            dependency.appendChild(dependent_assembly)
-        else:
-            dependent_assembly = dependent_assembly_list[0]
-
+        deps = []
         for dep in args.add_dependency:
-            dep_elem = man_doc.createElement("assemblyIdentity")
+            attrs = {}
             for tok in dep.split():
                 k, v = tok.split("=", 1)
-                dep_elem.setAttribute(k, v)
-            dependent_assembly.appendChild(dep_elem)
+                attrs[k] = v
+            deps.append(attrs)
+
+        if man_data is None:
+            man_name, man_lang = 1, 0x409
 
-        resources[RT_MANIFEST][man_name][man_lang] = b"\xef\xbb\xbf" + man_doc.toxml(
-            encoding="utf-8"
+        try:
+            man_data = add_manifest_dependencies(man_data, deps)
+        except RuntimeError as e:
+            print("error: {}".format(e), file=sys.stderr)
+            return 1
+        resources.setdefault(RT_MANIFEST, {}).setdefault(man_name, {})[man_lang] = (
+            man_data
         )
 
     if args.set_version:
@@ -352,11 +748,18 @@ def main():
         vi.set_string_file_info(sfi)
         resources[RT_VERSION][ver_name][ver_lang] = vi.pack()
 
-    prepacked = pe_resources_prepack(resources)
-    addr = pe.resize_directory(IMAGE_DIRECTORY_ENTRY_RESOURCE, prepacked.size)
-    pe.set_directory(IMAGE_DIRECTORY_ENTRY_RESOURCE, prepacked.pack(addr))
+    # Keep the original layout if only existing entries were replaced.
+    updated = layout.update(resources) if layout is not None else None
+    if updated is not None:
+        pe.set_directory(IMAGE_DIRECTORY_ENTRY_RESOURCE, updated)
+    else:
+        prepacked = _get_prepack_cache().prepack(resources)
+        addr = pe.resize_directory(IMAGE_DIRECTORY_ENTRY_RESOURCE, prepacked.size)
+        pe.set_directory(IMAGE_DIRECTORY_ENTRY_RESOURCE, prepacked.pack(addr))
 
     if not args.output:
+        import tempfile
+
         fout, fout_name = tempfile.mkstemp(dir=os.path.split(args.file)[0])
         fout = os.fdopen(fout, mode="w+b")
         try:
@@ -1,7 +1,9 @@
 from grope import BlobIO, rope
 from .utils import *
 from .struct3 import Struct3, u16, u32
-import time, struct
+from .strings import read_utf16z, read_utf16_prefixed
+from collections import OrderedDict
+import time, struct, threading
 
 
 class KnownResourceTypes:
@@ -66,205 +68,495 @@ class _RES_HEADER(Struct3):
     Version: u32
     Characteristics: u32
 
-def _parse_prelink_name(blob):
-    name, = struct.unpack('<H', bytes(blob[:2]))
+def _parse_prelink_name(hdr, offs):
+    name, = struct.unpack_from('<H', hdr, offs)
     if name == 0xffff:
-        name, = struct.unpack('<H', bytes(blob[2:4]))
-        return name, blob[4:]
-    else:
-        r = []
-        while True:
-            ch = bytes(blob[:64])
-            i = 0
-            while i < 64:
-                if ch[i:i+2] == b'\0\0':
-                    r.append(ch[:i])
-                    return b''.join(r).decode('utf-16le'), blob[i+2:]
-                i += 2
-            r.append(ch)
-            blob = blob[64:]
-
-
-def _parse_one_prelink_res(blob):
-    hdr_sizes = _RES_HEADER_SIZES.unpack_from(blob)
-    if hdr_sizes.HeaderSize < hdr_sizes.size:
-        raise RuntimeError('corrupted header')
-
-    full_hdr_blob = blob[hdr_sizes.size:hdr_sizes.HeaderSize]
-    hdr_blob = full_hdr_blob
-    data_blob = blob[hdr_sizes.HeaderSize:hdr_sizes.HeaderSize + hdr_sizes.DataSize]
-    next_blob = blob[align4(hdr_sizes.HeaderSize + hdr_sizes.DataSize):]
-
-    type, hdr_blob = _parse_prelink_name(hdr_blob)
-    name, hdr_blob = _parse_prelink_name(hdr_blob)
-
-    hdr_blob = full_hdr_blob[align4(len(full_hdr_blob) - len(hdr_blob)):]
-
-    hdr = _RES_HEADER.unpack_from(hdr_blob)
-    hdr.type = type
-    hdr.name = name
-    return hdr, data_blob, next_blob
+        name, = struct.unpack_from('<H', hdr, offs + 2)
+        return name, offs + 4
+
+    return read_utf16z(hdr, offs, intern=True)
+
+def iter_prelink_resources(buffer):
+    """Iterate over the entries of a `.res` file.
+
+    Yields `(type, name, lang, header, data)` for each entry, including
+    the leading empty entry of type 0. The `buffer` is walked with an
+    offset cursor; if it supports the buffer protocol (bytes, mmap), it is
+    wrapped in a memoryview and `data` is a view into it, otherwise
+    `data` is a slice of `buffer`.
+    """
+
+    try:
+        buffer = memoryview(buffer)
+    except TypeError:
+        pass
+
+    offs = 0
+    size = len(buffer)
+    while offs < size:
+        if size - offs < _RES_HEADER_SIZES.size:
+            raise RuntimeError('truncated header')
+
+        hdr_sizes = _RES_HEADER_SIZES.unpack_from(bytes(buffer[offs:offs + _RES_HEADER_SIZES.size]))
+        if hdr_sizes.HeaderSize < hdr_sizes.size:
+            raise RuntimeError('corrupted header')
+
+        hdr_start = offs + hdr_sizes.size
+        data_start = offs + hdr_sizes.HeaderSize
+        data_stop = data_start + hdr_sizes.DataSize
+        if data_stop > size:
+            raise RuntimeError('truncated resource data')
+
+        hdr_blob = bytes(buffer[hdr_start:data_start])
+        type, name_offs = _parse_prelink_name(hdr_blob, 0)
+        name, name_offs = _parse_prelink_name(hdr_blob, name_offs)
+
+        hdr = _RES_HEADER.unpack_from(hdr_blob, align4(name_offs))
+        hdr.type = type
+        hdr.name = name
+
+        yield type, name, hdr.LanguageId, hdr, buffer[data_start:data_stop]
+        offs = align4(data_stop)
 
 def parse_prelink_resources(blob):
     r = {}
-    while blob:
-        hdr, data, blob = _parse_one_prelink_res(blob)
-        r.setdefault(hdr.type, {}).setdefault(hdr.name, {})[hdr.LanguageId] = data
+    for type, name, lang, hdr, data in iter_prelink_resources(blob):
+        r.setdefault(type, {}).setdefault(name, {})[lang] = data
 
     if 0 in r:
         del r[0]
     return r
 
 def parse_pe_resources(blob, base):
-    def parse_string(offs):
-        hdr = _STRING_HEADER.unpack_from(blob[offs:])
-        return bytes(blob[offs+_STRING_HEADER.size:offs+_STRING_HEADER.size+hdr.Length*2]).decode('utf-16le')
+    return _parse_pe_resources(blob, base, None)
 
-    def parse_data(offs):
-        entry = _RESOURCE_DATA_ENTRY.unpack_from(blob[offs:])
+def parse_pe_resources_layout(blob, base):
+    """Parse a resource section and remember where its entries are.
 
-        if entry.DataRva < base:
-            raise RuntimeError('resource is outside the resource blob')
+    Returns a tuple `(resources, layout)`. Pass the (possibly edited)
+    resource tree to `layout.update` to get a new section that keeps
+    the original directory tables and payload offsets.
+    """
 
-        if entry.DataRva + entry.Size - base > len(blob):
-            raise RuntimeError('resource is outside the resource blob')
+    layout = _ResourceLayout(blob, base)
+    return _parse_pe_resources(blob, base, layout), layout
 
-        return blob[entry.DataRva - base:entry.DataRva + entry.Size - base]
+def _read_directory(blob, offs):
+    node = _RESOURCE_DIRECTORY_TABLE.unpack_from(blob, offs)
+    count = node.NumberOfNameEntries + node.NumberOfIdEntries
 
-    def parse_tree(offs):
-        r = {}
+    start = offs + node.size
+    stop = start + count * _RESOURCE_DIRECTORY_ENTRY.size
+    entries = list(struct.iter_unpack('<II', bytes(blob[start:stop])))
+    if len(entries) != count:
+        raise RuntimeError('resource directory is outside the resource blob')
+    return node, entries, stop
+
+def _parse_data_entry(blob, base, offs):
+    entry = _RESOURCE_DATA_ENTRY.unpack_from(blob, offs)
+
+    if entry.DataRva < base:
+        raise RuntimeError('resource is outside the resource blob')
+
+    if entry.DataRva + entry.Size - base > len(blob):
+        raise RuntimeError('resource is outside the resource blob')
+
+    return entry, blob[entry.DataRva - base:entry.DataRva + entry.Size - base]
+
+def _find_directory_entry(blob, offs, key):
+    _, entries, _ = _read_directory(blob, offs)
+    if not entries:
+        return None
+
+    if key is None:
+        return entries[0][1]
+
+    for name_or_id, entry_offs in entries:
+        if name_or_id & (1<<31):
+            if isinstance(key, str) and read_utf16_prefixed(blob, name_or_id & ~(1<<31))[0] == key:
+                return entry_offs
+        elif name_or_id == key:
+            return entry_offs
+    return None
+
+def find_pe_resource(blob, base, type, name=None, langs=()):
+    """Find a single resource without parsing the whole resource tree.
 
-        fin = BlobIO(blob[offs:])
+    Only the directories on the way to the resource are read. If `name`
+    is None, the first name is used. The languages in `langs` are tried
+    in order; if none is present, the last language is used.
 
-        node = _RESOURCE_DIRECTORY_TABLE.unpack_from_io(fin)
-        name_entries = [_RESOURCE_DIRECTORY_ENTRY.unpack_from_io(fin) for i in range(node.NumberOfNameEntries)]
-        id_entries = [_RESOURCE_DIRECTORY_ENTRY.unpack_from_io(fin) for i in range(node.NumberOfIdEntries)]
+    Returns the payload or None if there is no such resource.
+    """
 
-        for entry in name_entries:
-            name = parse_string(entry.NameOrId & ~(1<<31))
-            if entry.Offset & (1<<31):
-                r[name] = parse_tree(entry.Offset & ~(1<<31))
+    offs = 0
+    for key in (type, name):
+        offs = _find_directory_entry(blob, offs, key)
+        if offs is None or not offs & (1<<31):
+            return None
+        offs &= ~(1<<31)
+
+    _, entries, _ = _read_directory(blob, offs)
+    if not entries:
+        return None
+
+    lang_offs = dict(entries)
+    for lang in langs:
+        offs = lang_offs.get(lang)
+        if offs is not None:
+            break
+    else:
+        offs = entries[-1][1]
+
+    if offs & (1<<31):
+        return None
+    _, data = _parse_data_entry(blob, base, offs)
+    return data
+
+def parse_pe_resource_type(blob, base, type):
+    """Parse the resources of a single type.
+
+    Returns a dict `{name: {lang: payload}}` or None if there are no
+    resources of the type.
+    """
+
+    offs = _find_directory_entry(blob, 0, type)
+    if offs is None or not offs & (1<<31):
+        return None
+    return _parse_pe_resources(blob, base, None, offs & ~(1<<31), (type,))
+
+def _parse_pe_resources(blob, base, layout, offs=0, path=()):
+    def parse_string(offs):
+        name, end = read_utf16_prefixed(blob, offs, intern=True)
+        if layout is not None:
+            layout._add_struct(offs, end - offs)
+        return name
+
+    def parse_data(offs, path):
+        entry, data = _parse_data_entry(blob, base, offs)
+        if layout is not None:
+            layout._add_leaf(path, offs, entry, data)
+        return data
+
+    def parse_tree(offs, path):
+        r = {}
+
+        node, entries, end = _read_directory(blob, offs)
+        if layout is not None:
+            layout._add_dir(path, offs, end - offs)
+
+        for i, (name_or_id, entry_offs) in enumerate(entries):
+            if i < node.NumberOfNameEntries:
+                name = parse_string(name_or_id & ~(1<<31))
             else:
-                r[name] = parse_data(entry.Offset)
+                name = name_or_id
 
-        for entry in id_entries:
-            if entry.Offset & (1<<31):
-                r[entry.NameOrId] = parse_tree(entry.Offset & ~(1<<31))
+            if entry_offs & (1<<31):
+                r[name] = parse_tree(entry_offs & ~(1<<31), path + (name,))
             else:
-                r[entry.NameOrId] = parse_data(entry.Offset)
+                r[name] = parse_data(entry_offs, path + (name,))
 
         return r
 
-    return parse_tree(0)
+    return parse_tree(offs, path)
+
+class _ResourceLayout:
+    def __init__(self, blob, base):
+        self._blob = blob
+        self._base = base
+        self._dirs = set()
+        self._leaves = {}
+        self._struct_end = 0
+
+    def _add_struct(self, offs, size):
+        self._struct_end = max(self._struct_end, offs + size)
+
+    def _add_dir(self, path, offs, size):
+        self._dirs.add(path)
+        self._add_struct(offs, size)
+
+    def _add_leaf(self, path, offs, entry, data):
+        self._leaves[path] = (offs, entry, data)
+        self._add_struct(offs, _RESOURCE_DATA_ENTRY.size)
+
+    def iter_data_entries(self):
+        """Yield `(path, entry)` for each leaf, where `path` is the tuple
+        `(type, name, lang)` and `entry` the `_RESOURCE_DATA_ENTRY`."""
+
+        for path, (_, entry, _) in self._leaves.items():
+            yield path, entry
+
+    def _exclusive_leaves(self):
+        # Payloads that share bytes with a directory structure or another
+        # payload must not be overwritten in place.
+        ranges = sorted((
+            (entry.DataRva - self._base, entry.DataRva - self._base + entry.Size, path)
+            for path, (_, entry, _) in self._leaves.items()),
+            key=lambda rng: rng[:2])
+
+        r = set()
+        prev_end = self._struct_end
+        for i, (start, end, path) in enumerate(ranges):
+            next_start = ranges[i+1][0] if i + 1 < len(ranges) else end
+            if prev_end <= start and end <= next_start:
+                r.add(path)
+            prev_end = max(prev_end, end)
+        return r
+
+    def update(self, rsrc):
+        """Return the resource section with the contents of `rsrc`.
+
+        Only the data entries of payloads that were replaced are
+        rewritten. Payloads that fit into their original place are
+        written there, others are appended to the end of the section.
+
+        Returns None if entries were added or removed, in which case
+        the directory tables must be rebuilt with `pe_resources_prepack`.
+        """
+
+        dirs = set()
+        leaves = {}
+        def walk(node, path):
+            if isinstance(node, dict):
+                dirs.add(path)
+                for k, v in node.items():
+                    walk(v, path + (k,))
+            else:
+                leaves[path] = node
+        walk(rsrc, ())
+
+        if dirs != self._dirs or leaves.keys() != self._leaves.keys():
+            return None
+
+        exclusive = self._exclusive_leaves()
+        patches = []
+        appended = []
+        section_size = len(self._blob)
+        data_offs = align8(section_size)
+
+        for path, data in leaves.items():
+            offs, entry, orig_data = self._leaves[path]
+            if data is orig_data:
+                continue
+
+            new_entry = _RESOURCE_DATA_ENTRY(entry, Size=len(data))
+            if len(data) <= entry.Size and path in exclusive:
+                start = entry.DataRva - self._base
+                patches.append((start, rope(data, b'\0' * (entry.Size - len(data)))))
+            else:
+                new_entry.DataRva = self._base + data_offs
+                appended.append(data)
+                aligned_size = align8(len(data))
+                if aligned_size != len(data):
+                    appended.append(b'\0' * (aligned_size - len(data)))
+                data_offs += aligned_size
+
+            patches.append((offs, new_entry.pack()))
+
+        patches.sort(key=lambda patch: patch[0])
+
+        chunks = []
+        pos = 0
+        for offs, data in patches:
+            chunks.append(self._blob[pos:offs])
+            chunks.append(data)
+            pos = offs + len(data)
+        chunks.append(self._blob[pos:])
+
+        if appended:
+            chunks.append(b'\0' * (align8(section_size) - section_size))
+            chunks.extend(appended)
+
+        return _join_chunks(chunks)
 
 class _PrepackedResources:
-    def __init__(self, entries, strings, blobs):
-        self._entries = entries
+    def __init__(self, table, strings, data_entries, blobs):
+        self._table = table
         self._strings = strings
+        self._data_entries = data_entries
         self._blobs = blobs
 
-        self.size = sum(ent.size for ent in self._entries) + len(strings) + len(blobs)
+        self.size = len(table) + len(strings) + sum(align8(len(blob)) for blob in blobs)
+
+    def with_blobs(self, blobs):
+        """Return the same layout with different payloads.
+
+        The payloads are matched to data entries by their position
+        in the layout, i.e. in the pre-order of the tree.
+        """
+
+        if len(blobs) != len(self._data_entries):
+            raise ValueError('the number of payloads does not match the layout')
+        return _PrepackedResources(self._table, self._strings, self._data_entries, blobs)
 
     def pack(self, base):
-        def _transform(ent):
-            if not isinstance(ent, _RESOURCE_DATA_ENTRY):
-                return ent
-            return _RESOURCE_DATA_ENTRY(ent, DataRva=ent.DataRva + base)
-
-        ents = [_transform(ent).pack() for ent in self._entries]
-        return b''.join(ents) + self._strings + bytes(self._blobs)
-
-def _prepack(rsrc):
-    if isinstance(rsrc, dict):
-        name_keys = [key for key in rsrc.keys() if isinstance(key, str)]
-        id_keys = [key for key in rsrc.keys() if not isinstance(key, str)]
-
-        name_keys.sort()
-        id_keys.sort()
-
-        r = []
-        children = []
-
-        r.append(_RESOURCE_DIRECTORY_TABLE(
-            Characteristics=0,
-            Timestamp=0,
-            Major=0,
-            Minor=0,
-            NumberOfNameEntries=len(name_keys),
-            NumberOfIdEntries=len(id_keys),
-            ))
+        table = bytearray(self._table)
+        chunks = []
 
-        for keys in (name_keys, id_keys):
-            for name in keys:
-                items = _prepack(rsrc[name])
-                children.extend(items)
-                r.append(_RESOURCE_DIRECTORY_ENTRY(
-                    NameOrId=name,
-                    Offset=items[0]
-                    ))
-
-        r.extend(children)
-        return r
-    else:
-        return [_RESOURCE_DATA_ENTRY(
-            DataRva=rsrc,
-            Size=len(rsrc),
-            Codepage=0,
-            Reserved=0
-            )]
+        data_offs = len(table) + len(self._strings)
+        for offs, blob in zip(self._data_entries, self._blobs):
+            struct.pack_into('<II', table, offs, base + data_offs, len(blob))
+
+            chunks.append(blob)
+            aligned_size = align8(len(blob))
+            pad = aligned_size - len(blob)
+            if pad:
+                chunks.append(b'\0' * pad)
+
+            data_offs += aligned_size
+
+        return rope(bytes(table), self._strings, _join_chunks(chunks))
+
+def _join_chunks(chunks, group_size=1024):
+    # Building a rope from many chunks at once is quadratic in the number
+    # of chunks, concatenating ropes of bounded size is not.
+    groups = [rope(*chunks[i:i+group_size]) for i in range(0, len(chunks), group_size)]
+    return rope(*groups)
+
+def _sorted_keys(node):
+    name_keys = sorted(key for key in node.keys() if isinstance(key, str))
+    id_keys = sorted(key for key in node.keys() if not isinstance(key, str))
+    return name_keys, id_keys
 
 def pe_resources_prepack(rsrc):
-    entries = _prepack(rsrc)
+    """Lay out a resource tree as a resource section.
+
+    The tree is laid out in a single pass: directory tables in pre-order,
+    followed by the name strings, followed by the payloads. The payloads
+    are not copied, the returned object references the original buffers.
+    """
+
+    table = bytearray()
+    data_entries = []
+    blobs = []
+    names = []
 
     strings = []
     string_map = {}
+    strings_len = 0
+
     def add_string(s):
+        nonlocal strings_len
+
         r = string_map.get(s)
         if r is None:
             encoded = s.encode('utf-16le')
 
-            r = sum(len(ss) for ss in strings)
+            r = strings_len
             string_map[s] = r
 
             strings.append(_STRING_HEADER(Length=len(encoded)//2).pack())
             strings.append(encoded)
+            strings_len += _STRING_HEADER.size + len(encoded)
         return r
 
-    _entry_offsets = {}
-    offs = 0
-    for ent in entries:
-        _entry_offsets[ent] = offs
-        offs += ent.size
+    def layout(node):
+        offs = len(table)
+        if not isinstance(node, dict):
+            data_entries.append(offs)
+            blobs.append(node)
+            table.extend(bytes(_RESOURCE_DATA_ENTRY.size))
+            return offs
 
-    table_size = offs
-    for ent in entries:
-        if isinstance(ent, _RESOURCE_DIRECTORY_ENTRY):
-            if isinstance(ent.NameOrId, str):
-                ent.NameOrId = (1<<31) | (table_size + add_string(ent.NameOrId))
+        name_keys, id_keys = _sorted_keys(node)
 
-    strings = b''.join(strings)
-    aligned_strings_len = align16(len(strings))
-    strings += b'\0' * (aligned_strings_len - len(strings))
+        table.extend(_RESOURCE_DIRECTORY_TABLE(
+            NumberOfNameEntries=len(name_keys),
+            NumberOfIdEntries=len(id_keys),
+            ).pack())
 
-    data_offs = table_size + len(strings)
-    blobs = []
+        entry_offs = len(table)
+        table.extend(bytes(_RESOURCE_DIRECTORY_ENTRY.size * (len(name_keys) + len(id_keys))))
+
+        for name in name_keys:
+            names.append((entry_offs, add_string(name)))
+            entry_offs += _RESOURCE_DIRECTORY_ENTRY.size
+
+        entry_offs = offs + _RESOURCE_DIRECTORY_TABLE.size
+        for keys in (name_keys, id_keys):
+            for name in keys:
+                child = node[name]
+                child_offs = layout(child)
+                if isinstance(child, dict):
+                    child_offs |= 1<<31
 
-    for ent in entries:
-        if isinstance(ent, _RESOURCE_DIRECTORY_ENTRY):
-            if isinstance(ent.Offset, _RESOURCE_DIRECTORY_TABLE):
-                ent.Offset = (1<<31) | _entry_offsets[ent.Offset]
+                struct.pack_into('<II', table, entry_offs, 0 if isinstance(name, str) else name, child_offs)
+                entry_offs += _RESOURCE_DIRECTORY_ENTRY.size
+
+        return offs
+
+    layout(rsrc)
+
+    table_size = len(table)
+    for offs, string_offs in names:
+        struct.pack_into('<I', table, offs, (1<<31) | (table_size + string_offs))
+
+    strings.append(b'\0' * (align16(strings_len) - strings_len))
+    strings = b''.join(strings)
+
+    return _PrepackedResources(bytes(table), strings, data_entries, blobs)
+
+class PrepackCache:
+    """Cache of resource section layouts.
+
+    The directory tables and name strings of a resource section only
+    depend on the shape of the tree, i.e. on its types, names and
+    languages, not on the payloads. The cache keeps the layouts of
+    recently packed shapes, keyed by a digest of the shape, so that packing
+    a tree that only differs in payloads (e.g. in the version info)
+    only has to place the payloads.
+    """
+
+    def __init__(self, max_entries=64):
+        self._max_entries = max_entries
+        self._layouts = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def prepack(self, rsrc):
+        import hashlib
+
+        h = hashlib.blake2b(digest_size=16)
+        blobs = []
+
+        def walk(node):
+            if not isinstance(node, dict):
+                h.update(b'L')
+                blobs.append(node)
+                return
+
+            name_keys, id_keys = _sorted_keys(node)
+            h.update(struct.pack('<BHH', ord('D'), len(name_keys), len(id_keys)))
+            for name in name_keys:
+                encoded = name.encode('utf-16le')
+                h.update(struct.pack('<I', len(encoded)))
+                h.update(encoded)
+                walk(node[name])
+            for name in id_keys:
+                h.update(struct.pack('<I', name))
+                walk(node[name])
+
+        walk(rsrc)
+        key = h.digest()
+
+        with self._lock:
+            layout = self._layouts.get(key)
+            if layout is not None:
+                self.hits += 1
+                self._layouts.move_to_end(key)
             else:
-                ent.Offset = _entry_offsets[ent.Offset]
-        elif isinstance(ent, _RESOURCE_DATA_ENTRY):
-            blob = ent.DataRva
-            ent.DataRva = data_offs
+                self.misses += 1
 
-            blobs.append(blob)
-            aligned_size = align8(len(blob))
-            pad = aligned_size - len(blob)
-            if pad:
-                blobs.append(b'\0' * pad)
+        if layout is not None:
+            return layout.with_blobs(blobs)
 
-            data_offs += aligned_size
+        prepacked = pe_resources_prepack(rsrc)
 
-    return _PrepackedResources(entries, strings, rope(*blobs))
+        # Only keep the layout, the payloads may reference files
+        # that will be closed by the time the layout is reused.
+        with self._lock:
+            self._layouts[key] = prepacked.with_blobs([b''] * len(blobs))
+            while len(self._layouts) > self._max_entries:
+                self._layouts.popitem(last=False)
+        return prepacked
@@ -0,0 +1,243 @@
+from array import array
+from bisect import bisect_right
+import struct
+from .struct3 import Struct3, u16, u32
+from .strings import read_utf16_prefixed
+
+class _MESSAGE_RESOURCE_BLOCK(Struct3):
+    LowId: u32
+    HighId: u32
+    OffsetToEntries: u32
+
+class _MESSAGE_RESOURCE_ENTRY(Struct3):
+    Length: u16
+    Flags: u16
+
+MESSAGE_RESOURCE_ANSI = 0
+MESSAGE_RESOURCE_UNICODE = 1
+MESSAGE_RESOURCE_UTF8 = 2
+
+# ANSI code pages of primary languages, languages not listed use 1252.
+_PRIMARY_LANG_CODEPAGES = {
+    0x01: 1256, # Arabic
+    0x02: 1251, # Bulgarian
+    0x04: 936,  # Chinese (Simplified)
+    0x05: 1250, # Czech
+    0x08: 1253, # Greek
+    0x0d: 1255, # Hebrew
+    0x0e: 1250, # Hungarian
+    0x11: 932,  # Japanese
+    0x12: 949,  # Korean
+    0x15: 1250, # Polish
+    0x18: 1250, # Romanian
+    0x19: 1251, # Russian
+    0x1a: 1250, # Croatian, Serbian and Bosnian (Latin)
+    0x1b: 1250, # Slovak
+    0x1c: 1250, # Albanian
+    0x1e: 874,  # Thai
+    0x1f: 1254, # Turkish
+    0x20: 1256, # Urdu
+    0x22: 1251, # Ukrainian
+    0x23: 1251, # Belarusian
+    0x24: 1250, # Slovenian
+    0x25: 1257, # Estonian
+    0x26: 1257, # Latvian
+    0x27: 1257, # Lithuanian
+    0x29: 1256, # Persian
+    0x2a: 1258, # Vietnamese
+    0x2c: 1254, # Azerbaijani (Latin)
+    0x2f: 1251, # Macedonian
+    0x3f: 1251, # Kazakh
+    0x40: 1251, # Kyrgyz
+    0x43: 1254, # Uzbek (Latin)
+    0x44: 1251, # Tatar
+    0x50: 1251, # Mongolian
+    }
+
+# Languages whose code page differs from that of their primary language.
+_LANG_CODEPAGES = {
+    0x0404: 950,  # Chinese (Taiwan)
+    0x0c04: 950,  # Chinese (Hong Kong)
+    0x1404: 950,  # Chinese (Macao)
+    0x0c1a: 1251, # Serbian (Cyrillic, Serbia and Montenegro)
+    0x1c1a: 1251, # Serbian (Cyrillic, Bosnia and Herzegovina)
+    0x201a: 1251, # Bosnian (Cyrillic)
+    0x281a: 1251, # Serbian (Cyrillic, Serbia)
+    0x301a: 1251, # Serbian (Cyrillic, Montenegro)
+    0x082c: 1251, # Azerbaijani (Cyrillic)
+    0x0843: 1251, # Uzbek (Cyrillic)
+    }
+
+def ansi_codepage(lang):
+    """Return the ANSI code page Windows uses for the language id `lang`.
+
+    Neutral and unknown languages get 1252.
+    """
+
+    r = _LANG_CODEPAGES.get(lang)
+    if r is None:
+        r = _PRIMARY_LANG_CODEPAGES.get(lang & 0x3ff, 1252)
+    return r
+
+def _lookup(tables, id, langs):
+    for lang in langs:
+        table = tables.get(lang)
+        if table is not None:
+            r = table.get(id)
+            if r is not None:
+                return r
+
+    for table in tables.values():
+        r = table.get(id)
+        if r is not None:
+            return r
+    return None
+
+class _StringBundle:
+    def __init__(self, blob):
+        self._blob = bytes(blob)
+        self._strings = None
+
+    def get(self, idx):
+        if self._strings is None:
+            strings = []
+            offs = 0
+            for _ in range(16):
+                if offs >= len(self._blob):
+                    break
+                s, offs = read_utf16_prefixed(self._blob, offs)
+                strings.append(s)
+            self._strings = strings
+
+        if idx >= len(self._strings):
+            return None
+        return self._strings[idx] or None
+
+class _LangStringTable:
+    def __init__(self):
+        self._bundles = {}
+
+    def get(self, id):
+        bundle_id = (id >> 4) + 1
+        bundle = self._bundles.get(bundle_id)
+        if bundle is None:
+            return None
+
+        if not isinstance(bundle, _StringBundle):
+            bundle = _StringBundle(bundle)
+            self._bundles[bundle_id] = bundle
+        return bundle.get(id & 0xf)
+
+class StringTable:
+    """Index of the strings in RT_STRING resources.
+
+    Strings are stored in bundles of 16, the bundle with name `n`
+    contains the strings with ids `(n - 1) * 16` through `n * 16 - 1`.
+    A bundle is only decoded when one of its strings is looked up.
+    """
+
+    def __init__(self, resources):
+        self._langs = {}
+        for name, langs in resources.items():
+            if not isinstance(name, int):
+                continue
+            for lang, blob in langs.items():
+                self._langs.setdefault(lang, _LangStringTable())._bundles[name] = blob
+
+    def languages(self):
+        return list(self._langs)
+
+    def get(self, id, langs=(0x0409, 0)):
+        """Return the string with the given id or None if there is none.
+
+        The languages in `langs` are tried first, then all others.
+        """
+
+        return _lookup(self._langs, id, langs)
+
+class _MessageBlock:
+    def __init__(self, blob, hdr, codepage):
+        self.low_id = hdr.LowId
+        self.high_id = hdr.HighId
+        self._blob = blob
+        self._codepage = codepage
+        self._offs = hdr.OffsetToEntries
+        self._entries = None
+
+    def get(self, id):
+        if self._entries is None:
+            entries = array('I')
+            offs = self._offs
+            for _ in range(self.high_id - self.low_id + 1):
+                entries.append(offs)
+                ent = _MESSAGE_RESOURCE_ENTRY.unpack_from(self._blob, offs)
+                if ent.Length < ent.size:
+                    raise RuntimeError('corrupted message table entry')
+                offs += ent.Length
+            self._entries = entries
+
+        offs = self._entries[id - self.low_id]
+        ent = _MESSAGE_RESOURCE_ENTRY.unpack_from(self._blob, offs)
+        text = self._blob[offs + ent.size:offs + ent.Length]
+        if ent.Flags == MESSAGE_RESOURCE_UNICODE:
+            text = text.decode('utf-16le')
+        elif ent.Flags == MESSAGE_RESOURCE_UTF8:
+            text = text.decode('utf-8')
+        else:
+            text = text.decode('cp{}'.format(self._codepage), errors='replace')
+        return text.rstrip('\0')
+
+class _LangMessageTable:
+    def __init__(self, codepage):
+        self._codepage = codepage
+        self._blocks = []
+        self._low_ids = array('I')
+
+    def _add(self, blob):
+        blob = bytes(blob)
+        count, = struct.unpack_from('<I', blob)
+        blocks = [_MESSAGE_RESOURCE_BLOCK.unpack_from(blob, 4 + i * _MESSAGE_RESOURCE_BLOCK.size) for i in range(count)]
+
+        self._blocks.extend(_MessageBlock(blob, hdr, self._codepage) for hdr in blocks)
+        self._blocks.sort(key=lambda block: block.low_id)
+        self._low_ids = array('I', (block.low_id for block in self._blocks))
+
+    def get(self, id):
+        i = bisect_right(self._low_ids, id) - 1
+        if i < 0:
+            return None
+
+        block = self._blocks[i]
+        if id > block.high_id:
+            return None
+        return block.get(id)
+
+class MessageTable:
+    """Index of the messages in RT_MESSAGETABLE resources.
+
+    Messages are stored in blocks of consecutive ids sorted by the first
+    id, the block containing an id is found by bisection. The entries
+    of a block are indexed and decoded on first access. ANSI messages
+    are decoded with the ANSI code page of their resource's language,
+    see `ansi_codepage`.
+    """
+
+    def __init__(self, resources):
+        self._langs = {}
+        for name, langs in resources.items():
+            for lang, blob in langs.items():
+                table = self._langs.get(lang)
+                if table is None:
+                    table = self._langs[lang] = _LangMessageTable(ansi_codepage(lang))
+                table._add(blob)
+
+    def languages(self):
+        return list(self._langs)
+
+    def get(self, id, langs=(0x0409, 0)):
+        """Return the message with the given id or None if there is none.
+
+        The languages in `langs` are tried first, then all others.
+        """
+
+        return _lookup(self._langs, id, langs)
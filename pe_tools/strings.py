@@ -0,0 +1,84 @@
+import struct, sys
+
+def find_bytes(buf, sub, start, end):
+    """Return the offset of the first `sub` in `buf[start:end]`, or -1.
+
+    `buf` can be bytes, an mmap, a memoryview or a rope.
+    """
+
+    find = getattr(buf, 'find', None)
+    if find is not None:
+        return find(sub, start, end)
+
+    # Buffers without `find` (memoryviews, ropes) are searched in windows
+    # of growing size, so that short strings only copy a few bytes.
+    window = 64
+    pos = start
+    while pos < end:
+        stop = min(pos + window, end)
+        chunk = bytes(buf[pos:stop])
+        i = chunk.find(sub)
+        if i >= 0:
+            return pos + i
+        if stop == end:
+            break
+        pos = stop - (len(sub) - 1)
+        window *= 2
+    return -1
+
+def find_utf16_nul(buf, start=0, end=None):
+    """Return the offset of the first UTF-16 NUL at or after `start`.
+
+    Only NULs at an even distance from `start` are considered. Returns -1
+    if there is none before `end`.
+    """
+
+    if end is None:
+        end = len(buf)
+
+    pos = start
+    while True:
+        pos = find_bytes(buf, b'\0\0', pos, end)
+        if pos < 0 or (pos - start) % 2 == 0:
+            return pos
+        pos += 1
+
+def read_utf16z(buf, offs, end=None, intern=False):
+    """Decode a NUL-terminated UTF-16LE string.
+
+    Returns the string and the offset just past the terminator.
+    """
+
+    zpos = find_utf16_nul(buf, offs, end)
+    if zpos < 0:
+        raise RuntimeError('missing null termination')
+    r = bytes(buf[offs:zpos]).decode('utf-16le')
+    return sys.intern(r) if intern else r, zpos + 2
+
+def read_utf16_prefixed(buf, offs, intern=False):
+    """Decode a UTF-16LE string prefixed by its length in characters.
+
+    Returns the string and the offset just past its last character.
+    """
+
+    length, = struct.unpack('<H', bytes(buf[offs:offs + 2]))
+    end = offs + 2 + length * 2
+    if end > len(buf):
+        raise RuntimeError('string is outside the blob')
+    r = bytes(buf[offs + 2:end]).decode('utf-16le')
+    return sys.intern(r) if intern else r, end
+
+def read_utf8z(buf, offs, end=None, intern=False):
+    """Decode a NUL-terminated UTF-8 string.
+
+    Returns the string and the offset just past the terminator.
+    """
+
+    if end is None:
+        end = len(buf)
+
+    zpos = find_bytes(buf, b'\0', offs, end)
+    if zpos < 0:
+        raise RuntimeError('missing null termination')
+    r = bytes(buf[offs:zpos]).decode('utf-8')
+    return sys.intern(r) if intern else r, zpos + 1
@@ -0,0 +1,146 @@
+import mmap, os, sys, tempfile, uuid
+from array import array
+from bisect import bisect_right
+from .struct3 import Struct3, char, u16, u32
+
+_SYMCACHE_MAGIC = b'PESYMC\x01\x00'
+
+class _SymbolCacheHeader(Struct3):
+    magic: char[8]
+    guid: char[16]
+    age: u32
+    machine: u16
+    _reserved: u16
+    count: u32
+    names_size: u32
+
+def symbol_cache_path(cache_dir, guid, age):
+    """Return the path of the symbol cache of the PDB with the given
+    GUID and age within `cache_dir`."""
+
+    return os.path.join(cache_dir, '{}{:X}.pesym'.format(guid.hex.upper(), age))
+
+def export_symbol_cache(pdb, fname):
+    """Write the public symbols of a PdbFile to a symbol cache file.
+
+    The file holds the mapped public symbols sorted by RVA: an array of
+    RVAs, an array of offsets into the name blob and the name blob, along
+    with the GUID, age and machine type of the PDB. It is written to
+    a temporary file first and moved into place.
+    """
+
+    publics = pdb.get_public_symbols()
+    cols = pdb.get_public_columns()
+
+    rvas = array('I', cols.rvas)
+    name_offsets = array('I', [0])
+    names = bytearray()
+    for idx in cols.order:
+        names += publics.get_name(idx).encode('utf-8')
+        name_offsets.append(len(names))
+
+    if sys.byteorder != 'little':
+        rvas.byteswap()
+        name_offsets.byteswap()
+
+    hdr = _SymbolCacheHeader(
+        magic=_SYMCACHE_MAGIC,
+        guid=pdb.get_guid().bytes_le,
+        age=pdb.get_age(),
+        machine=pdb.machine_type(),
+        count=len(rvas),
+        names_size=len(names))
+
+    fd, tmp_name = tempfile.mkstemp(dir=os.path.dirname(fname) or '.')
+    try:
+        with os.fdopen(fd, 'wb') as fout:
+            fout.write(hdr.pack())
+            fout.write(rvas.tobytes())
+            fout.write(name_offsets.tobytes())
+            fout.write(names)
+        os.replace(tmp_name, fname)
+    except:
+        os.remove(tmp_name)
+        raise
+
+def _u32_array(buf):
+    if sys.byteorder == 'little':
+        return buf.cast('I')
+    r = array('I', buf)
+    r.byteswap()
+    return r
+
+class SymbolCache:
+    """Public symbols served from a mapped symbol cache file.
+
+    Opening a cache only reads its header, lookups read the mapped
+    arrays in place. Processes mapping the same file share its pages.
+    """
+
+    def __init__(self, blob):
+        hdr = _SymbolCacheHeader.unpack_from(blob)
+        if hdr.magic != _SYMCACHE_MAGIC:
+            raise RuntimeError('not a symbol cache file')
+
+        count = hdr.count
+        offs = hdr.size
+        view = memoryview(blob)
+        end = offs + 8 * count + 4 + hdr.names_size
+        if len(view) < end:
+            raise RuntimeError('truncated symbol cache file')
+
+        self._blob = blob
+        self.guid = uuid.UUID(bytes_le=hdr.guid)
+        self.age = hdr.age
+        self.machine = hdr.machine
+        self._rvas = _u32_array(view[offs:offs + 4 * count])
+        offs += 4 * count
+        self._name_offsets = _u32_array(view[offs:offs + 4 * (count + 1)])
+        offs += 4 * (count + 1)
+        self._names = view[offs:end]
+
+    def __len__(self):
+        return len(self._rvas)
+
+    def close(self):
+        self._rvas = self._name_offsets = self._names = None
+        if isinstance(self._blob, mmap.mmap):
+            self._blob.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def get_rva(self, idx):
+        return self._rvas[idx]
+
+    def get_name(self, idx):
+        return bytes(self._names[self._name_offsets[idx]:self._name_offsets[idx + 1]]).decode('utf-8')
+
+    def find_by_rva(self, rva):
+        """Return `(name, displacement)` for the nearest symbol at or
+        before `rva`, or None if there is none."""
+
+        i = bisect_right(self._rvas, rva) - 1
+        if i < 0:
+            return None
+        return self.get_name(i), rva - self._rvas[i]
+
+def open_symbol_cache(fname):
+    """Map a symbol cache file into memory and return a SymbolCache."""
+
+    with open(fname, 'rb') as fin:
+        return SymbolCache(mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ))
+
+def find_symbol_cache(cache_dir, link):
+    """Open the symbol cache for the PDB referred to by a CodeviewLink.
+
+    Returns None if `cache_dir` has no cache for the PDB.
+    """
+
+    try:
+        return open_symbol_cache(symbol_cache_path(cache_dir, link.guid, link.age))
+    except FileNotFoundError:
+        return None
@@ -0,0 +1,193 @@
+import argparse, errno, os, shutil, sys, time
+from concurrent.futures import ThreadPoolExecutor
+import grope
+from .pe_parser import parse_pe, PeIdent
+from .pdb import open_pdb, pdb_signature
+
+
+class _Artifact:
+    def __init__(self, fname, kind, key, size, link=None):
+        self.fname = fname
+        self.kind = kind
+        self.key = key
+        self.size = size
+        self.link = link
+
+
+def _reflink(src, dst):
+    try:
+        import fcntl
+    except ImportError:
+        return False
+
+    FICLONE = 0x40049409
+    with open(src, "rb") as fin, open(dst, "wb") as fout:
+        try:
+            fcntl.ioctl(fout.fileno(), FICLONE, fin.fileno())
+            return True
+        except OSError:
+            pass
+    os.remove(dst)
+    return False
+
+
+def _link_or_copy(src, dst):
+    """Hardlink `src` to `dst`, fall back to a reflink, then to a copy."""
+
+    try:
+        os.link(src, dst)
+        return "link"
+    except FileExistsError:
+        return "exists"
+    except OSError as e:
+        if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP):
+            raise
+
+    if _reflink(src, dst):
+        return "reflink"
+    shutil.copyfile(src, dst)
+    return "copy"
+
+
+def _read_pdb_artifact(fname, size):
+    # Only the superblock, the stream directory, the info stream and the
+    # DBI stream header are read.
+    pdb = open_pdb(fname)
+    key = "{}{:X}".format(pdb.get_guid().hex.upper(), pdb.get_age())
+    return _Artifact(fname, "pdb", key, size)
+
+
+def _read_pe_artifact(fname, size):
+    # The file is read through a rope, so only the headers and the debug
+    # directory are actually read.
+    with open(fname, "rb") as fin:
+        pe = parse_pe(grope.wrap_io(fin))
+        ident = PeIdent(
+            image_name=os.path.basename(fname),
+            timestamp=pe.file_header.TimeDateStamp,
+            size_of_image=pe.optional_header.SizeOfImage,
+        )
+        link = pe.get_codeview_link()
+
+    _, key = ident.pelink.split("/")
+    return _Artifact(fname, "pe", key, size, link)
+
+
+def read_artifact(fname):
+    """Identify a PE or PDB file for a symbol store.
+
+    Returns an object with `kind` ('pe' or 'pdb') and `key`, the name of
+    the directory the file is stored under: GUID and age for PDBs,
+    timestamp and image size for PE files. For PE files, `link` holds the
+    CodeviewLink, if any. Returns None for other files.
+    """
+
+    size = os.path.getsize(fname)
+    with open(fname, "rb") as fin:
+        magic = fin.read(len(pdb_signature))
+
+    if magic == pdb_signature:
+        return _read_pdb_artifact(fname, size)
+    if magic[:2] == b"MZ":
+        return _read_pe_artifact(fname, size)
+    return None
+
+
+def store_artifact(store, artifact):
+    """Place an artifact into the store as `name/KEY/name`.
+
+    Returns the method used to place the file: 'link', 'reflink', 'copy',
+    or 'exists' if the file is already stored.
+    """
+
+    name = os.path.basename(artifact.fname)
+    dirname = os.path.join(store, name, artifact.key)
+    os.makedirs(dirname, exist_ok=True)
+    return _link_or_copy(artifact.fname, os.path.join(dirname, name))
+
+
+def _iter_files(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, fnames in os.walk(path):
+                for fname in fnames:
+                    yield os.path.join(root, fname)
+        else:
+            yield path
+
+
+def _ingest_one(store, fname):
+    artifact = read_artifact(fname)
+    if artifact is None:
+        return None, None
+    return artifact, store_artifact(store, artifact)
+
+
+def main():
+    ap = argparse.ArgumentParser(
+        fromfile_prefix_chars="@",
+        description="Adds PE and PDB files to a local symbol store.",
+    )
+    ap.add_argument("--jobs", "-j", type=int, help="number of files to process in parallel")
+    ap.add_argument("--quiet", "-q", action="store_true", help="only print the summary")
+    ap.add_argument("store", help="the root directory of the symbol store")
+    ap.add_argument("files", nargs="+", metavar="FILE", help="files or directories to ingest")
+    args = ap.parse_args()
+
+    fnames = list(_iter_files(args.files))
+
+    start = time.perf_counter()
+    failures = 0
+    artifacts = []
+    with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+        futures = [(fname, executor.submit(_ingest_one, args.store, fname)) for fname in fnames]
+        for fname, future in futures:
+            try:
+                artifact, method = future.result()
+            except Exception as e:
+                failures += 1
+                print("error: {}: {}".format(fname, e), file=sys.stderr)
+                continue
+
+            if artifact is None:
+                continue
+            artifacts.append(artifact)
+            if not args.quiet:
+                print("{} {}/{} ({})".format(artifact.kind, os.path.basename(fname), artifact.key, method))
+    elapsed = time.perf_counter() - start
+
+    # Match executables to the PDBs ingested along with them.
+    pdbs = {(os.path.basename(a.fname).lower(), a.key) for a in artifacts if a.kind == "pdb"}
+    pes = [a for a in artifacts if a.kind == "pe"]
+    matched = 0
+    for pe in pes:
+        link = pe.link
+        if link is None:
+            continue
+        key = "{}{:X}".format(link.guid.hex.upper(), link.age)
+        if (link.short_filename.lower(), key) in pdbs:
+            matched += 1
+        elif not args.quiet:
+            print("unmatched: {} -> {}".format(pe.fname, link.bxlink))
+
+    total_size = sum(a.size for a in artifacts)
+    print(
+        "{} files ({} PE, {} PDB, {} with matching PDB), {:.1f} MiB in {:.2f} s: {:.1f} files/s, {:.1f} MiB/s".format(
+            len(artifacts),
+            len(pes),
+            len(artifacts) - len(pes),
+            matched,
+            total_size / 2**20,
+            elapsed,
+            len(artifacts) / elapsed if elapsed else 0,
+            total_size / 2**20 / elapsed if elapsed else 0,
+        )
+    )
+    if failures:
+        print("{} files failed".format(failures), file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
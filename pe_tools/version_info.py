@@ -1,6 +1,6 @@
 from .struct3 import Struct3, u16, u32
 from .utils import align4
-from grope import rope
+from .strings import read_utf16z
 import struct
 
 class _VS_FIXEDFILEINFO(Struct3):
@@ -63,7 +63,37 @@ class _VerNode:
     def __init__(self, key, value, children):
         self.name = key
         self.value = value
-        self.children = children
+        self._children = children
+        self._index = None
+
+    @property
+    def children(self):
+        # The caller may modify the list, so the index is rebuilt by the
+        # next `find`.
+        self._index = None
+        return self._children
+
+    @children.setter
+    def children(self, children):
+        self._children = children
+        self._index = None
+
+    def find(self, name):
+        if self._index is None:
+            index = {}
+            for child in self._children:
+                index.setdefault(child.name, child)
+            self._index = index
+        return self._index.get(name)
+
+    def append(self, child):
+        self._children.append(child)
+        if self._index is not None:
+            self._index.setdefault(child.name, child)
+
+    def remove(self, child):
+        self._children.remove(child)
+        self._index = None
 
 class VersionInfo:
     def __init__(self, root=None):
@@ -76,11 +106,8 @@ class VersionInfo:
 
         cur = self._root
         for c in components:
-            for child in cur.children:
-                if child.name == c:
-                    cur = child
-                    break
-            else:
+            cur = cur.find(c)
+            if cur is None:
                 return default
 
         return cur
@@ -118,16 +145,14 @@ class VersionInfo:
             children.append(_VerNode('{:04x}{:04x}'.format(langid, cp), None, tran_children))
             trans.append(struct.pack('<HH', langid, cp))
 
-        for i, root_child in enumerate(self._root.children):
-            if root_child.name == 'StringFileInfo':
-                if not children:
-                    del self._root.children[i]
-                else:
-                    root_child.children = children
-                break
-        else:
-            if children:
-                self._root.children.append(_VerNode('StringFileInfo', None, children))
+        sfi_node = self._root.find('StringFileInfo')
+        if sfi_node is not None:
+            if not children:
+                self._root.remove(sfi_node)
+            else:
+                sfi_node.children = children
+        elif children:
+            self._root.append(_VerNode('StringFileInfo', None, children))
 
         if trans:
             self.set_var('Translation', b''.join(trans))
@@ -135,126 +160,155 @@ class VersionInfo:
             self.del_var('Translation')
 
     def set_var(self, name, value):
-        for ch in self._root.children:
-            if ch.name == 'VarFileInfo':
-                vfi_node = ch
-                break
-        else:
+        vfi_node = self._root.find('VarFileInfo')
+        if vfi_node is None:
             vfi_node = _VerNode('VarFileInfo', None, [])
-            self._root.children.append(vfi_node)
+            self._root.append(vfi_node)
 
-        for ch in vfi_node.children:
-            if ch.name == name:
-                ch.value = value
-                break
+        var_node = vfi_node.find(name)
+        if var_node is not None:
+            var_node.value = value
         else:
-            vfi_node.children.append(_VerNode(name, value, []))
+            vfi_node.append(_VerNode(name, value, []))
 
     def del_var(self, name):
-        for vfi_idx, ch in enumerate(self._root.children):
-            if ch.name == 'VarFileInfo':
-                vfi_node = ch
-                break
-        else:
+        vfi_node = self._root.find('VarFileInfo')
+        if vfi_node is None:
             return
 
-        for i, ch in enumerate(vfi_node.children):
-            if ch.name == name:
-                del vfi_node.children[i]
-                break
+        var_node = vfi_node.find(name)
+        if var_node is not None:
+            vfi_node.remove(var_node)
 
         if not vfi_node.children:
-            del self._root.children[vfi_idx]
+            self._root.remove(vfi_node)
 
     def pack(self):
-        return _pack_node(self._root)
-
-def _pack_node(node):
-    children = []
-    for child in node.children:
-        if children:
-            children.append(b'\0' * (align4(len(children[-1])) - len(children[-1])))
-        children.append(_pack_node(child))
-    children = rope(*children)
+        return _pack(self._root)
 
+def _encode_node(node):
     name = node.name.encode('utf-16le') + b'\0\0'
-
-    children_offset = align4(_NODE_HEADER.size + len(name))
-    name_pad = b'\0' * (children_offset - _NODE_HEADER.size - len(name))
-
-    hdr = _NODE_HEADER()
     if node.value is None:
-        value = b''
-        hdr.wValueLength = 0
-        hdr.wType = 1
+        return name, b'', 0, 1
     elif isinstance(node.value, str):
         value = node.value.encode('utf-16le') + b'\0\0'
-        hdr.wValueLength = len(value) // 2
-        hdr.wType = 1
+        return name, value, len(value) // 2, 1
     else:
-        value = node.value
-        hdr.wValueLength = len(value)
-        hdr.wType = 0
+        value = bytes(node.value)
+        return name, value, len(value), 0
+
+def _pack(root):
+    # First pass: encode the nodes and compute their lengths bottom-up.
+    encoded = {}
+    stack = [(root, False)]
+    while stack:
+        node, visited = stack.pop()
+        if not visited:
+            stack.append((node, True))
+            stack.extend((child, False) for child in node.children)
+            continue
+
+        name, value, value_length, type = _encode_node(node)
+        length = align4(_NODE_HEADER.size + len(name))
+        if node.children:
+            length = align4(length + len(value))
+            for child in node.children[:-1]:
+                length += align4(encoded[id(child)][0])
+            length += encoded[id(node.children[-1])][0]
+        else:
+            length += len(value)
+        encoded[id(node)] = length, name, value, value_length, type
 
-    if not children:
-        hdr.wLength = _NODE_HEADER.size + len(name) + len(name_pad) + len(value)
-        value_pad = b''
-    else:
-        value_len_aligned = align4(len(value))
-        value_pad = b'\0' * (value_len_aligned - len(value))
+    # Second pass: write the nodes into a single buffer.
+    buf = bytearray(encoded[id(root)][0])
+    stack = [(root, 0)]
+    while stack:
+        node, offs = stack.pop()
+        length, name, value, value_length, type = encoded[id(node)]
 
-    hdr.wLength = _NODE_HEADER.size + len(name) + len(name_pad) + len(value) + len(value_pad) + len(children)
-    return rope(hdr.pack(), name, name_pad, value, value_pad, children)
+        struct.pack_into('<HHH', buf, offs, length, value_length, type)
+        name_offs = offs + _NODE_HEADER.size
+        buf[name_offs:name_offs + len(name)] = name
 
-def parse_version_info(blob):
-    root, _ = _parse_one(blob)
-    return VersionInfo(root)
+        value_offs = offs + align4(_NODE_HEADER.size + len(name))
+        buf[value_offs:value_offs + len(value)] = value
+
+        child_offs = value_offs + align4(len(value))
+        for child in node.children:
+            stack.append((child, child_offs))
+            child_offs += align4(encoded[id(child)][0])
+
+    return bytes(buf)
 
-def _parse_one(blob):
-    if len(blob) < _NODE_HEADER.size:
-        return None, None
+def parse_fixed_file_info(blob):
+    """Read only the VS_FIXEDFILEINFO of a version info resource.
+
+    Returns None if the resource has no fixed file info.
+    """
 
     hdr = _NODE_HEADER.unpack_from(blob)
-    next = blob[align4(hdr.wLength):]
-    blob = blob[:hdr.wLength]
+    _, key_end = read_utf16z(blob, hdr.size, hdr.wLength)
+
+    value_offs = align4(key_end)
+    if hdr.wType != 0 or hdr.wValueLength < _VS_FIXEDFILEINFO.size:
+        return None
 
-    key, key_size = _read_string(blob[hdr.size:])
-    blob = blob[align4(hdr.size + key_size):]
+    fi = _VS_FIXEDFILEINFO.unpack_from(blob, value_offs)
+    if fi.dwSignature != FIXEDFILEINFO_SIG:
+        raise ValueError('FIXEDFILEINFO_SIG mismatch')
+    return fi
 
-    value_len = hdr.wValueLength if hdr.wType == 0 else hdr.wValueLength * 2
-    value = blob[:value_len]
-    blob = blob[align4(value_len):]
+def parse_version_info(blob):
+    if not isinstance(blob, (bytes, bytearray, memoryview)):
+        blob = bytes(blob)
+    return VersionInfo(_parse(memoryview(blob)))
 
-    if hdr.wType != 0:
-        if not value:
+def _parse_node(buf, offs, limit):
+    if limit - offs < _NODE_HEADER.size:
+        return None
+
+    length, value_length, type = struct.unpack_from('<HHH', buf, offs)
+    end = min(offs + length, limit)
+
+    key, key_end = read_utf16z(buf, offs + _NODE_HEADER.size, end, intern=True)
+
+    value_offs = min(offs + align4(key_end - offs), end)
+    if type != 0:
+        value_length *= 2
+    value_end = min(value_offs + value_length, end)
+
+    if type != 0:
+        if value_end == value_offs:
             value = None
         else:
-            if len(value) % 2 != 0:
+            if (value_end - value_offs) % 2 != 0:
                 raise RuntimeError('a text version info value is not of an even length')
-            if bytes(value[-2:]) != b'\0\0':
+            if buf[value_end - 2:value_end] != b'\0\0':
                 raise RuntimeError('version info string is not terminated by zero')
-            value = bytes(value[:-2]).decode('utf-16le')
-
-    children = []
-    while blob:
-        node, blob = _parse_one(blob)
-        if node is not None:
-            children.append(node)
-
-    return _VerNode(key, value, children), next
-
-def _read_string(blob):
-    r = []
-    while True:
-        s = bytes(blob[:64])
-        if not s:
-            raise RuntimeError('no string')
-        i = 0
-        while i < len(s):
-            if s[i:i+2] == b'\0\0':
-                r.append(s[:i])
-                r = b''.join(r)
-                return r.decode('utf-16le'), len(r) + 2
-            i += 2
-        r.append(s)
-        blob = blob[len(s):]
+            value = bytes(buf[value_offs:value_end - 2]).decode('utf-16le')
+    else:
+        value = bytes(buf[value_offs:value_end])
+
+    children_offs = value_offs + align4(value_length)
+    return _VerNode(key, value, []), children_offs, end, offs + align4(length)
+
+def _parse(buf):
+    r = _parse_node(buf, 0, len(buf))
+    if r is None:
+        return None
+
+    root, children_offs, end, _ = r
+    stack = [(root, children_offs, end)]
+    while stack:
+        node, offs, end = stack[-1]
+        r = _parse_node(buf, offs, end) if offs < end else None
+        if r is None:
+            stack.pop()
+            continue
+
+        child, children_offs, child_end, next_offs = r
+        node.children.append(child)
+        stack[-1] = node, next_offs, end
+        stack.append((child, children_offs, child_end))
+
+    return root
@@ -19,10 +19,14 @@ setup(
 
     packages=['pe_tools'],
     install_requires=['grope'],
+    extras_require={
+        'numpy': ['numpy'],
+        },
 
     entry_points={
         'console_scripts': [
             'peresed = pe_tools.peresed:main',
+            'pesymstore = pe_tools.symstore:main',
             ],
         }
     )
@@ -0,0 +1,253 @@
+"""Builds minimal PDB files for the tests.
+
+Only the parts that pe_tools reads are filled in: the MSF superblock and
+stream directory, the PDB info stream, the DBI stream with its module
+info, section contribution and section map substreams, section headers,
+symbol records and optionally the publics stream, module streams,
+`/names` and type streams.
+"""
+
+import struct, uuid
+from pe_tools.pdb import pdb_signature, hash_string_v1
+
+DEFAULT_SECTIONS = ((b'.text', 0x1000, 0x5000), (b'.data', 0x6000, 0x2000))
+
+def msf(streams, block_size=0x200, scatter=False):
+    """Lay out `streams` (bytes or None for nil streams) in an MSF file.
+
+    With `scatter`, a filler block follows each data block, so that no
+    stream is contiguous.
+    """
+
+    blocks = [None, b'', b'']
+
+    def alloc(data):
+        idxs = []
+        for offs in range(0, len(data), block_size):
+            idxs.append(len(blocks))
+            blocks.append(data[offs:offs + block_size])
+            if scatter:
+                blocks.append(b'\xcc' * block_size)
+        return idxs
+
+    sizes = []
+    stream_blocks = []
+    for data in streams:
+        if data is None:
+            sizes.append(0xffff_ffff)
+        else:
+            sizes.append(len(data))
+            stream_blocks.extend(alloc(data))
+
+    directory = struct.pack(f'<I{len(sizes)}I{len(stream_blocks)}I', len(streams), *sizes, *stream_blocks)
+    directory_blocks = alloc(directory)
+    block_map = alloc(struct.pack(f'<{len(directory_blocks)}I', *directory_blocks))
+
+    blocks[0] = pdb_signature + struct.pack('<IIIII', block_size, 1, len(blocks), len(directory), 0) \
+        + struct.pack(f'<{len(block_map)}I', *block_map)
+    return b''.join(block.ljust(block_size, b'\0') for block in blocks)
+
+def section_header(name, va, size):
+    return struct.pack('<8sIIIIIIHHI', name, size, va, 0, 0, 0, 0, 0, 0, 0)
+
+def sym_record(kind, body):
+    body = struct.pack('<H', kind) + body
+    body += b'\0' * (-(len(body) + 2) % 4)
+    return struct.pack('<H', len(body)) + body
+
+def pub32(name, seg, off):
+    return sym_record(0x110e, struct.pack('<IIH', 0, off, seg) + name.encode('utf-8') + b'\0')
+
+def _public_records(symrec):
+    offs = 0
+    while offs < len(symrec):
+        reclen, kind = struct.unpack_from('<HH', symrec, offs)
+        if kind == 0x110e:
+            _, off, seg = struct.unpack_from('<IIH', symrec, offs + 4)
+            end = symrec.index(b'\0', offs + 14)
+            yield offs, symrec[offs + 14:end], seg, off
+        offs += reclen + 2
+
+def gsi_hash(records):
+    """A GSI hash table for `(offset, name)` pairs of symbol records."""
+
+    buckets = [[] for _ in range(4096)]
+    for offs, name in records:
+        buckets[hash_string_v1(name) % 4096].append(offs)
+
+    hash_records = b''
+    bitmap = [0] * 129
+    bucket_offsets = []
+    count = 0
+    for idx, bucket in enumerate(buckets):
+        if not bucket:
+            continue
+        bitmap[idx // 32] |= 1 << (idx % 32)
+        bucket_offsets.append(count * 12)
+        for offs in bucket:
+            hash_records += struct.pack('<II', offs + 1, 1)
+            count += 1
+
+    tail = struct.pack('<129I', *bitmap) + struct.pack(f'<{len(bucket_offsets)}I', *bucket_offsets)
+    return struct.pack('<IIII', 0xffff_ffff, 0xeffe0000 + 19990810, len(hash_records), len(tail)) + hash_records + tail
+
+def publics_stream(symrec):
+    records = list(_public_records(symrec))
+    hash_table = gsi_hash([(offs, name) for offs, name, _, _ in records])
+    by_addr = sorted(records, key=lambda rec: (rec[2], rec[3]))
+    addr_map = struct.pack(f'<{len(by_addr)}I', *(rec[0] for rec in by_addr))
+    return struct.pack('<IIIIHHII', len(hash_table), len(addr_map), 0, 0, 0, 0, 0, 0) + hash_table + addr_map
+
+def names_stream(strings):
+    """Returns the `/names` stream and a dict mapping strings to offsets."""
+
+    buf = b'\0'
+    offsets = {}
+    for s in strings:
+        offsets[s] = len(buf)
+        buf += s.encode('utf-8') + b'\0'
+    return struct.pack('<III', 0xeffeeffe, 1, len(buf)) + buf + struct.pack('<II', 0, len(strings)), offsets
+
+def c13_subsection(kind, data):
+    return struct.pack('<II', kind, len(data)) + data + b'\0' * (-len(data) % 4)
+
+def file_checksums(name_offsets):
+    """A DEBUG_S_FILECHKSMS subsection, file ids are 8 * index."""
+
+    return c13_subsection(0xf4, b''.join(struct.pack('<IBBxx', offs, 0, 0) for offs in name_offsets))
+
+def lines(seg, off, code_size, blocks):
+    """A DEBUG_S_LINES subsection, blocks are `(file_id, [(offset, line)])`."""
+
+    data = struct.pack('<IHHI', off, seg, 0, code_size)
+    for file_id, entries in blocks:
+        body = b''.join(struct.pack('<II', offs, line | 0x8000_0000) for offs, line in entries)
+        data += struct.pack('<III', file_id, len(entries), 12 + len(body)) + body
+    return c13_subsection(0xf2, data)
+
+def module_stream(procs=(), c13=b''):
+    """Returns the module stream and the size of its symbols.
+
+    `procs` are `(kind, name, seg, off, size)`, each procedure gets a
+    nested record and an S_END.
+    """
+
+    syms = bytearray(struct.pack('<I', 4))
+    for kind, name, seg, off, size in procs:
+        def proc(end):
+            return sym_record(kind, struct.pack('<IIIIIIIIHB', 0, end, 0, size, 0, 0, 0, off, seg, 0) + name.encode('utf-8') + b'\0')
+
+        start = len(syms)
+        nested = sym_record(0x1111, b'\0' * 12)
+        syms += proc(start + len(proc(0)) + len(nested)) + nested + sym_record(0x0006, b'')
+
+    return bytes(syms) + c13, len(syms)
+
+def type_record(kind, body):
+    body = struct.pack('<H', kind) + body
+    pad = -(len(body) + 2) % 4
+    body += bytes(0xf0 + i for i in range(pad, 0, -1))
+    return struct.pack('<H', len(body)) + body
+
+def type_stream(records, hash_stream_index=0xffff, index_offsets=b''):
+    data = b''.join(records)
+    return struct.pack('<IIIIIHHIIiIiIiI', 20040203, 56, 0x1000, 0x1000 + len(records), len(data),
+        hash_stream_index, 0xffff, 4, 0x3ffff, 0, 0, 0, len(index_offsets), 0, 0) + data
+
+def type_index_offsets(records, every):
+    r = b''
+    offs = 0
+    for idx, rec in enumerate(records):
+        if idx % every == 0:
+            r += struct.pack('<II', 0x1000 + idx, offs)
+        offs += len(rec)
+    return r
+
+class PdbBuilder:
+    def __init__(self, sections=DEFAULT_SECTIONS, guid=uuid.UUID(int=0x1234), age=3, machine=0x8664):
+        self.sections = sections
+        self.guid = guid
+        self.age = age
+        self.machine = machine
+        self.publics = []
+        self.modules = []
+        self.contribs = []
+        self.contribs_v2 = False
+        self.with_publics_stream = False
+        self.names = None
+        self.tpi = None
+        self.ipi = None
+        self.extra_streams = []
+
+    def add_public(self, name, seg, off):
+        self.publics.append((name, seg, off))
+
+    def add_module(self, name, obj_name=None, stream=None, sym_size=0, c13_size=0):
+        self.modules.append((name, obj_name or name, stream, sym_size, c13_size))
+        return len(self.modules) - 1
+
+    def add_contrib(self, sec, off, size, module):
+        self.contribs.append((sec, off, size, module))
+
+    def extra_stream_index(self, idx):
+        """The stream index the `idx`-th extra stream will get."""
+
+        return 7 + self.with_publics_stream + sum(1 for mod in self.modules if mod[2] is not None) + idx
+
+    def build(self, block_size=0x200, scatter=False):
+        streams = [b'', None, self.tpi if self.tpi is not None else b'', None,
+            self.ipi if self.ipi is not None else b'']
+
+        def add(data):
+            streams.append(data)
+            return len(streams) - 1
+
+        symrec = b''.join(pub32(*pub) for pub in self.publics)
+        symrec_idx = add(symrec)
+        sect_idx = add(b''.join(section_header(*sec) for sec in self.sections))
+        psi_idx = add(publics_stream(symrec)) if self.with_publics_stream else 0xffff
+
+        modinfo = b''
+        for idx, (name, obj_name, stream, sym_size, c13_size) in enumerate(self.modules):
+            stream_idx = add(stream) if stream is not None else 0xffff
+            mi = struct.pack('<I', 0) + struct.pack('<HxxiiIHxxII', 1, 0, 0, 0, idx, 0, 0)
+            mi += struct.pack('<HHIIIHHIII', 0, stream_idx, sym_size, 0, c13_size, 0, 0, 0, 0, 0)
+            mi += name.encode('utf-8') + b'\0' + obj_name.encode('utf-8') + b'\0'
+            modinfo += mi + b'\0' * (-len(mi) % 4)
+
+        if self.contribs_v2:
+            contribs = struct.pack('<I', 0xeffe0000 + 20140516)
+            tail = (0, 0, 0)
+        else:
+            contribs = struct.pack('<I', 0xeffe0000 + 19970605)
+            tail = (0, 0)
+        for sec, off, size, module in self.contribs:
+            contribs += struct.pack(f'<HxxiiIHxx{len(tail)}I', sec, off, size, 0x60000020, module, *tail)
+
+        count = len(self.sections) + 1
+        section_map = struct.pack('<HH', count, count)
+        for idx, (_, _, size) in enumerate(self.sections):
+            section_map += struct.pack('<HHHHHHII', 0x10d, 0, 0, idx + 1, 0xffff, 0xffff, 0, size)
+        section_map += struct.pack('<HHHHHHII', 0x208, 0, 0, 0, 0xffff, 0xffff, 0, 0xffff_ffff)
+
+        debug_streams = [0xffff] * 11
+        debug_streams[5] = sect_idx
+        optional = struct.pack('<11H', *debug_streams)
+
+        dbi = struct.pack('<iIIHHHHHHiiiiiIiiHHI', -1, 19990903, self.age, 0xffff, 0x8e1d, psi_idx, 0, symrec_idx, 0,
+            len(modinfo), len(contribs), len(section_map), 0, 0, 0, len(optional), 0, 0, self.machine, 0)
+        streams[3] = dbi + modinfo + contribs + section_map + optional
+
+        for data in self.extra_streams:
+            add(data)
+
+        info = struct.pack('<III', 20000404, 0x12345678, self.age) + self.guid.bytes_le
+        if self.names is not None:
+            names_idx = add(self.names)
+            buf = b'/names\0'
+            info += struct.pack('<I', len(buf)) + buf
+            info += struct.pack('<IIIIII', 1, 2, 1, 0b10, 0, 0) + struct.pack('<I', names_idx)
+            info += struct.pack('<I', 20140508)
+        streams[1] = info
+
+        return msf(streams, block_size, scatter)
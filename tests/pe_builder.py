@@ -0,0 +1,70 @@
+"""Builds minimal PE files for the tests.
+
+The images are 32-bit, with a `.text` section and a `.rsrc` section
+holding the resource tree passed in, optionally followed by trailing
+data.
+"""
+
+import struct
+from pe_tools.rsrc import pe_resources_prepack
+from pe_tools.version_info import VersionInfo, _VS_FIXEDFILEINFO, FIXEDFILEINFO_SIG
+
+FILE_ALIGNMENT = 0x200
+SECTION_ALIGNMENT = 0x1000
+RSRC_RVA = 0x2000
+
+def _align(offs, alignment):
+    return (offs + alignment - 1) // alignment * alignment
+
+def build_pe(rsrc_fn, trailer=b''):
+    """Build a PE file, `rsrc_fn(rva)` returns the resource section
+    placed at `rva`."""
+
+    section_count = 2
+    opt_size = 2 + 94 + 16 * 8
+    headers_end = 0x80 + 4 + 20 + opt_size + section_count * 40
+
+    text = b'\xc3' * 0x10
+    text_ptr = _align(headers_end, FILE_ALIGNMENT)
+    text_raw = _align(len(text), FILE_ALIGNMENT)
+
+    rsrc = rsrc_fn(RSRC_RVA)
+    rsrc_ptr = text_ptr + text_raw
+    rsrc_raw = _align(len(rsrc), FILE_ALIGNMENT)
+
+    dos = bytearray(0x80)
+    dos[0:2] = b'MZ'
+    struct.pack_into('<I', dos, 0x3c, 0x80)
+
+    file_header = struct.pack('<HHIIIHH', 0x14c, section_count, 0x12345678, 0, 0, opt_size, 0x102)
+    opt = struct.pack('<HBBIIIIIIIIIHHHHHHIIIIHHIIIIII', 0x10b, 14, 0, text_raw, rsrc_raw, 0, 0x1000, 0x1000, RSRC_RVA,
+        0x400000, SECTION_ALIGNMENT, FILE_ALIGNMENT, 6, 0, 0, 0, 6, 0, 0,
+        RSRC_RVA + _align(len(rsrc), SECTION_ALIGNMENT), text_ptr, 0, 2, 0, 0x100000, 0x1000, 0x100000, 0x1000, 0, 16)
+    data_directories = [(0, 0)] * 16
+    data_directories[2] = (RSRC_RVA, len(rsrc))
+    opt += b''.join(struct.pack('<II', *dd) for dd in data_directories)
+
+    sections = struct.pack('<8sIIIIIIHHI', b'.text', len(text), 0x1000, text_raw, text_ptr, 0, 0, 0, 0, 0x60000020)
+    sections += struct.pack('<8sIIIIIIHHI', b'.rsrc', len(rsrc), RSRC_RVA, rsrc_raw, rsrc_ptr, 0, 0, 0, 0, 0x42000040)
+
+    r = bytes(dos) + b'PE\0\0' + file_header + opt + sections
+    r = r.ljust(text_ptr, b'\0') + text.ljust(text_raw, b'\0') + rsrc.ljust(rsrc_raw, b'\0')
+    return r + trailer
+
+def build_pe_with_resources(tree, trailer=b''):
+    prepacked = pe_resources_prepack(tree)
+    return build_pe(lambda rva: bytes(prepacked.pack(rva)), trailer)
+
+def version_info(file_version=(1, 2, 3, 4), strings=None, translations=((0x409, 1200),)):
+    """A version info resource with the given file and product version."""
+
+    fi = _VS_FIXEDFILEINFO(dwSignature=FIXEDFILEINFO_SIG, dwStrucVersion=0x10000)
+    fi.set_file_version(*file_version)
+    fi.set_product_version(*file_version)
+
+    vi = VersionInfo()
+    vi.set_fixed_info(fi)
+    if strings is None:
+        strings = {'FileVersion': '.'.join(map(str, file_version)), 'ProductName': 'Test'}
+    vi.set_string_file_info({tran: dict(strings) for tran in translations})
+    return bytes(vi.pack())
@@ -0,0 +1,59 @@
+import os
+import pytest
+from pe_tools.extract import extract_resources
+from pe_tools.pe_parser import parse_pe
+from pe_builder import build_pe_with_resources
+
+def _extract(tmp_path, tree, trailer=b''):
+    fname = str(tmp_path / 'test.exe')
+    with open(fname, 'wb') as fout:
+        fout.write(build_pe_with_resources(tree, trailer))
+    outdir = str(tmp_path / 'out')
+    with open(fname, 'rb') as fin:
+        pe = parse_pe(fin.read())
+    files = extract_resources(pe, fname, outdir)
+    return outdir, sorted(os.path.relpath(f, outdir).replace(os.sep, '/') for f in files)
+
+def _read(outdir, path):
+    with open(os.path.join(outdir, path), 'rb') as fin:
+        return fin.read()
+
+def test_extract(tmp_path):
+    outdir, files = _extract(tmp_path, {
+        3: {1: {0x409: b'icon'}},
+        99: {1: {0: b'numeric type'}},
+        '99': {1: {0: b'string type'}},
+        '#99': {'#1': {0: b'escaped type and name'}},
+        10: {1: {0: b'id'}, '#1': {0: b'string name'}, 'DATA': {0: b'data', 0x409: b'en'}},
+        }, trailer=b'TRAILER')
+
+    assert files == ['##99/##1/0', '#99/#1/0', '99/#1/0', 'RT_ICON/#1/1033',
+        'RT_RCDATA/##1/0', 'RT_RCDATA/#1/0', 'RT_RCDATA/DATA/0', 'RT_RCDATA/DATA/1033', '_trailer']
+    assert _read(outdir, '#99/#1/0') == b'numeric type'
+    assert _read(outdir, '99/#1/0') == b'string type'
+    assert _read(outdir, 'RT_RCDATA/#1/0') == b'id'
+    assert _read(outdir, 'RT_RCDATA/##1/0') == b'string name'
+    assert _read(outdir, 'RT_RCDATA/DATA/1033') == b'en'
+    assert _read(outdir, '_trailer') == b'TRAILER'
+
+@pytest.mark.parametrize('tree', [
+    {3: {1: {0: b'icon'}}, 'RT_ICON': {1: {0: b'string type'}}},
+    {10: {'a/b': {0: b'slash'}, 'a_b': {0: b'underscore'}}},
+    {'_trailer': {1: {0: b'data'}}},
+    ])
+def test_extract_collision(tmp_path, tree):
+    with pytest.raises(RuntimeError):
+        _extract(tmp_path, tree, trailer=b'TRAILER')
+    assert not os.path.exists(str(tmp_path / 'out'))
+
+def test_extract_reuses_layout(tmp_path, monkeypatch):
+    fname = str(tmp_path / 'test.exe')
+    with open(fname, 'wb') as fout:
+        fout.write(build_pe_with_resources({10: {1: {0: b'data'}}}))
+    with open(fname, 'rb') as fin:
+        pe = parse_pe(fin.read())
+
+    _, layout = pe.parse_resources_layout()
+    monkeypatch.setattr(pe, 'parse_resources_layout', None)
+    files = extract_resources(pe, fname, str(tmp_path / 'out'), layout=layout)
+    assert _read(str(tmp_path / 'out'), os.path.relpath(files[0], str(tmp_path / 'out'))) == b'data'
@@ -0,0 +1,64 @@
+import os, subprocess, sys
+import pytest
+
+# Modules that are only imported by the code that needs them, importing
+# pe_tools or the peresed tool must not load them.
+_LAZY_MODULES = (
+    'argparse',
+    'ast',
+    'concurrent.futures',
+    'dataclasses',
+    'hashlib',
+    'inspect',
+    'json',
+    'pe_tools.links',
+    'pe_tools.extract',
+    'pe_tools.manifest',
+    'pe_tools.pdb',
+    'pe_tools.string_table',
+    'pe_tools.symcache',
+    're',
+    'tempfile',
+    'typing',
+    'uuid',
+    'xml.parsers.expat',
+    )
+
+# Modules the peresed tool leaves to the commands that need them, so
+# that `--connect` only pays for the standard library.
+_TOOL_LAZY_MODULES = (
+    'grope',
+    'pe_tools.pe_parser',
+    'pe_tools.rsrc',
+    'pe_tools.version_info',
+    )
+
+# Generous, the import takes a fraction of this on a developer machine.
+_IMPORT_BUDGET_US = 250_000
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _run(*args):
+    return subprocess.run([sys.executable, *args], cwd=_ROOT, capture_output=True, text=True, check=True)
+
+def _loaded_by(module):
+    r = _run('-c', f'import sys; before = set(sys.modules); import {module}; print(*(set(sys.modules) - before))')
+    loaded = set(r.stdout.split())
+    assert module in loaded
+    return loaded
+
+@pytest.mark.parametrize('module', ['pe_tools', 'pe_tools.pe_parser', 'pe_tools.peresed'])
+def test_import_is_lazy(module):
+    assert not _loaded_by(module).intersection(_LAZY_MODULES)
+
+def test_tool_import_is_lazy():
+    assert not _loaded_by('pe_tools.peresed').intersection(_TOOL_LAZY_MODULES)
+
+def test_import_time():
+    r = _run('-X', 'importtime', '-c', 'import pe_tools.peresed')
+    times = {}
+    for line in r.stderr.splitlines():
+        if line.startswith('import time:') and 'cumulative' not in line:
+            _, cumulative, name = line[len('import time:'):].split('|')
+            times[name.strip()] = int(cumulative)
+    assert times['pe_tools.peresed'] < _IMPORT_BUDGET_US
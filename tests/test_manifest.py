@@ -0,0 +1,77 @@
+import xml.dom.minidom
+import pytest
+from pe_tools.manifest import add_manifest_dependencies, parse_manifest_info
+
+ASM_V1 = 'urn:schemas-microsoft-com:asm.v1'
+COMCTL = {'type': 'win32', 'name': 'Microsoft.Windows.Common-Controls', 'version': '6.0.0.0'}
+OTHER = {'type': 'win32', 'name': 'Other', 'version': '1.0.0.0'}
+
+MANIFEST = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\r\n'
+    '<assembly xmlns="urn:schemas-microsoft-com:asm.v1" manifestVersion="1.0">\r\n'
+    '  <assemblyIdentity name="app" version="1.0.0.0"/>\r\n'
+    '  <trustInfo xmlns="urn:schemas-microsoft-com:asm.v3"><security><requestedPrivileges>'
+    '<requestedExecutionLevel level="asInvoker" uiAccess="false"/>'
+    '</requestedPrivileges></security></trustInfo>\r\n'
+    '</assembly>\r\n')
+
+def _identities(blob):
+    doc = xml.dom.minidom.parseString(bytes(blob))
+    return [(elem.namespaceURI, {k: v for k, v in elem.attributes.items()})
+        for elem in doc.getElementsByTagNameNS('*', 'assemblyIdentity')
+        if elem.parentNode.localName == 'dependentAssembly']
+
+def test_parse_manifest_info():
+    info = parse_manifest_info(MANIFEST.encode('utf-8'))
+    assert info.identity == {'name': 'app', 'version': '1.0.0.0'}
+    assert info.requested_execution_level == 'asInvoker'
+    assert info.ui_access is False
+    assert info.dependencies == []
+
+def test_add_dependency_keeps_the_rest_intact():
+    blob = MANIFEST.encode('utf-8')
+    r = bytes(add_manifest_dependencies(blob, [COMCTL]))
+    assert _identities(r) == [(ASM_V1, COMCTL)]
+    assert r.replace(b'<dependency><dependentAssembly><assemblyIdentity type="win32" '
+        b'name="Microsoft.Windows.Common-Controls" version="6.0.0.0"/></dependentAssembly></dependency>', b'') == blob
+
+def test_add_dependency_with_bom():
+    blob = b'\xef\xbb\xbf' + MANIFEST.encode('utf-8')
+    r = bytes(add_manifest_dependencies(blob, [COMCTL]))
+    assert r.startswith(b'\xef\xbb\xbf<?xml')
+    assert _identities(r) == [(ASM_V1, COMCTL)]
+
+def test_add_dependency_to_existing_dependent_assembly():
+    blob = MANIFEST.replace('</assembly>', '<dependency><dependentAssembly>'
+        '<assemblyIdentity type="win32" name="Other" version="1.0.0.0"/>'
+        '</dependentAssembly></dependency></assembly>').encode('utf-8')
+    r = add_manifest_dependencies(blob, [COMCTL])
+    assert _identities(r) == [(ASM_V1, OTHER), (ASM_V1, COMCTL)]
+    assert parse_manifest_info(r).dependencies == [OTHER, COMCTL]
+
+def test_add_dependency_to_self_closing_root():
+    blob = b'<assembly xmlns="urn:schemas-microsoft-com:asm.v1" manifestVersion="1.0"/>'
+    r = add_manifest_dependencies(blob, [COMCTL, OTHER])
+    assert _identities(r) == [(ASM_V1, COMCTL), (ASM_V1, OTHER)]
+
+def test_add_dependency_to_prefixed_root():
+    blob = (b'<asmv1:assembly xmlns:asmv1="urn:schemas-microsoft-com:asm.v1" manifestVersion="1.0">'
+        b'<asmv1:assemblyIdentity name="app"/></asmv1:assembly>')
+    r = bytes(add_manifest_dependencies(blob, [COMCTL]))
+    assert b'<asmv1:dependency><asmv1:dependentAssembly><asmv1:assemblyIdentity ' in r
+    assert _identities(r) == [(ASM_V1, COMCTL)]
+
+def test_new_manifest():
+    r = add_manifest_dependencies(None, [COMCTL])
+    assert _identities(r) == [(ASM_V1, COMCTL)]
+
+@pytest.mark.parametrize('codec, bom', [('utf-16-le', b'\xff\xfe'), ('utf-16-be', b'\xfe\xff'), ('utf-16-le', b'')])
+def test_add_dependency_utf16(codec, bom):
+    blob = bom + MANIFEST.replace('UTF-8', 'UTF-16').encode(codec)
+    r = bytes(add_manifest_dependencies(blob, [COMCTL]))
+    assert r.startswith(bom + '<?xml'.encode(codec))
+    assert _identities(r) == [(ASM_V1, COMCTL)]
+    assert parse_manifest_info(r).identity == {'name': 'app', 'version': '1.0.0.0'}
+
+def test_malformed_manifest():
+    with pytest.raises(RuntimeError):
+        add_manifest_dependencies(b'<assembly>', [COMCTL])
@@ -0,0 +1,327 @@
+import pytest, struct
+from grope import rope
+from pe_tools.cvinfo import (LF_ARRAY, LF_CLASS, LF_ENUM, LF_MODIFIER, LF_POINTER, LF_STRING_ID,
+    LF_STRUCTURE, LF_UNION, S_GPROC32, S_GPROC32_ID, S_LPROC32, read_numeric)
+from pe_tools.pdb import PublicSymbols, StreamCache, parse_pdb
+from pdb_builder import (PdbBuilder, file_checksums, lines, module_stream, msf, names_stream,
+    type_index_offsets, type_record, type_stream)
+
+def _publics_pdb(**kw):
+    b = PdbBuilder()
+    b.add_public('main', 1, 0x100)
+    b.add_public('helper', 1, 0x180)
+    b.add_public('g_data', 2, 0x10)
+    b.add_public('absolute', 0, 0x1234)
+    return parse_pdb(b.build(**kw))
+
+@pytest.mark.parametrize('scatter', [False, True])
+def test_get_rva(scatter):
+    pdb = _publics_pdb(scatter=scatter)
+    assert pdb.get_rva(1, 0x100) == 0x1100
+    assert pdb.get_rva(2, 0) == 0x6000
+    assert pdb.get_rva(0, 0x100) is None
+    assert pdb.get_rva(9, 0) is None
+
+def test_find_by_name():
+    index = _publics_pdb().get_public_symbol_index()
+    sym = index.find_by_name('helper')
+    assert (sym.name, sym.segment, sym.offset, sym.rva) == ('helper', 1, 0x180, 0x1180)
+    assert index.find_by_name('missing') is None
+
+def test_find_by_rva():
+    index = _publics_pdb().get_public_symbol_index()
+    sym, disp = index.find_by_rva(0x1100)
+    assert (sym.name, disp) == ('main', 0)
+    sym, disp = index.find_by_rva(0x117f)
+    assert (sym.name, disp) == ('main', 0x7f)
+    sym, disp = index.find_by_rva(0x6020)
+    assert (sym.name, disp) == ('g_data', 0x10)
+    assert index.find_by_rva(0x10ff) is None
+
+def test_public_symbol_index_decodes_lazily(monkeypatch):
+    decoded = []
+    get_name_bytes = PublicSymbols.get_name_bytes
+    monkeypatch.setattr(PublicSymbols, 'get_name_bytes', lambda self, idx: decoded.append(idx) or get_name_bytes(self, idx))
+
+    index = _publics_pdb().get_public_symbol_index()
+    assert decoded == []
+    sym, disp = index.find_by_rva(0x1184)
+    assert (sym.name, disp) == ('helper', 4)
+    assert decoded == [1]
+    assert index.find_by_rva(0xfff) is None
+    assert decoded == [1]
+
+def _hashed_publics_pdb(count=5000):
+    b = PdbBuilder()
+    for idx in range(count):
+        b.add_public(f'sym_{idx}', 1, 0x10 * idx)
+    b.add_public('absolute', 0, 0x10)
+    b.with_publics_stream = True
+    return parse_pdb(b.build())
+
+def test_find_public_uses_hash_table():
+    pdb = _hashed_publics_pdb()
+    assert pdb.get_publics_stream() is not None
+    for idx in (0, 1, 2345, 4999):
+        sym = pdb.find_public(f'sym_{idx}')
+        assert (sym.name, sym.rva) == (f'sym_{idx}', 0x1000 + 0x10 * idx)
+    assert pdb.find_public('sym_5000') is None
+    assert pdb._public_symbols is None
+
+def test_find_public_by_rva_uses_address_map():
+    pdb = _hashed_publics_pdb()
+    sym, disp = pdb.find_public_by_rva(0x1000 + 0x10 * 1234 + 3)
+    assert (sym.name, disp) == ('sym_1234', 3)
+    assert pdb.find_public_by_rva(0xfff) is None
+    assert pdb._public_symbols is None
+
+def test_find_public_without_publics_stream():
+    pdb = _publics_pdb()
+    assert pdb.get_publics_stream() is None
+    assert pdb.find_public('main').rva == 0x1100
+    assert pdb.find_public_by_rva(0x1181)[1] == 1
+
+def test_symbolize():
+    pdb = _publics_pdb()
+    r = pdb.symbolize([0x1100, 0x1185, 0x6010, 0x10ff])
+    assert list(r.indices) == [0, 1, 2, -1]
+    assert list(r.displacements) == [0, 5, 0, 0]
+    assert r.names == {0: 'main', 1: 'helper', 2: 'g_data'}
+
+def test_symbolize_without_numpy(monkeypatch):
+    import pe_tools.pdb
+    monkeypatch.setattr(pe_tools.pdb, 'numpy', None)
+    r = _publics_pdb().symbolize([0x1185, 0x10ff])
+    assert list(r.indices) == [1, -1]
+    assert list(r.displacements) == [5, 0]
+    assert r.names == {1: 'helper'}
+
+def test_public_symbols_columns():
+    publics = _publics_pdb().get_public_symbols()
+    assert len(publics) == 4
+    assert list(publics.segments) == [1, 1, 2, 0]
+    assert list(publics.rvas) == [0x1100, 0x1180, 0x6010, 0]
+    assert [sym.name for sym in publics] == ['main', 'helper', 'g_data', 'absolute']
+    assert publics[1] == ('helper', 1, 0x180, 0x1180)
+
+def test_public_symbols_refetch_evicted_stream():
+    cache = StreamCache()
+    b = PdbBuilder()
+    b.add_public('main', 1, 0x100)
+    pdb = parse_pdb(rope(b.build()), cache=cache)
+
+    publics = pdb.get_public_symbols()
+    cache.clear()
+    misses = cache.misses
+    assert publics.get_name(0) == 'main'
+    assert cache.misses == misses + 1
+
+@pytest.mark.parametrize('v2', [False, True])
+def test_section_contributions(v2):
+    b = PdbBuilder()
+    b.add_module('a.obj')
+    b.add_module('b.obj', 'lib.lib')
+    b.add_contrib(1, 0x200, 0x100, 1)
+    b.add_contrib(1, 0, 0x100, 0)
+    b.add_contrib(2, 0, 0x40, 1)
+    b.add_contrib(9, 0, 0x40, 0)
+    b.contribs_v2 = v2
+    pdb = parse_pdb(b.build())
+
+    modules = pdb.get_modules()
+    assert [(m.name, m.object_name) for m in modules] == [('a.obj', 'a.obj'), ('b.obj', 'lib.lib')]
+
+    contribs = pdb.get_section_contributions()
+    assert list(contribs.starts) == [0x1000, 0x1200, 0x6000]
+    assert pdb.rva_to_module(0x10ff) is modules[0]
+    assert pdb.rva_to_module(0x1100) is None
+    assert pdb.rva_to_module(0x1250) is modules[1]
+    assert pdb.rva_to_module(0x6000) is modules[1]
+    assert list(pdb.get_module_sizes()) == [0x100, 0x140]
+
+def _lines_pdb(cache=None):
+    b = PdbBuilder()
+    b.names, name_offsets = names_stream(['a.c', 'b.h'])
+    c13 = file_checksums([name_offsets['a.c'], name_offsets['b.h']])
+    c13 += lines(1, 0x100, 0x40, [(0, [(0, 10), (0x10, 11)]), (8, [(0x20, 3)])])
+    c13 += lines(1, 0x180, 0x10, [(0, [(0, 20)])])
+    stream, sym_size = module_stream()
+    b.add_module('a.obj', stream=stream + c13, sym_size=sym_size, c13_size=len(c13))
+    b.add_contrib(1, 0x100, 0x100, 0)
+    blob = b.build()
+    return parse_pdb(rope(blob), cache=cache) if cache is not None else parse_pdb(blob)
+
+def test_find_line():
+    pdb = _lines_pdb()
+    assert pdb.find_line(0x1100) == ('a.c', 10)
+    assert pdb.find_line(0x111f) == ('a.c', 11)
+    assert pdb.find_line(0x1120) == ('b.h', 3)
+    assert pdb.find_line(0x113f) == ('b.h', 3)
+    assert pdb.find_line(0x1140) is None
+    assert pdb.find_line(0x1185) == ('a.c', 20)
+    assert pdb.find_line(0x1190) is None
+    assert pdb.find_line(0x1300) is None
+
+def test_line_table_refetches_evicted_stream():
+    cache = StreamCache()
+    pdb = _lines_pdb(cache)
+    table = pdb.get_line_table(pdb.get_modules()[0])
+    pdb.get_names()
+    cache.clear()
+    misses = cache.misses
+    assert table.find(0x1120) == ('b.h', 3)
+    assert cache.misses == misses + 1
+
+def _procedures_pdb(cache=None):
+    b = PdbBuilder()
+    stream, sym_size = module_stream([
+        (S_GPROC32, 'g', 1, 0x100, 0x30),
+        (S_LPROC32, 'static_fn', 1, 0x140, 0x10),
+        (S_GPROC32_ID, 'g_id', 1, 0x80, 0x10),
+        (S_GPROC32, 'unmapped', 9, 0, 0x10),
+        ])
+    b.add_module('a.obj', stream=stream, sym_size=sym_size)
+    b.add_contrib(1, 0, 0x1000, 0)
+    blob = b.build()
+    return parse_pdb(rope(blob), cache=cache) if cache is not None else parse_pdb(blob)
+
+def test_find_procedure():
+    pdb = _procedures_pdb()
+    assert len(pdb.get_procedure_table(pdb.get_modules()[0])) == 3
+    assert pdb.find_procedure(0x1080) == ('g_id', 0x1080, 0x10)
+    assert pdb.find_procedure(0x1090) is None
+    assert pdb.find_procedure(0x112f) == ('g', 0x1100, 0x30)
+    assert pdb.find_procedure(0x1130) is None
+    assert pdb.find_procedure(0x114f) == ('static_fn', 0x1140, 0x10)
+    assert pdb.find_procedure(0x2000) is None
+
+def test_procedure_table_refetches_evicted_stream():
+    cache = StreamCache()
+    pdb = _procedures_pdb(cache)
+    table = pdb.get_procedure_table(pdb.get_modules()[0])
+    cache.clear()
+    misses = cache.misses
+    assert table[0].name == 'g_id'
+    assert cache.misses == misses + 1
+
+def _type_records(count):
+    r = []
+    for idx in range(count):
+        if idx % 3 == 0:
+            r.append(type_record(LF_POINTER, struct.pack('<II', 0x74, 0x1000c)))
+        elif idx % 3 == 1:
+            r.append(type_record(LF_MODIFIER, struct.pack('<IH', 0x1000 + idx, 1)))
+        else:
+            r.append(type_record(LF_STRING_ID, struct.pack('<I', 0) + f'str{idx}'.encode('utf-8') + b'\0'))
+    return r
+
+@pytest.mark.parametrize('every', [0, 100])
+def test_type_stream(every):
+    records = _type_records(1000)
+    b = PdbBuilder()
+    if every:
+        b.extra_streams.append(type_index_offsets(records, every))
+        b.tpi = type_stream(records, b.extra_stream_index(0), b.extra_streams[0])
+    else:
+        b.tpi = type_stream(records)
+    pdb = parse_pdb(b.build())
+
+    types = pdb.get_type_stream()
+    assert len(types) == 1000
+    assert types.get(0x74) is None
+    r = types.get(0x1000 + 500)
+    assert (r.kind, r.name) == (LF_STRING_ID, 'str500')
+    assert types.get(0x1000 + 502).data.type == 0x1000 + 502
+    assert sum(types._loaded) == 1
+    for idx in range(1000):
+        assert types.get(0x1000 + idx).kind == (LF_POINTER, LF_MODIFIER, LF_STRING_ID)[idx % 3]
+    with pytest.raises(RuntimeError):
+        types.get(0x1000 + 1000)
+    assert pdb.get_id_stream() is None
+
+def test_type_stream_refetches_evicted_stream():
+    records = _type_records(100)
+    b = PdbBuilder()
+    b.extra_streams.append(type_index_offsets(records, 10))
+    b.tpi = type_stream(records, b.extra_stream_index(0), b.extra_streams[0])
+    cache = StreamCache()
+    pdb = parse_pdb(rope(b.build()), cache=cache)
+    types = pdb.get_type_stream()
+    cache.clear()
+    misses = cache.misses
+    assert types.get(0x1000 + 49).data.type == 0x1000 + 49
+    assert cache.misses == misses + 1
+    assert cache.size == len(b.tpi)
+
+def test_read_numeric():
+    assert read_numeric(struct.pack('<H', 0x7fff), 0) == (0x7fff, 2)
+    assert read_numeric(b'xx' + struct.pack('<Hb', 0x8000, -1), 2) == (-1, 5)
+    assert read_numeric(struct.pack('<HI', 0x8004, 0x12345678), 0) == (0x12345678, 6)
+    assert read_numeric(struct.pack('<HQ', 0x800a, 1 << 40), 0) == (1 << 40, 10)
+    with pytest.raises(RuntimeError):
+        read_numeric(struct.pack('<H', 0x8fff), 0)
+    with pytest.raises(RuntimeError):
+        read_numeric(struct.pack('<HH', 0x8004, 0), 0)
+
+def test_type_stream_user_types():
+    records = [
+        type_record(LF_STRUCTURE, struct.pack('<HHIII', 2, 0, 0x1004, 0, 0) + struct.pack('<H', 16) + b'point\0'),
+        type_record(LF_CLASS, struct.pack('<HHIII', 0, 0x80, 0, 0, 0) + struct.pack('<HI', 0x8004, 0x10000) + b'big\0'),
+        type_record(LF_UNION, struct.pack('<HHI', 1, 0, 0x1004) + struct.pack('<H', 8) + b'u\0'),
+        type_record(LF_ENUM, struct.pack('<HHII', 3, 0, 0x74, 0x1004) + b'color\0'),
+        type_record(LF_ARRAY, struct.pack('<II', 0x74, 0x23) + struct.pack('<H', 40) + b'\0'),
+        ]
+    b = PdbBuilder()
+    b.tpi = type_stream(records)
+    types = parse_pdb(b.build()).get_type_stream()
+
+    r = types.get(0x1000)
+    assert (r.kind, r.name, r.size, r.data.count, r.data.field) == (LF_STRUCTURE, 'point', 16, 2, 0x1004)
+    r = types.get(0x1001)
+    assert (r.kind, r.name, r.size, r.data.property) == (LF_CLASS, 'big', 0x10000, 0x80)
+    r = types.get(0x1002)
+    assert (r.kind, r.name, r.size) == (LF_UNION, 'u', 8)
+    r = types.get(0x1003)
+    assert (r.kind, r.name, r.size, r.data.utype, r.data.field) == (LF_ENUM, 'color', None, 0x74, 0x1004)
+    r = types.get(0x1004)
+    assert (r.kind, r.name, r.size, r.data.elemtype, r.data.idxtype) == (LF_ARRAY, '', 40, 0x74, 0x23)
+
+def test_type_streams_missing():
+    pdb = parse_pdb(msf([b'', b'', b'']))
+    assert pdb.get_type_stream() is None
+    assert pdb.get_id_stream() is None
+
+def test_stream_cache():
+    cache = StreamCache()
+    pdb = parse_pdb(rope(PdbBuilder().build()), cache=cache)
+    info = pdb.get_stream(1)
+    assert cache.size == len(info)
+    assert bytes(pdb.get_stream(1)) == bytes(info)
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    pdb2 = parse_pdb(rope(PdbBuilder().build()), cache=cache)
+    pdb2.get_stream(1)
+    assert cache.size == 2 * len(info)
+    del pdb2
+    assert cache.size == len(info)
+
+def test_stream_cache_eviction():
+    cache = StreamCache(max_bytes=100, pin_max_bytes=0)
+    pdb = parse_pdb(rope(PdbBuilder().build()), cache=cache)
+    assert len(pdb.get_stream(1)) <= 100 and len(pdb.get_stream(6)) <= 100
+    assert cache.evictions == 1
+    assert cache.size <= 100
+
+def test_stream_larger_than_cache_is_not_copied():
+    cache = StreamCache(max_bytes=16, pin_max_bytes=0)
+    b = PdbBuilder()
+    b.add_public('main', 1, 0x100)
+    blob = b.build()
+    pdb = parse_pdb(rope(blob), cache=cache)
+
+    dbi = pdb.get_stream(3)
+    assert len(dbi) > 16
+    assert (cache.size, cache.misses) == (0, 0)
+    assert bytes(dbi) == bytes(parse_pdb(blob).get_stream(3))
+    assert pdb.find_public_by_rva(0x1100)[0].name == 'main'
+    assert cache.size <= 16
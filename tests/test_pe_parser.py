@@ -0,0 +1,51 @@
+import pytest
+from pe_tools.pe_parser import parse_pe
+from pe_tools.rsrc import KnownResourceTypes
+from pe_builder import build_pe_with_resources, version_info
+
+RT_VERSION = KnownResourceTypes.RT_VERSION
+
+@pytest.mark.parametrize('name', [1, 102, 'VERSION'])
+def test_version_resource_name(name):
+    pe = parse_pe(build_pe_with_resources({RT_VERSION: {name: {0x409: version_info((1, 2, 3, 4))}}}))
+    assert pe.get_file_version() == (1, 2, 3, 4)
+    assert pe.get_product_version() == (1, 2, 3, 4)
+    assert pe.get_version_info().string_file_info()[(0x409, 1200)]['ProductName'] == 'Test'
+
+def test_version_resource_first_entry():
+    pe = parse_pe(build_pe_with_resources({RT_VERSION: {
+        102: {0x409: version_info((1, 0, 0, 0))},
+        103: {0x409: version_info((2, 0, 0, 0))},
+        }}))
+    assert pe.get_file_version() == (1, 0, 0, 0)
+
+def test_version_resource_language():
+    pe = parse_pe(build_pe_with_resources({RT_VERSION: {7: {
+        0x405: version_info((5, 0, 0, 0)),
+        0x409: version_info((9, 0, 0, 0)),
+        }}}))
+    assert pe.get_file_version() == (9, 0, 0, 0)
+    assert pe.get_version_info(langs=(0x405,)).get_fixed_info().file_version_tuple == (5, 0, 0, 0)
+
+def test_no_version_resource():
+    pe = parse_pe(build_pe_with_resources({10: {1: {0: b'data'}}}))
+    assert pe.get_file_version() is None
+    assert pe.get_version_info() is None
+
+def test_links():
+    import dataclasses, uuid
+    import pe_tools
+    from pe_tools.pe_parser import CodeviewLink, PeIdent
+
+    assert dataclasses.is_dataclass(PeIdent) and dataclasses.is_dataclass(CodeviewLink)
+    assert pe_tools.PeIdent is PeIdent and pe_tools.CodeviewLink is CodeviewLink
+
+    ident = PeIdent.from_pelink('test.exe/5f5e10003000')
+    assert ident == PeIdent('test.exe', 0x5f5e1000, 0x3000)
+    assert str(ident) == 'test.exe/5f5e10003000'
+
+    guid = uuid.UUID('12345678-9abc-def0-1234-56789abcdef0')
+    link = CodeviewLink.from_bxlink(f'c:\\out\\test.pdb{{{guid}}}7')
+    assert link == CodeviewLink(guid, 7, 'c:\\out\\test.pdb')
+    assert link.short_filename == 'test.pdb'
+    assert str(link) == f'c:\\out\\test.pdb{{{guid}}}7'
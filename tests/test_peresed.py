@@ -0,0 +1,28 @@
+import os
+import pytest
+from pe_tools import peresed
+from pe_tools.pe_parser import parse_pe
+from pe_tools.rsrc import KnownResourceTypes
+from pe_builder import build_pe_with_resources, version_info
+
+RT_RCDATA = KnownResourceTypes.RT_RCDATA
+RT_VERSION = KnownResourceTypes.RT_VERSION
+
+def _open_fds():
+    return len(os.listdir('/proc/self/fd'))
+
+@pytest.mark.skipif(not os.path.isdir('/proc/self/fd'), reason='needs /proc/self/fd')
+def test_set_resource_closes_files(tmp_path):
+    exe = tmp_path / 'in.exe'
+    exe.write_bytes(build_pe_with_resources({RT_VERSION: {1: {0x409: version_info()}}}))
+    payload = tmp_path / 'payload.bin'
+    payload.write_bytes(b'payload')
+    out = tmp_path / 'out.exe'
+
+    args = peresed._make_parser().parse_args(['-R', 'RT_RCDATA', '#5', '0', str(payload), '-o', str(out), str(exe)])
+    fds = _open_fds()
+    assert peresed._run(args) == 0
+    assert _open_fds() == fds
+
+    pe = parse_pe(out.read_bytes())
+    assert bytes(pe.parse_resources()[RT_RCDATA][5][0]) == b'payload'
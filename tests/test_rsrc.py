@@ -0,0 +1,238 @@
+import mmap, pytest, struct
+from grope import rope
+from pe_tools.rsrc import (KnownResourceTypes, iter_prelink_resources, parse_pe_resources, parse_pe_resources_layout,
+    parse_prelink_resources, pe_resources_prepack, PrepackCache)
+
+RT_ICON = KnownResourceTypes.RT_ICON
+RT_RCDATA = KnownResourceTypes.RT_RCDATA
+
+BASE = 0x3000
+
+def _tree():
+    return {
+        RT_ICON: {1: {0: b'icon' * 10}},
+        RT_RCDATA: {
+            'DATA': {0x409: b'payload-0123456789', 0x405: b'x'},
+            7: {0: b'seven' * 3},
+            },
+        }
+
+def _section(tree):
+    return bytes(pe_resources_prepack(tree).pack(BASE))
+
+def _to_bytes(node):
+    if isinstance(node, dict):
+        return {k: _to_bytes(v) for k, v in node.items()}
+    return bytes(node)
+
+def _entries(layout):
+    return {path: (entry.DataRva, entry.Size) for path, entry in layout.iter_data_entries()}
+
+def test_update_unchanged():
+    blob = _section(_tree())
+    resources, layout = parse_pe_resources_layout(blob, BASE)
+    assert bytes(layout.update(resources)) == blob
+
+def test_update_in_place():
+    blob = _section(_tree())
+    resources, layout = parse_pe_resources_layout(blob, BASE)
+    resources[RT_RCDATA]['DATA'][0x409] = b'short'
+
+    updated = bytes(layout.update(resources))
+    assert len(updated) == len(blob)
+
+    expected = _tree()
+    expected[RT_RCDATA]['DATA'][0x409] = b'short'
+    assert _to_bytes(parse_pe_resources(updated, BASE)) == expected
+
+    new_resources, new_layout = parse_pe_resources_layout(updated, BASE)
+    old, new = _entries(layout), _entries(new_layout)
+    path = (RT_RCDATA, 'DATA', 0x409)
+    assert new[path] == (old[path][0], 5)
+    assert {k: v for k, v in new.items() if k != path} == {k: v for k, v in old.items() if k != path}
+
+def test_update_grow_relocates():
+    blob = _section(_tree())
+    resources, layout = parse_pe_resources_layout(blob, BASE)
+    big = bytes(range(256)) * 4
+    resources[RT_ICON][1][0] = big
+
+    updated = bytes(layout.update(resources))
+    assert len(updated) > len(blob)
+    assert updated[:len(blob) - 0x100].count(big) == 0
+
+    expected = _tree()
+    expected[RT_ICON][1][0] = big
+    assert _to_bytes(parse_pe_resources(updated, BASE)) == expected
+
+    _, new_layout = parse_pe_resources_layout(updated, BASE)
+    rva, size = _entries(new_layout)[(RT_ICON, 1, 0)]
+    assert rva >= BASE + len(blob) and rva % 8 == 0 and size == len(big)
+
+    # The updated section can be updated again.
+    resources, layout = parse_pe_resources_layout(updated, BASE)
+    resources[RT_RCDATA][7][0] = b'again'
+    expected[RT_RCDATA][7][0] = b'again'
+    assert _to_bytes(parse_pe_resources(bytes(layout.update(resources)), BASE)) == expected
+
+def test_update_shared_payload():
+    # A payload shared by two entries is not overwritten in place.
+    blob = bytearray(_section({RT_RCDATA: {1: {0: b'shared-data'}, 2: {0: b'unused-data'}}}))
+    _, layout = parse_pe_resources_layout(bytes(blob), BASE)
+    entries = _entries(layout)
+    entry_offs, _, _ = layout._leaves[(RT_RCDATA, 2, 0)]
+    struct.pack_into('<I', blob, entry_offs, entries[(RT_RCDATA, 1, 0)][0])
+
+    resources, layout = parse_pe_resources_layout(bytes(blob), BASE)
+    assert _to_bytes(resources) == {RT_RCDATA: {1: {0: b'shared-data'}, 2: {0: b'shared-data'}}}
+    resources[RT_RCDATA][1][0] = b'other'
+
+    updated = bytes(layout.update(resources))
+    assert _to_bytes(parse_pe_resources(updated, BASE)) == {RT_RCDATA: {1: {0: b'other'}, 2: {0: b'shared-data'}}}
+
+@pytest.mark.parametrize('edit', ['add', 'remove'])
+def test_update_changed_structure(edit):
+    resources, layout = parse_pe_resources_layout(_section(_tree()), BASE)
+    if edit == 'add':
+        resources[RT_RCDATA][7][0x409] = b'new'
+    else:
+        del resources[RT_RCDATA]['DATA'][0x405]
+    assert layout.update(resources) is None
+
+def _res_name(name):
+    if isinstance(name, int):
+        return struct.pack('<HH', 0xffff, name)
+    return name.encode('utf-16le') + b'\0\0'
+
+def _res_entry(type, name, lang, data):
+    names = _res_name(type) + _res_name(name)
+    names += b'\0' * (-len(names) % 4)
+    hdr = names + struct.pack('<IHHII', 0, 0x30, lang, 0, 0)
+    r = struct.pack('<II', len(data), 8 + len(hdr)) + hdr + data
+    return r + b'\0' * (-len(r) % 4)
+
+_RES_ENTRIES = [
+    (0, 0, 0, b''),
+    (RT_ICON, 1, 0x409, b'icon-data-'),
+    (RT_RCDATA, 'ODD', 0, b'x'),
+    (RT_RCDATA, 'EVEN', 0x405, b'12345678'),
+    ('CUSTOM', 7, 0, b'custom'),
+    (RT_ICON, 1, 0x405, b''),
+    ]
+
+def _res_file(entries=_RES_ENTRIES):
+    return b''.join(_res_entry(*entry) for entry in entries)
+
+def _eager_parse(blob):
+    # The resources of a .res file, parsed by slicing off one entry at
+    # a time like parse_prelink_resources used to.
+    r = {}
+    while blob:
+        data_size, hdr_size = struct.unpack_from('<II', blob)
+        names = blob[8:hdr_size]
+        values = []
+        for _ in range(2):
+            if names[:2] == b'\xff\xff':
+                values.append(struct.unpack_from('<H', names, 2)[0])
+                names = names[4:]
+            else:
+                end = next(i for i in range(0, len(names), 2) if names[i:i + 2] == b'\0\0')
+                values.append(names[:end].decode('utf-16le'))
+                names = names[end + 2:]
+        lang, = struct.unpack_from('<H', blob, hdr_size - 10)
+        r.setdefault(values[0], {}).setdefault(values[1], {})[lang] = blob[hdr_size:hdr_size + data_size]
+        blob = blob[(hdr_size + data_size + 3) // 4 * 4:]
+    r.pop(0, None)
+    return r
+
+def test_iter_prelink_resources():
+    entries = [(type, name, lang, bytes(data)) for type, name, lang, _, data in iter_prelink_resources(_res_file())]
+    assert entries == _RES_ENTRIES
+
+@pytest.mark.parametrize('wrap', [bytes, bytearray, rope])
+def test_parse_prelink_resources(wrap):
+    blob = _res_file()
+    r = parse_prelink_resources(wrap(blob))
+    assert _to_bytes(r) == _eager_parse(blob)
+    assert _to_bytes(r) == {
+        RT_ICON: {1: {0x409: b'icon-data-', 0x405: b''}},
+        RT_RCDATA: {'ODD': {0: b'x'}, 'EVEN': {0x405: b'12345678'}},
+        'CUSTOM': {7: {0: b'custom'}},
+        }
+
+def test_parse_prelink_resources_mmap(tmp_path):
+    fname = tmp_path / 'test.res'
+    fname.write_bytes(_res_file())
+    with open(fname, 'rb') as fin:
+        m = mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ)
+    r = parse_prelink_resources(m)
+    assert isinstance(r[RT_RCDATA]['EVEN'][0x405], memoryview)
+    assert _to_bytes(r) == _eager_parse(_res_file())
+
+def test_parse_prelink_resources_unpadded_tail():
+    # The last entry need not be padded to a multiple of 4 bytes.
+    blob = _res_file(_RES_ENTRIES[:3])
+    blob = blob[:len(blob) - 3]
+    assert _to_bytes(parse_prelink_resources(blob))[RT_RCDATA]['ODD'][0] == b'x'
+
+@pytest.mark.parametrize('blob', [
+    _res_file()[:-2],
+    _res_file() + b'\0\0\0\0',
+    _res_entry(RT_ICON, 1, 0, b'data')[:-2],
+    struct.pack('<II', 0, 4),
+    ], ids=['truncated-entry', 'partial-header', 'truncated-data', 'corrupted-header'])
+def test_parse_prelink_resources_errors(blob):
+    with pytest.raises(RuntimeError):
+        parse_prelink_resources(blob)
+
+def _packed(prepacked):
+    return bytes(prepacked.pack(BASE))
+
+def test_prepack_cache_shape_key():
+    cache = PrepackCache()
+    assert _packed(cache.prepack(_tree())) == _section(_tree())
+    assert (cache.hits, cache.misses) == (0, 1)
+
+    # Same shape, other payloads of the same sizes.
+    tree = _tree()
+    tree[RT_RCDATA][7][0] = b'SEVEN' * 3
+    assert _packed(cache.prepack(tree)) == _section(tree)
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    # Names, ids and languages are part of the shape.
+    for edit in [
+            lambda tree: tree[RT_RCDATA].update({'DATB': tree[RT_RCDATA].pop('DATA')}),
+            lambda tree: tree[RT_RCDATA].update({'7': tree[RT_RCDATA].pop(7)}),
+            lambda tree: tree[RT_RCDATA][7].update({0x409: tree[RT_RCDATA][7].pop(0)}),
+            lambda tree: tree[RT_RCDATA][7].update({0x409: b'added'}),
+            ]:
+        tree = _tree()
+        edit(tree)
+        misses = cache.misses
+        assert _packed(cache.prepack(tree)) == _section(tree)
+        assert cache.misses == misses + 1
+
+def test_prepack_cache_payload_sizes():
+    cache = PrepackCache()
+    cache.prepack(_tree())
+    for size in [0, 1, 7, 8, 9, 1000]:
+        tree = _tree()
+        tree[RT_ICON][1][0] = b'i' * size
+        assert _packed(cache.prepack(tree)) == _section(tree)
+        assert _to_bytes(parse_pe_resources(_packed(cache.prepack(tree)), BASE)) == tree
+    assert cache.misses == 1
+
+def test_prepack_cache_lru():
+    cache = PrepackCache(max_entries=2)
+    trees = [{RT_RCDATA: {id: {0: b'data'}}} for id in range(3)]
+    cache.prepack(trees[0])
+    cache.prepack(trees[1])
+    cache.prepack(trees[0])
+    cache.prepack(trees[2])
+    assert (cache.hits, cache.misses) == (1, 3)
+
+    # trees[1] was the least recently used.
+    cache.prepack(trees[0])
+    assert (cache.hits, cache.misses) == (2, 3)
+    cache.prepack(trees[1])
+    assert (cache.hits, cache.misses) == (2, 4)
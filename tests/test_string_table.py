@@ -0,0 +1,83 @@
+import pytest, struct
+from pe_tools.string_table import (MESSAGE_RESOURCE_ANSI, MESSAGE_RESOURCE_UNICODE, MESSAGE_RESOURCE_UTF8,
+    MessageTable, StringTable, ansi_codepage)
+
+def _bundle(strings):
+    strings = list(strings)
+    strings += [''] * (16 - len(strings))
+    return b''.join(struct.pack('<H', len(s)) + s.encode('utf-16le') for s in strings)
+
+def _string_table():
+    return StringTable({
+        1: {0x409: _bundle(f'en{id}' for id in range(16))},
+        2: {0x409: _bundle(['en16', '', 'en18']), 0x405: _bundle(['cs16'])},
+        'NAMED': {0x409: _bundle(['ignored'])},
+        })
+
+def test_string_bundles():
+    table = _string_table()
+    assert table.get(0) == 'en0'
+    assert table.get(15) == 'en15'
+    assert table.get(16) == 'en16'
+    assert table.get(18) == 'en18'
+    # Empty strings and missing bundles do not exist.
+    assert table.get(17) is None
+    assert table.get(19) is None
+    assert table.get(32) is None
+    assert sorted(table.languages()) == [0x405, 0x409]
+
+def test_string_languages():
+    table = _string_table()
+    assert table.get(16, langs=(0x405,)) == 'cs16'
+    assert table.get(16, langs=(0x407,)) == 'en16'
+    assert table.get(0, langs=(0x405,)) == 'en0'
+
+def _message_entry(flags, text):
+    data = text + b'\0' * (4 - len(text) % 4)
+    return struct.pack('<HH', 4 + len(data), flags) + data
+
+def _message_table(blocks):
+    hdr_size = 4 + 12 * len(blocks)
+    headers = []
+    entries = b''
+    for low_id, messages in blocks:
+        headers.append(struct.pack('<III', low_id, low_id + len(messages) - 1, hdr_size + len(entries)))
+        entries += b''.join(_message_entry(flags, text) for flags, text in messages)
+    return struct.pack('<I', len(blocks)) + b''.join(headers) + entries
+
+_MESSAGES = [
+    (0x10, [
+        (MESSAGE_RESOURCE_UNICODE, 'Unicode €\r\n'.encode('utf-16le')),
+        (MESSAGE_RESOURCE_ANSI, b'ANSI \x80\xe9\r\n'),
+        (MESSAGE_RESOURCE_UTF8, 'UTF-8 €'.encode('utf-8')),
+        ]),
+    (0x100, [(MESSAGE_RESOURCE_ANSI, b'second block')]),
+    ]
+
+def test_message_table():
+    table = MessageTable({1: {0x409: _message_table(_MESSAGES)}})
+    assert table.get(0x10) == 'Unicode €\r\n'
+    assert table.get(0x11) == 'ANSI €\xe9\r\n'
+    assert table.get(0x12) == 'UTF-8 €'
+    assert table.get(0x100) == 'second block'
+    assert table.get(0xf) is None
+    assert table.get(0x13) is None
+    assert table.get(0x101) is None
+
+def test_message_table_codepage():
+    blob = _message_table([(1, [(MESSAGE_RESOURCE_ANSI, b'\xcf\xf0\xe8\xe2\xe5\xf2')])])
+    table = MessageTable({1: {0x419: blob, 0x409: blob}})
+    assert table.get(1, langs=(0x419,)) == 'Привет'
+    assert table.get(1, langs=(0x409,)) == '\xcf\xf0\xe8\xe2\xe5\xf2'
+
+@pytest.mark.parametrize('lang, codepage', [
+    (0x0409, 1252), (0x0000, 1252), (0x0419, 1251), (0x0405, 1250), (0x0411, 932),
+    (0x0804, 936), (0x0404, 950), (0x081a, 1250), (0x0c1a, 1251), (0x041f, 1254),
+    ])
+def test_ansi_codepage(lang, codepage):
+    assert ansi_codepage(lang) == codepage
+
+def test_message_table_corrupted():
+    blob = struct.pack('<IIII', 1, 1, 1, 16) + struct.pack('<HH', 2, 0)
+    with pytest.raises(RuntimeError):
+        MessageTable({1: {0x409: blob}}).get(1)
@@ -0,0 +1,72 @@
+import pytest, struct
+from grope import rope
+from pe_tools.strings import find_bytes, find_utf16_nul, read_utf16_prefixed, read_utf16z, read_utf8z
+
+_WRAPPERS = [bytes, memoryview, rope]
+
+@pytest.mark.parametrize('wrap', _WRAPPERS)
+def test_find_bytes(wrap):
+    blob = b'a' * 1000 + b'needle' + b'b' * 10
+    assert find_bytes(wrap(blob), b'needle', 0, len(blob)) == 1000
+    assert find_bytes(wrap(blob), b'needle', 1001, len(blob)) == -1
+    assert find_bytes(wrap(blob), b'needle', 0, 1005) == -1
+    assert find_bytes(wrap(blob), b'b', 500, len(blob)) == 1006
+
+@pytest.mark.parametrize('wrap', _WRAPPERS)
+def test_read_utf8z(wrap):
+    blob = b'xx' + 'h\xe9llo'.encode('utf-8') + b'\0rest\0'
+    assert read_utf8z(wrap(blob), 2) == ('h\xe9llo', 9)
+    assert read_utf8z(wrap(blob), 9) == ('rest', 14)
+    assert read_utf8z(wrap(blob), 8) == ('', 9)
+
+@pytest.mark.parametrize('wrap', _WRAPPERS)
+def test_read_utf8z_unterminated(wrap):
+    with pytest.raises(RuntimeError):
+        read_utf8z(wrap(b'abc'), 0)
+    # The terminator must come before `end`.
+    with pytest.raises(RuntimeError):
+        read_utf8z(wrap(b'abc\0'), 0, 3)
+
+@pytest.mark.parametrize('wrap', _WRAPPERS)
+def test_read_utf16z(wrap):
+    blob = 'ab'.encode('utf-16le') + b'\0\0'
+    assert read_utf16z(wrap(blob), 0) == ('ab', 6)
+    # A NUL pair that straddles two characters is not a terminator.
+    blob = b'\x00\x41\x00\x00\x00\x00'
+    assert find_utf16_nul(blob, 0) == 2
+    assert find_utf16_nul(blob, 1) == 3
+    with pytest.raises(RuntimeError):
+        read_utf16z(wrap(b'a\0b'), 0)
+    # An odd-length range cannot hold the terminator of its last character.
+    with pytest.raises(RuntimeError):
+        read_utf16z(wrap(b'a\0\0\0'), 0, 3)
+
+@pytest.mark.parametrize('wrap', _WRAPPERS)
+def test_read_utf16_prefixed(wrap):
+    blob = struct.pack('<H', 3) + 'abc'.encode('utf-16le') + b'tail'
+    assert read_utf16_prefixed(wrap(blob), 0) == ('abc', 8)
+    assert read_utf16_prefixed(wrap(struct.pack('<H', 0)), 0) == ('', 2)
+
+@pytest.mark.parametrize('blob', [
+    struct.pack('<H', 3) + 'ab'.encode('utf-16le'),
+    struct.pack('<H', 2) + b'abc',
+    ], ids=['truncated', 'odd-length'])
+def test_read_utf16_prefixed_outside(blob):
+    with pytest.raises(RuntimeError):
+        read_utf16_prefixed(blob, 0)
+
+def test_intern():
+    blob = b'\0'.join([b'name', b'name', b''])
+    first, offs = read_utf8z(blob, 0, intern=True)
+    second, _ = read_utf8z(blob, offs, intern=True)
+    assert first == 'name' and first is second
+
+    blob = (struct.pack('<H', 4) + 'name'.encode('utf-16le')) * 2
+    first, offs = read_utf16_prefixed(blob, 0, intern=True)
+    second, _ = read_utf16_prefixed(blob, offs, intern=True)
+    assert first == 'name' and first is second
+
+    blob = 'name\0name\0'.encode('utf-16le')
+    first, offs = read_utf16z(blob, 0, intern=True)
+    second, _ = read_utf16z(blob, offs, intern=True)
+    assert first is second
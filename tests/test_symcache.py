@@ -0,0 +1,46 @@
+import uuid
+from pe_tools.pdb import parse_pdb
+from pe_tools.symcache import export_symbol_cache, find_symbol_cache, open_symbol_cache, symbol_cache_path
+from pe_tools.pe_parser import CodeviewLink
+from pdb_builder import PdbBuilder
+
+def _pdb(guid):
+    b = PdbBuilder(guid=guid, age=7)
+    b.add_public('main', 1, 0x100)
+    b.add_public('g_data', 2, 0x10)
+    b.add_public('absolute', 0, 0x1234)
+    b.add_public('unmapped', 9, 0x10)
+    return parse_pdb(b.build())
+
+def test_export_and_open(tmp_path):
+    guid = uuid.UUID('12345678-1234-5678-9abc-def012345678')
+    fname = symbol_cache_path(str(tmp_path), guid, 7)
+    export_symbol_cache(_pdb(guid), fname)
+
+    with open_symbol_cache(fname) as cache:
+        assert (cache.guid, cache.age, cache.machine) == (guid, 7, 0x8664)
+        assert len(cache) == 2
+        assert cache.find_by_rva(0x1104) == ('main', 4)
+        assert cache.find_by_rva(0x6010) == ('g_data', 0)
+        assert cache.find_by_rva(0xfff) is None
+
+def test_export_matches_symbolize(tmp_path):
+    guid = uuid.UUID(int=0x41)
+    pdb = _pdb(guid)
+    fname = symbol_cache_path(str(tmp_path), guid, 7)
+    export_symbol_cache(pdb, fname)
+
+    rvas = [0, 0x10, 0x1000, 0x1100, 0x1234, 0x6010, 0x7000]
+    res = pdb.symbolize(rvas)
+    with open_symbol_cache(fname) as cache:
+        for rva, idx, disp in zip(rvas, res.indices, res.displacements):
+            expected = None if idx < 0 else (res.names[int(idx)], int(disp))
+            assert cache.find_by_rva(rva) == expected
+
+def test_find_symbol_cache(tmp_path):
+    guid = uuid.UUID(int=0x42)
+    export_symbol_cache(_pdb(guid), symbol_cache_path(str(tmp_path), guid, 7))
+
+    with find_symbol_cache(str(tmp_path), CodeviewLink(guid, 7, 'test.pdb')) as cache:
+        assert cache.get_name(0) == 'main'
+    assert find_symbol_cache(str(tmp_path), CodeviewLink(guid, 8, 'test.pdb')) is None
@@ -0,0 +1,119 @@
+import pytest, struct
+from pe_tools.version_info import VersionInfo, _VerNode, parse_fixed_file_info, parse_version_info
+from pe_builder import version_info
+
+def _pad(blob):
+    return blob + b'\0' * (-len(blob) % 4)
+
+def _node(key, value=None, children=()):
+    # A reference encoder: the header, the key and the value are each
+    # padded to 4 bytes, the length of a node excludes the padding
+    # after its last child.
+    if value is None:
+        value_bytes, value_length, type = b'', 0, 1
+    elif isinstance(value, str):
+        value_bytes = value.encode('utf-16le') + b'\0\0'
+        value_length, type = len(value_bytes) // 2, 1
+    else:
+        value_bytes, value_length, type = value, len(value), 0
+
+    body = _pad(struct.pack('<HHH', 0, value_length, type) + key.encode('utf-16le') + b'\0\0')
+    if children:
+        body = _pad(body + value_bytes) + b''.join(_pad(child) for child in children[:-1]) + children[-1]
+    else:
+        body += value_bytes
+    return struct.pack('<H', len(body)) + body[2:]
+
+def _tree(node):
+    value = node.value
+    if isinstance(value, memoryview):
+        value = bytes(value)
+    return node.name, value, [_tree(child) for child in node.children]
+
+def test_round_trip():
+    blob = version_info((1, 2, 3, 4), {'FileVersion': '1.2.3.4', 'Comments': '', 'X': 'odd'},
+        translations=((0x409, 1200), (0x405, 1250)))
+    vi = parse_version_info(blob)
+    assert vi.pack() == blob
+    assert vi.get_fixed_info().file_version_tuple == (1, 2, 3, 4)
+    assert parse_fixed_file_info(blob).file_version_tuple == (1, 2, 3, 4)
+    assert vi.string_file_info() == {
+        (0x409, 1200): {'Comments': '', 'FileVersion': '1.2.3.4', 'X': 'odd'},
+        (0x405, 1250): {'Comments': '', 'FileVersion': '1.2.3.4', 'X': 'odd'},
+        }
+    assert bytes(vi.get('VarFileInfo/Translation').value) == struct.pack('<HHHH', 0x409, 1200, 0x405, 1250)
+
+@pytest.mark.parametrize('key', ['', 'a', 'ab', 'abc', 'abcd'])
+@pytest.mark.parametrize('value', [None, '', 'v', 'vw', b'', b'\1', b'\1\2', b'\1\2\3', b'\1\2\3\4\5'])
+def test_padding(key, value):
+    # Keys and values of every length modulo 4, with siblings following them.
+    blob = _node('VS_VERSION_INFO', b'', [
+        _node(key, value),
+        _node(key, value, [_node(key, value), _node('last', value)]),
+        _node('tail', 'x'),
+        ])
+    vi = parse_version_info(blob)
+    assert _tree(vi._root) == ('VS_VERSION_INFO', b'', [
+        (key, value, []),
+        (key, value, [(key, value, []), ('last', value, [])]),
+        ('tail', 'x', []),
+        ])
+    assert vi.pack() == blob
+
+def test_deep_nesting():
+    # Nodes are parsed and packed without recursion.
+    blob = _node('leaf', 'value')
+    for depth in range(500):
+        blob = _node(f'level{depth}', None, [blob])
+    vi = parse_version_info(blob)
+    assert vi.pack() == blob
+    path = '/'.join(f'level{depth}' for depth in reversed(range(499))) + '/leaf'
+    assert vi.get(path).value == 'value'
+
+def test_nested_string_file_info():
+    strings = {f'Key{idx}': 'v' * idx for idx in range(40)}
+    translations = [(0x400 + idx, 1200) for idx in range(8)]
+    blob = version_info(strings=strings, translations=translations)
+    vi = parse_version_info(blob)
+    assert vi.string_file_info() == {tran: strings for tran in translations}
+
+    sfi = vi.string_file_info()
+    sfi[(0x401, 1200)]['Key3'] = 'changed'
+    del sfi[(0x402, 1200)]
+    vi.set_string_file_info(sfi)
+    assert parse_version_info(vi.pack()).string_file_info() == sfi
+
+def test_set_string_file_info_empty():
+    vi = parse_version_info(version_info())
+    vi.set_string_file_info({})
+    assert vi.get('StringFileInfo') is None
+    assert vi.get('VarFileInfo') is None
+    assert parse_version_info(vi.pack()).string_file_info() == {}
+
+def test_new_version_info():
+    vi = VersionInfo()
+    vi.set_string_file_info({(0x409, 1200): {'ProductName': 'New'}})
+    assert parse_version_info(vi.pack()).string_file_info() == {(0x409, 1200): {'ProductName': 'New'}}
+
+def test_find_index():
+    node = _VerNode('root', None, [_VerNode('a', 'first', []), _VerNode('a', 'second', [])])
+    assert node.find('a').value == 'first'
+
+    node.append(_VerNode('b', None, []))
+    assert node.find('b').name == 'b'
+
+    # Changes made through `children` are seen by `find`.
+    node.children.append(_VerNode('c', None, []))
+    assert node.find('c').name == 'c'
+    node.children.pop(0)
+    assert node.find('a').value == 'second'
+
+    node.remove(node.find('a'))
+    assert node.find('a') is None
+
+    node.children = [_VerNode('d', None, [])]
+    assert node.find('b') is None and node.find('d').name == 'd'
+
+def test_corrupted():
+    with pytest.raises(RuntimeError):
+        parse_version_info(_node('VS_VERSION_INFO', b'', [_node('s', 'x')])[:-2])